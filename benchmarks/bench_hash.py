@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+"""
+measure throughput of hash algorithms usable as HASH_ALGORITHM
+
+every algorithm digests random blocks of every given BLOCKSIZE, like
+BlockStorageClient does for every block, the running file hash of
+FileStorageClient doubles the hashing work per stored byte
+objects_per_gib shows the number of objects, and so requests, per GiB
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def throughput(hashfunc, data: bytes, total: int) -> float:
+    """return MB/s of hashing total bytes in blocks of data"""
+    rounds = max(total // len(data), 1)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        hashfunc(data).hexdigest()
+    return rounds * len(data) / (time.perf_counter() - start) / 1e6
+
+
+def main():
+    from webstorageS3.storageclient_s3 import HASH_ALGORITHMS
+
+    result = {}
+    for blocksize in args.blocksizes:
+        data = os.urandom(blocksize)
+        for name, hashfunc in HASH_ALGORITHMS.items():
+            result[f"{name}_{blocksize}"] = {
+                "hash": name,
+                "blocksize": blocksize,
+                "mb_per_s": max(throughput(hashfunc, data, args.total) for _ in range(args.repeat)),
+                "objects_per_gib": -(-(1 << 30) // blocksize),
+            }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for values in result.values():
+            logging.info(
+                f"{values['hash']:8} blocksize {values['blocksize']:>9}   {values['mb_per_s']:8.1f} MB/s   {values['objects_per_gib']:>6} objects/GiB"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="measure hash throughput")
+    parser.add_argument(
+        "--blocksizes",
+        type=int,
+        nargs="+",
+        default=[262144, 1048576, 4194304, 16777216],
+        help="block sizes in bytes to measure",
+    )
+    parser.add_argument(
+        "--total",
+        type=int,
+        default=256 * 1024 * 1024,
+        help="bytes to hash per algorithm and blocksize",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="number of measurements, best is shown"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="output machine readable json"
+    )
+    args = parser.parse_args()
+    main()
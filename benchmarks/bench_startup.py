@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+measure startup time of webstorageS3 clients
+
+every sample runs in a fresh python process, like a short invocation of
+wstar.py or bstool.py, and measures
+  import      import webstorageS3
+  construct   WebStorageArchiveClient and FileStorageClient, like wstar does
+  first_use   first lookup in blockstorage cache, loads the checksum cache
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+SAMPLE = """
+import json, sys, time
+t_0 = time.perf_counter()
+import webstorageS3
+t_1 = time.perf_counter()
+wsa = webstorageS3.WebStorageArchiveClient(homepath=sys.argv[1], s3_backend=sys.argv[2])
+fs = webstorageS3.FileStorageClient(homepath=sys.argv[1], s3_backend=sys.argv[2])
+t_2 = time.perf_counter()
+"0" * 40 in fs.blockstorage.cache
+t_3 = time.perf_counter()
+print(json.dumps({"import": t_1 - t_0, "construct": t_2 - t_1, "first_use": t_3 - t_2}))
+"""
+
+
+def sample(homepath: str, backend: str) -> dict:
+    """run one fresh process and return measured durations in seconds"""
+    env = dict(os.environ)
+    paths = [path for path in env.get("PYTHONPATH", "").split(os.pathsep) if path]
+    env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] + paths)
+    result = subprocess.run(
+        [sys.executable, "-c", SAMPLE, homepath, backend],
+        check=True,
+        capture_output=True,
+        env=env,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    samples = [sample(args.homepath, args.backend) for _ in range(args.repeat)]
+    result = {}
+    for phase in ("import", "construct", "first_use"):
+        values = [entry[phase] for entry in samples]
+        result[phase] = {
+            "min_ms": min(values) * 1000,
+            "median_ms": statistics.median(values) * 1000,
+        }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for phase, values in result.items():
+            logging.info(
+                f"{phase:10} min {values['min_ms']:8.1f} ms   median {values['median_ms']:8.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    from webstorageS3 import HOMEPATH
+
+    parser = argparse.ArgumentParser(description="measure startup time of clients")
+    parser.add_argument(
+        "--homepath", default=HOMEPATH, help="path to config directory"
+    )
+    parser.add_argument(
+        "--backend", default="DEFAULT", help="backend configuration profile to use"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="number of fresh processes to measure"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="output machine readable json"
+    )
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+"""
+micro benchmarks of the storage hot paths, offline with the memory backend
+
+  hash          MB/s of every hash algorithm on blocks of blocksize
+  block         microseconds per BlockStorageClient.put and get, per block size
+  file          MiB/s of FileStorageClient.put of new and of known data, and read
+  checksums     load time and membership cost of sqlite and mmap checksum caches
+  archive       seconds to save and read a wstar archive of many files
+
+nothing leaves the process, objects are held in memory, caches are
+written to a temporary directory; --json prints results to compare
+releases, e.g. saved per version and diffed
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+"""
+BENCHMARKS = ("hash", "block", "file", "checksums", "archive")
+
+
+def timed(function, *arguments) -> float:
+    """return wall clock seconds of one call"""
+    start = time.perf_counter()
+    function(*arguments)
+    return time.perf_counter() - start
+
+
+def random_checksums(count: int, width: int = 20) -> list:
+    data = os.urandom(count * width)
+    return [data[offset:offset + width].hex() for offset in range(0, len(data), width)]
+
+
+def bench_hash(homepath: str) -> dict:
+    from webstorageS3 import storageclient_s3
+
+    data = os.urandom(storageclient_s3.DEFAULT_BLOCKSIZE)
+    rounds = max(args.file_size // len(data), 1)
+    result = {}
+    for name, hashfunc in storageclient_s3.HASH_ALGORITHMS.items():
+        seconds = min(timed(lambda: [hashfunc(data).digest() for _ in range(rounds)]) for _ in range(args.repeat))
+        result[name] = {"mb_per_s": rounds * len(data) / seconds / 1e6}
+    return result
+
+
+def bench_block(homepath: str) -> dict:
+    from webstorageS3 import BlockStorageClient
+
+    client = BlockStorageClient(homepath=homepath, cache=False)
+    result = {}
+    for size in args.block_sizes:
+        blocks = [os.urandom(size) for _ in range(args.ops)]
+        checksums = []
+        put = min(timed(lambda: checksums.extend(client.put(data)[0] for data in blocks)) for _ in range(args.repeat))
+        get = min(timed(lambda: [client.get(checksum) for checksum in checksums[:args.ops]]) for _ in range(args.repeat))
+        result[str(size)] = {"put_us": put / args.ops * 1e6, "get_us": get / args.ops * 1e6}
+    client.close()
+    return result
+
+
+def bench_file(homepath: str) -> dict:
+    from webstorageS3 import FileStorageClient
+
+    client = FileStorageClient(homepath=homepath, cache=False)
+    data = os.urandom(args.file_size)
+    mib = len(data) / (1 << 20)
+    new = timed(client.put, io.BytesIO(data))
+    known = min(timed(client.put, io.BytesIO(data)) for _ in range(args.repeat))
+    checksum = client.put(io.BytesIO(data))["checksum"]
+    read = min(timed(lambda: [None for _ in client.read(checksum)]) for _ in range(args.repeat))
+    client.close()
+    return {
+        "put_new_mib_per_s": mib / new,
+        "put_known_mib_per_s": mib / known,
+        "read_mib_per_s": mib / read,
+    }
+
+
+def bench_checksums(homepath: str) -> dict:
+    from webstorageS3.checksums import Checksums
+    from webstorageS3.mmap_checksums import MmapChecksums
+
+    result = {}
+    for entries in args.entries:
+        for name in ("sqlite", "mmap"):
+            basename = os.path.join(homepath, f"bench_{name}_{entries}")
+            if name == "sqlite":
+                create = lambda: Checksums(f"{basename}.db")  # noqa: E731
+            else:
+                create = lambda: MmapChecksums(basename)  # noqa: E731
+            cache = create()
+            known = []
+            start = time.perf_counter()
+            for offset in range(0, entries, 100000):
+                batch = random_checksums(min(100000, entries - offset))
+                cache.update(batch)
+                known.extend(random.sample(batch, min(len(batch), 1000)))
+            if name == "mmap":
+                cache.merge()
+            cache.close()
+            build = time.perf_counter() - start
+            cache = create()
+            load = timed(cache.__contains__, "0" * 40)  # first lookup loads cache
+            unknown = random_checksums(len(known))
+            hit = timed(lambda: [checksum in cache for checksum in known])
+            miss = timed(lambda: [checksum in cache for checksum in unknown])
+            many = timed(cache.contains_many, known + unknown)
+            cache.close()
+            result[f"{name}_{entries}"] = {
+                "build_s": build,
+                "load_ms": load * 1000,
+                "hit_us": hit / len(known) * 1e6,
+                "miss_us": miss / len(unknown) * 1e6,
+                "contains_many_us": many / (2 * len(known)) * 1e6,
+            }
+    return result
+
+
+def bench_archive(homepath: str) -> dict:
+    from webstorageS3 import WebStorageArchiveClient
+
+    client = WebStorageArchiveClient(homepath=homepath)
+    checksums = random_checksums(args.archive_files)
+    data = {
+        "path": "/bench",
+        "filedata": {
+            f"/bench/dir{number // 100}/file{number}": {
+                "checksum": checksum,
+                "stat": (1.7e9, 1.7e9, 1.7e9, 1000, 1000, 33188, number),
+            }
+            for number, checksum in enumerate(checksums)
+        },
+        "blacklist": None,
+        "starttime": time.time(),
+        "stoptime": time.time(),
+        "hostname": "bench",
+        "tag": "bench",
+        "datetime": "2024-01-01T00:00:00.000000",
+    }
+    save = timed(client.save, data)
+    key = client.get_key(data)
+    read = min(timed(client.read, key) for _ in range(args.repeat))
+    return {
+        "files": args.archive_files,
+        "save_s": save,
+        "read_s": read,
+        "compressed_bytes": client.head(key)["ContentLength"],
+    }
+
+
+def main():
+    homepath = tempfile.mkdtemp(prefix="webstorage_bench_")
+    try:
+        with open(os.path.join(homepath, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+            outfile.write(CONFIG)
+        result = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        }
+        for name in args.benchmarks:
+            logging.debug(f"running {name}")
+            result[name] = globals()[f"bench_{name}"](homepath)
+    finally:
+        shutil.rmtree(homepath)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for name in args.benchmarks:
+            for case, values in result[name].items():
+                if isinstance(values, dict):
+                    logging.info(f"{name:10} {case:16} " + "   ".join(f"{key} {value:.2f}" for key, value in values.items()))
+                else:
+                    logging.info(f"{name:10} {case:16} {values:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="micro benchmarks of storage hot paths")
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        default=list(BENCHMARKS),
+        help=f"benchmarks to run, of {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument(
+        "--block-sizes",
+        type=int,
+        nargs="+",
+        default=[4096, 65536, 1048576],
+        help="block sizes in bytes for block benchmark",
+    )
+    parser.add_argument(
+        "--ops", type=int, default=1000, help="operations per block size"
+    )
+    parser.add_argument(
+        "--file-size",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="bytes of file for file and hash benchmark",
+    )
+    parser.add_argument(
+        "--entries",
+        type=int,
+        nargs="+",
+        default=[1000000],
+        help="number of cached checksums, e.g. 1000000 10000000",
+    )
+    parser.add_argument(
+        "--archive-files",
+        type=int,
+        default=100000,
+        help="number of files in archive benchmark",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="number of measurements, best is shown"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="output machine readable json"
+    )
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}, use {', '.join(BENCHMARKS)}")
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+measure per block cost of uploading and downloading block sized objects
+
+compares for every object size
+  transfer    upload_fileobj / download_fileobj with BytesIO, the former path
+  direct      put_object / get_object used by StorageClient for small objects
+
+cpu is process time of all threads, latency is wall clock time per block
+objects are written to the blockstorage bucket of the given backend under
+keys starting with bench/ and deleted afterwards
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from io import BytesIO
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def transfer_put(client, key, data):
+    client._backend.client.upload_fileobj(BytesIO(data), client._bucket_name, key)
+
+
+def transfer_get(client, key):
+    b_buffer = BytesIO()
+    client._backend.client.download_fileobj(client._bucket_name, key, b_buffer)
+    b_buffer.seek(0)
+    return b_buffer.read()
+
+
+def direct_put(client, key, data):
+    client._put_object(key, data)
+
+
+def direct_get(client, key):
+    return client._get_object(key)
+
+
+PATHS = {
+    "transfer": (transfer_put, transfer_get),
+    "direct": (direct_put, direct_get),
+}
+
+
+def measure(function, *arguments) -> tuple:
+    """return cpu and wall clock seconds of one call"""
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    function(*arguments)
+    return time.process_time() - cpu, time.perf_counter() - wall
+
+
+def summary(samples: list) -> dict:
+    cpu = [sample[0] * 1000 for sample in samples]
+    wall = [sample[1] * 1000 for sample in samples]
+    return {
+        "cpu_ms": statistics.median(cpu),
+        "latency_ms": statistics.median(wall),
+        "latency_min_ms": min(wall),
+    }
+
+
+def main():
+    from webstorageS3 import BlockStorageClient
+
+    client = BlockStorageClient(
+        homepath=args.homepath, cache=False, s3_backend=args.backend
+    )
+    result = {}
+    for size in args.sizes:
+        data = os.urandom(size)
+        for name, (put, get) in PATHS.items():
+            key = f"bench/{name}_{size}"
+            put(client, key, data)  # warm up connection
+            puts = [measure(put, client, key, data) for _ in range(args.repeat)]
+            gets = [measure(get, client, key) for _ in range(args.repeat)]
+            client._backend.delete(client._bucket_name, key)
+            result[f"{name}_put_{size}"] = summary(puts)
+            result[f"{name}_get_{size}"] = summary(gets)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for name, values in result.items():
+            logging.info(
+                f"{name:24} cpu {values['cpu_ms']:8.2f} ms   latency {values['latency_ms']:8.2f} ms   min {values['latency_min_ms']:8.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    from webstorageS3 import HOMEPATH
+
+    parser = argparse.ArgumentParser(description="measure per block transfer cost")
+    parser.add_argument(
+        "--homepath", default=HOMEPATH, help="path to config directory"
+    )
+    parser.add_argument(
+        "--backend", default="DEFAULT", help="backend configuration profile to use"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[4096, 65536, 1048576],
+        help="object sizes in bytes to measure",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="number of transfers per size and path"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="output machine readable json"
+    )
+    args = parser.parse_args()
+    main()
@@ -8,7 +8,10 @@ import sys
 import yaml
 
 # own modules
-from webstorageS3 import HOMEPATH, BlockStorageClient, sizeof_fmt
+from webstorageS3 import HOMEPATH, BlockStorageClient, profiling, sizeof_fmt
+from webstorageS3.blockstorage_client_s3 import BlockStorageError
+from webstorageS3.metrics import METRICS
+from webstorageS3.storageclient_s3 import DEFAULT_HASH, HASH_ALGORITHMS
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
@@ -34,6 +37,10 @@ def main():
                 sha256.update(data)
                 md5 = hashlib.md5()
                 md5.update(data)
+                head = client.head(checksum)
+                # the block could be stored by a client using another hash algorithm
+                hashname = ((head or {}).get("Metadata") or {}).get("hash", DEFAULT_HASH)
+                digest = HASH_ALGORITHMS[hashname](data)
 
                 print("-" * 80)
                 print("block checksum informations")
@@ -41,25 +48,27 @@ def main():
                 print(f"MD5    checksum {md5.hexdigest()}")
                 print(f"SHA1   checksum {sha1.hexdigest()}")
                 print(f"SHA256 checksum {sha256.hexdigest()}")
+                if hashname not in ("sha1", "sha256"):
+                    print(f"{hashname.upper():6} checksum {digest.hexdigest()}")
 
                 if len(data) > client.blocksize:
                     logging.error(
-                        f"ERROR: length mismatch of remote {checksum} and locally {sha1.hexdigest()} size {len(data)}"
+                        f"ERROR: length mismatch of remote {checksum} and locally {digest.hexdigest()} size {len(data)}"
                     )
                 else:
-                    if sha1.hexdigest() != checksum:
+                    if digest.hexdigest() != checksum:
                         logging.error(
-                            f"ERROR: checksum mismatch between remote {checksum} and locally {sha1.hexdigest()} size {len(data)}"
+                            f"ERROR: checksum mismatch between remote {checksum} and locally {digest.hexdigest()} size {len(data)}"
                         )
                     else:
                         logging.info(
-                            f"OK: checksum match between remote {checksum} and locally {sha1.hexdigest()} size of data block {len(data)}"
+                            f"OK: checksum match between remote {checksum} and locally {digest.hexdigest()} size of data block {len(data)}"
                         )
 
                 print("-" * 80)
                 print("meta informations about object")
                 print("-" * 80)
-                print(yaml.dump(client.head(checksum), indent=2))
+                print(yaml.dump(head, indent=2))
 
                 # some hexdump like output
                 if args.hexdump:
@@ -96,15 +105,14 @@ def main():
             logging.info(
                 f"copy {checksum} from {args.backend} to {args.target_backend}"
             )
-            data = client_source.get(checksum)
-            sha1 = hashlib.sha1()
-            sha1.update(data)
-            if sha1.hexdigest() == checksum:
-                res_checksum, _ = client_target.put(data, use_cache=True)
-                if res_checksum != checksum:
-                    logging.error(f"error storing data with checksum {checksum}")
-            else:
+            try:
+                data = client_source.get(checksum, verify=True)
+            except BlockStorageError:
                 logging.error(f"checksum mismatch at checksum {checksum}, skiping copy")
+                continue
+            res_checksum, _ = client_target.put(data, use_cache=True)
+            if res_checksum != checksum:
+                logging.error(f"error storing data with checksum {checksum}")
 
     if args.sync:
 
@@ -123,15 +131,14 @@ def main():
             logging.info(
                 f"{index}/{num_checksums} copy {checksum} from {args.backend} to {args.target_backend}"
             )
-            data = client_source.get(checksum)
-            sha1 = hashlib.sha1()
-            sha1.update(data)
-            if sha1.hexdigest() == checksum:
-                res_checksum, _ = client_target.put(data, use_cache=True)
-                if res_checksum != checksum:
-                    logging.error(f"error storing data with checksum {checksum}")
-            else:
+            try:
+                data = client_source.get(checksum, verify=True)
+            except BlockStorageError:
                 logging.error(f"checksum mismatch at checksum {checksum}, skiping copy")
+                continue
+            res_checksum, _ = client_target.put(data, use_cache=True)
+            if res_checksum != checksum:
+                logging.error(f"error storing data with checksum {checksum}")
 
     if args.verify_all:
 
@@ -140,17 +147,12 @@ def main():
         )
         logging.info("checking all stored checksum, this could take some time")
         for checksum in client.checksums:
-            data = client.get(checksum)
-            sha1 = hashlib.sha1()
-            sha1.update(data)
-            if sha1.hexdigest() != checksum:
-                logging.error(
-                    f"ERROR: checksum mismatch between remote {checksum} and locally {sha1.hexdigest()} size {len(data)}"
-                )
+            try:
+                data = client.get(checksum, verify=True)  # with hash algorithm the block was stored with
+            except BlockStorageError as exc:
+                logging.error(f"ERROR: {exc}")
             else:
-                logging.info(
-                    f"OK: checksum match between remote {checksum} and locally {sha1.hexdigest()} size {len(data)}"
-                )
+                logging.info(f"OK: checksum match of {checksum} size {len(data)}")
 
     if args.list:
         client = BlockStorageClient(
@@ -169,6 +171,29 @@ def main():
                 f"{checksum['LastModified']} {sizeof_fmt(checksum['Size']):>8} {checksum['Key']}"
             )
 
+    if args.rebuild_filter:
+        client = BlockStorageClient(
+            homepath=args.homepath, cache=args.cache, s3_backend=args.backend
+        )
+        logging.info("building bloom filter of existing objects, this could take some time")
+        client.rebuild_filter(from_cache=args.rebuild_filter == "cache")
+
+    if args.filter_stats:
+        client = BlockStorageClient(
+            homepath=args.homepath, cache=args.cache, s3_backend=args.backend
+        )
+        print(yaml.dump(client.filter_stats(), indent=2))
+
+    if args.block_cache_stats:
+        client = BlockStorageClient(
+            homepath=args.homepath, cache=args.cache, s3_backend=args.backend
+        )
+        stats = client.block_cache_stats()
+        if stats is None:
+            logging.error("block cache is disabled, set BLOCK_CACHE_SIZE in config")
+        else:
+            print(yaml.dump(stats, indent=2))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -226,9 +251,39 @@ if __name__ == "__main__":
     parser.add_argument(
         "--list", action="store_true", default=False, help="list blocks"
     )
+    parser.add_argument(
+        "--rebuild-filter",
+        nargs="?",
+        const="bucket",
+        choices=("bucket", "cache"),
+        help="build bloom filter of existing objects from bucket listing or local cache",
+    )
+    parser.add_argument(
+        "--filter-stats",
+        action="store_true",
+        help="show bloom filter statistics",
+    )
+    parser.add_argument(
+        "--block-cache-stats",
+        action="store_true",
+        help="show size of local block cache",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="write json summary of operation metrics at end of run, to stdout without FILE",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        metavar="FILE",
+        help="write operation metrics as prometheus textfile, e.g. for node exporter",
+    )
     parser.add_argument(
         "arguments", nargs="*", help="number of checsums of data blocks"
     )
+    profiling.add_arguments(parser)
     args = parser.parse_args()
     args.cache = not args.nocache
 
@@ -259,7 +314,10 @@ if __name__ == "__main__":
 
     try:
 
-        main()
+        with profiling.from_args(args):
+            main()
 
     except KeyboardInterrupt:
         pass
+    finally:
+        METRICS.export(args.metrics, args.metrics_textfile)
@@ -8,6 +8,8 @@ import yaml
 
 # own modules
 from webstorageS3 import FileStorageClient, HOMEPATH, sizeof_fmt
+from webstorageS3 import profiling
+from webstorageS3.metrics import METRICS
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
@@ -21,6 +23,7 @@ def main():
 
         with open(args.infile, "rb") as infile:
             recipe = client.put(infile)
+            client.flush()  # in pack mode put returns before storing
             logging.info(f"file {args.infile} sucessfully stored in FileStorage")
             logging.info(yaml.dump(recipe, indent=2))
             logging.info(
@@ -97,6 +100,7 @@ def main():
                     f"  {block_index}/{blocks} copy block {block_checksum} size {len(block_data)}"
                 )
 
+            data.pop("packed", None)  # blocks are not packed in target
             client_target._put(checksum, data)
 
     if args.sync:
@@ -125,6 +129,7 @@ def main():
                     f"  {block_index}/{blocks} copy block {block_checksum} size {len(block_data)}"
                 )
 
+            data.pop("packed", None)  # blocks are not packed in target
             client_target._put(checksum, data)
 
     if args.list:
@@ -145,6 +150,19 @@ def main():
                 f"{checksum['LastModified']} {sizeof_fmt(checksum['Size']):>8} {checksum['Key']}"
             )
 
+    if args.rebuild_filter:
+        client = FileStorageClient(
+            homepath=args.homepath, cache=args.cache, s3_backend=args.backend
+        )
+        logging.info("building bloom filter of existing objects, this could take some time")
+        client.rebuild_filter(from_cache=args.rebuild_filter == "cache")
+
+    if args.filter_stats:
+        client = FileStorageClient(
+            homepath=args.homepath, cache=args.cache, s3_backend=args.backend
+        )
+        print(yaml.dump(client.filter_stats(), indent=2))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="FileStorageClient Tool")
@@ -195,12 +213,37 @@ if __name__ == "__main__":
         action="store_true",
         help="copy cache data from backend to target-backend",
     )
+    parser.add_argument(
+        "--rebuild-filter",
+        nargs="?",
+        const="bucket",
+        choices=("bucket", "cache"),
+        help="build bloom filter of existing objects from bucket listing or local cache",
+    )
+    parser.add_argument(
+        "--filter-stats",
+        action="store_true",
+        help="show bloom filter statistics",
+    )
     parser.add_argument(
         "--verify-all", action="store_true", help="verify checksums <LONG OPERATION>"
     )
+    parser.add_argument(
+        "--metrics",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="write json summary of operation metrics at end of run, to stdout without FILE",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        metavar="FILE",
+        help="write operation metrics as prometheus textfile, e.g. for node exporter",
+    )
     parser.add_argument(
         "arguments", nargs="*", help="number of checsums of data blocks"
     )
+    profiling.add_arguments(parser)
     args = parser.parse_args()
     args.cache = not args.nocache
 
@@ -223,7 +266,10 @@ if __name__ == "__main__":
 
     try:
 
-        main()
+        with profiling.from_args(args):
+            main()
 
     except KeyboardInterrupt:
         pass
+    finally:
+        METRICS.export(args.metrics, args.metrics_textfile)
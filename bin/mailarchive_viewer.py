@@ -20,12 +20,8 @@ def main():
     metadata = json.loads(open(sys.argv[1], "rt").read())
     # print(metadata)
     print(f"downloading filestore object with checksum {metadata['checksum']}")
-    recipe = fs.get(metadata["checksum"])  # that should be the same as locally stored
-    # print(recipe)
-    mail_b = bytes()
-    for checksum in recipe["blockchain"]:
-        mail_b += fs.blockstorage.get(checksum)
-    mail = json.loads(mail_b.decode("utf-8"))
+    with fs.open(metadata["checksum"]) as infile:
+        mail = json.load(infile)
     # print(json.dumps(mail, indent=2))
     print(f"received on {mail['mail']['received']} with size {mail['mail']['size']}")
     print(f"From   : {mail['mail']['from']}")
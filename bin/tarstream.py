@@ -9,6 +9,7 @@ import tarfile
 import os
 
 from webstorageS3 import FileStorageClient, WebStorageArchiveClient, HOMEPATH
+from webstorageS3 import profiling, registry
 
 logging.basicConfig(level=logging.INFO)
 
@@ -73,10 +74,13 @@ def main():
                         "filetype": int(info.type),
                     }
 
+    fsc.flush()  # packed blocks and recipes have to be stored before the archive
+    profiling.checkpoint("store")
     if archive["filedata"]:
         archive["stoptime"] = time.time()
         logging.debug(json.dumps(archive, indent=2))
         wsa.save(archive)
+        profiling.checkpoint("metadata_save")
 
 
 if __name__ == "__main__":
@@ -101,6 +105,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--homepath", default=HOMEPATH, help="path to config and cache directory"
     )
+    parser.add_argument(
+        "--upload-limit",
+        metavar="RATE",
+        help="bytes per second of all uploads, like 500K or 10M, overrides UPLOAD_LIMIT of backend config",
+    )
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
     # set logging level
@@ -115,9 +125,11 @@ if __name__ == "__main__":
 
     try:
 
+        registry.override(args.homepath, args.backend, UPLOAD_LIMIT=args.upload_limit)
         fsc = FileStorageClient(s3_backend=args.backend, homepath=args.homepath)
         wsa = WebStorageArchiveClient(s3_backend=args.backend, homepath=args.homepath)
-        main()
+        with profiling.from_args(args):
+            main()
 
     except KeyboardInterrupt:
         pass
@@ -25,6 +25,8 @@ from webstorageS3 import (
     HOMEPATH,
     sizeof_fmt,
 )
+from webstorageS3 import archiving, profiling, registry
+from webstorageS3.metrics import METRICS
 
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO, format="%(message)s")
@@ -90,11 +92,58 @@ def create_blacklist(absfilename):
     return blacklist_func
 
 
+def walk_files(path, blacklist_func):
+    """
+    generator of regular files under path, not matched by blacklist_func
+
+    the time spent here is added to the walk phase of METRICS
+    """
+    walker = os.walk(path)
+    while True:
+        with METRICS.phase("walk"):
+            entry = next(walker, None)
+            if entry is None:
+                return
+            root, dirs, files = entry
+            selected = []
+            for filename in files:
+                absfilename = os.path.join(root, filename)
+                if blacklist_func(absfilename):
+                    logging.debug("%8s %s", "EXCLUDE", absfilename)
+                elif os.path.isfile(absfilename) is False:
+                    # only save regular files
+                    logging.debug("%8s %s", "NOFILE", absfilename)
+                else:
+                    selected.append(absfilename)
+        yield from selected
+
+
+def log_phases(starttime):
+    """
+    log wall time of phases since starttime, time not in any phase is other
+
+    read, hash and upload are measured by FileStorageClient.put, upload
+    is the time waiting for transfers not overlapping with reading;
+    stat, read, hash and upload are summed over all file workers, so with
+    more than one they may add up to more than the wall time
+    """
+    phases = METRICS.summary()["phases_s"]
+    duration = time.time() - starttime
+    METRICS.add_phase("other", max(duration - sum(phases.values()), 0.0))
+    phases = METRICS.summary()["phases_s"]
+    logging.info("wall time by phase:")
+    for name in ("walk", "stat", "read", "hash", "upload", "metadata_save", "other"):
+        seconds = phases.get(name, 0.0)
+        logging.info("%14s : %8.2f s %5.1f %%", name, seconds, 100 * seconds / duration if duration else 0.0)
+
+
 def create(filestorage, path, blacklist_func, tag):
     """
     create a new archive of files under path
     filter out filepath which mathes some item in blacklist
     and write file to outfile in FileIndex
+    files are stored in parallel by FILE_WORKERS threads, but added and
+    logged in order of the directory walk
 
     filestorage ... <FileStorage> Object
     path ... <str> must be valid os path
@@ -116,54 +165,32 @@ def create(filestorage, path, blacklist_func, tag):
         "BDEDUP": 0,
         "EXCLUDE": 0,
     }
-    action_str = "PUT"
-    for root, dirs, files in os.walk(path):
-        for filename in files:
-            absfilename = os.path.join(root, filename)
-            if blacklist_func(absfilename):
-                logging.debug("EXCLUDE %s", absfilename)
-                continue
-            if not os.path.isfile(absfilename):
-                # only save regular files
-                continue
-            try:
-                stats = os.stat(absfilename)
-                metadata = filestorage.put(open(absfilename, "rb"))
-                if metadata["filehash_exists"] is True:
-                    action_str = "FDEDUP"
-                else:
-                    if metadata["blockhash_exists"] > 0:
-                        action_str = "BDEDUP"
-                    else:
-                        action_str = "PUT"
-                archive_dict["filedata"][absfilename] = {
-                    "checksum": metadata["checksum"],
-                    "stat": (
-                        stats.st_mtime,
-                        stats.st_atime,
-                        stats.st_ctime,
-                        stats.st_uid,
-                        stats.st_gid,
-                        stats.st_mode,
-                        stats.st_size,
-                    ),
-                }
-                if action_str == "PUT":
-                    logging.error(
-                        "%8s %s",
-                        action_str,
-                        ppls(absfilename, archive_dict["filedata"][absfilename]),
-                    )
-                else:
-                    logging.info(
-                        "%8s %s",
-                        action_str,
-                        ppls(absfilename, archive_dict["filedata"][absfilename]),
-                    )
-                action_stat[action_str] += 1
-            except (OSError, IOError, botocore.exceptions.ClientError) as exc:
-                logging.error(f"error while processing file {absfilename}")
-                logging.exception(exc)
+    pipeline = archiving.ArchivePipeline(filestorage)
+    errors = (OSError, IOError, botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError)
+    for result in pipeline.put_files(walk_files(path, blacklist_func), errors):
+        if result.error is not None:
+            logging.error(f"error while processing file {result.filename}")
+            logging.error(result.error, exc_info=result.error)
+            continue
+        archive_dict["filedata"][result.filename] = {
+            "checksum": result.checksum,
+            "stat": result.stat,
+        }
+        if result.action == "PUT":
+            logging.error(
+                "%8s %s",
+                result.action,
+                ppls(result.filename, archive_dict["filedata"][result.filename]),
+            )
+        else:
+            logging.info(
+                "%8s %s",
+                result.action,
+                ppls(result.filename, archive_dict["filedata"][result.filename]),
+            )
+        action_stat[result.action] += 1
+    with METRICS.phase("upload"):
+        filestorage.flush()  # packed blocks and recipes have to be stored before the archive
     logging.info("file operations statistics:")
     for action, count in action_stat.items():
         logging.info("%8s : %s", action, count)
@@ -187,14 +214,20 @@ def diff(filestorage, data, blacklist_func):
     filestorage ... <FileStorage> Object
     data ... <dict> existing data to compare with existing files
     blacklist_func ... <func> called with absfilename, if True is returned, skip this file
+
+    changed and new files are stored in parallel like in create
     """
     # check if some files are missing or have changed
     changed = False
+    changed_files = []  # stored again after checking all files
     data["starttime"] = time.time()  # change to now
     data["datetime"] = datetime.datetime.today().isoformat()  # change to now
     for absfile in sorted(data["filedata"].keys()):
         filedata = data["filedata"][absfile]
-        if os.path.isfile(absfile) is False:
+        with METRICS.phase("stat"):
+            isfile = os.path.isfile(absfile)
+            stats = os.stat(absfile) if isfile else None
+        if isfile is False:
             # remove informaion from data, if file was deleted
             logging.info("%8s %s", "DELETED", ppls(absfile, filedata))
             del data["filedata"][absfile]
@@ -204,7 +237,6 @@ def diff(filestorage, data, blacklist_func):
                 "stat"
             ]
             # check all except atime
-            stats = os.stat(absfile)
             change = False
             # long version to print every single criteria
             if stats.st_mtime != st_mtime:
@@ -229,57 +261,38 @@ def diff(filestorage, data, blacklist_func):
             if change is False:
                 logging.debug("%8s %s", "OK", ppls(absfile, filedata))
             else:
-                try:
-                    with open(absfile, "rb") as infile:
-                        metadata = filestorage.put(infile)
-                        # update data
-                        data["filedata"][absfile] = {
-                            "checksum": metadata["checksum"],
-                            "stat": (
-                                stats.st_mtime,
-                                stats.st_atime,
-                                stats.st_ctime,
-                                stats.st_uid,
-                                stats.st_gid,
-                                stats.st_mode,
-                                stats.st_size,
-                            ),
-                        }
-                        changed = True
-                except PermissionError as exc:
-                    logging.error(exc)
-                    logging.error("skipping file %s", absfile)
+                changed_files.append(absfile)
+    # store changed files again, in parallel
+    pipeline = archiving.ArchivePipeline(filestorage)
+    for result in pipeline.put_files(changed_files, (PermissionError,)):
+        if result.error is not None:
+            logging.error(result.error)
+            logging.error("skipping file %s", result.filename)
+            continue
+        data["filedata"][result.filename] = {
+            "checksum": result.checksum,
+            "stat": result.stat,
+        }
+        changed = True
     # search for new files on local storage
-    for root, dirs, files in os.walk(data["path"]):
-        for filename in files:
-            absfilename = os.path.join(root, filename)
-            if blacklist_func(absfilename):
-                logging.debug("%8s %s", "EXCLUDE", absfilename)
-                continue
-            if os.path.isfile(absfilename) is False:
-                logging.debug("%8s %s", "NOFILE", absfilename)
-                continue
-            if absfilename not in data["filedata"]:
-                # there is some new file
-                logging.info("%8s %s", "ADD", absfilename)
-                try:
-                    stats = os.stat(absfilename)
-                    metadata = filestorage.put(open(absfilename, "rb"))
-                    data["filedata"][absfilename] = {
-                        "checksum": metadata["checksum"],
-                        "stat": (
-                            stats.st_mtime,
-                            stats.st_atime,
-                            stats.st_ctime,
-                            stats.st_uid,
-                            stats.st_gid,
-                            stats.st_mode,
-                            stats.st_size,
-                        ),
-                    }
-                    changed = True
-                except (OSError, IOError) as exc:
-                    logging.error(exc)
+    new_files = (
+        absfilename
+        for absfilename in walk_files(data["path"], blacklist_func)
+        if absfilename not in data["filedata"]
+    )
+    for result in pipeline.put_files(new_files, (OSError, IOError)):
+        if result.error is not None:
+            logging.error(result.error)
+            continue
+        # there is some new file
+        data["filedata"][result.filename] = {
+            "checksum": result.checksum,
+            "stat": result.stat,
+        }
+        logging.info("%8s %s", "ADD", result.filename)
+        changed = True
+    with METRICS.phase("upload"):
+        filestorage.flush()  # packed blocks and recipes have to be stored before the archive
     data["stoptime"] = time.time()
     data["totalcount"] = len(data["filedata"])
     data["totalsize"] = sum(
@@ -304,8 +317,19 @@ def test(filestorage, data, level=0):
     blockcount = 0  # number of blocks
     blockset = set()  # unique list of blockchecksums
     if level == 0:  # check only checksum existance in filestorage
+        missing = set(
+            filestorage.exists_many(
+                filedata["checksum"]
+                for filedata in data["filedata"].values()
+                if filedata["checksum"]
+            )
+        )
         for absfile, filedata in data["filedata"].items():
-            if filestorage.exists(filedata["checksum"]):
+            if filedata["checksum"] in missing:
+                logging.error(
+                    "FILE-CHECKSUM %s MISSING for %s", filedata["checksum"], absfile
+                )
+            elif filedata["checksum"]:
                 logging.info(
                     "FILE-CHECKSUM %s EXISTS  for %s", filedata["checksum"], absfile
                 )
@@ -313,6 +337,7 @@ def test(filestorage, data, level=0):
                 fileset.add(filedata["checksum"])
     elif level == 1:  # get filemetadata and check also block existance
         blockstorage = filestorage.blockstorage
+        blockchains = []
         for absfile, filedata in data["filedata"].items():
             metadata = filestorage.get(filedata["checksum"])
             logging.info(
@@ -320,12 +345,21 @@ def test(filestorage, data, level=0):
             )
             filecount += 1
             fileset.add(filedata["checksum"])
-            for blockchecksum in metadata["blockchain"]:
+            blockchains.append(metadata["blockchain"])
+        missing = set(
+            blockstorage.exists_many(
+                blockchecksum
+                for blockchain in blockchains
+                for blockchecksum in blockchain
+            )
+        )
+        for blockchain in blockchains:
+            for blockchecksum in blockchain:
                 blockset.add(blockchecksum)
-                if blockchecksum in blockstorage:
-                    logging.info("BLOCKCHECKSUM %s EXISTS", blockchecksum)
-                else:
+                if blockchecksum in missing:
                     logging.error("BLOCKCHECKSUM %s MISSING", blockchecksum)
+                else:
+                    logging.info("BLOCKCHECKSUM %s EXISTS", blockchecksum)
                 blockcount += 1
     elif level == 2:  # get filemetadata and read every block, very time consuming
         blockstorage = filestorage.blockstorage
@@ -418,6 +452,15 @@ def restore_single(filestorage, filedata, targetpath, name, checksum, overwrite=
         logging.error(exc)
 
 
+def log_block_cache(filestorage):
+    """log usage of local block cache, to size BLOCK_CACHE_SIZE"""
+    stats = filestorage.blockstorage.block_cache_stats()
+    if stats is not None:
+        logging.info(
+            f"block cache {stats['hits']} hits, {stats['misses']} misses, {stats['evicted']} evicted, {sizeof_fmt(stats['bytes'])} of {sizeof_fmt(stats['max_bytes'])} used"
+        )
+
+
 def list_content(data: dict):
     """
     show archive content
@@ -447,7 +490,8 @@ def save_webstorage_archive(data: dict):
     )
     logging.info("%(totalcount)d files of %(totalsize)s bytes size", data)
     # wsa = WebStorageArchiveClient()
-    wsa.save(data)
+    with METRICS.phase("metadata_save"):
+        wsa.save(data)
     return
 
 
@@ -485,10 +529,15 @@ def import_archive(filename: str, delete: bool = False, check: bool = True):
         else:
             logging.info("archive does not exist, data will be analyzed")
             if check:
-                for filename, filedata in data["filedata"].items():
-                    logging.info(
-                        "{filename} : {filestorage.exists(filedata['checksum'])}"
+                missing = set(
+                    filestorage.exists_many(
+                        filedata["checksum"]
+                        for filedata in data["filedata"].values()
+                        if filedata["checksum"]
                     )
+                )
+                for filename, filedata in data["filedata"].items():
+                    logging.info(f"{filename} : {filedata['checksum'] not in missing}")
     if exists and delete:
         logging.info(f"deleting file {filename}")
         os.unlink(filename)
@@ -553,7 +602,10 @@ def main():
         # create
         logging.info(f"archiving content of {create_path}")
         data = create(filestorage, create_path, blacklist_func, args.tag)
+        profiling.checkpoint("create")
         save_webstorage_archive(data)
+        profiling.checkpoint("metadata_save")
+        log_phases(data["starttime"])
     # LIST Backupsets
     elif args.list:
         # -l
@@ -593,7 +645,9 @@ def main():
             archive_name = args.name[0]
         logging.info(f"testing backupset {archive_name}")
         data = get_webstorage_data(archive_name)
+        profiling.checkpoint("read_archive")
         test(filestorage, data, level=int(args.test_level))
+        log_block_cache(filestorage)
     # DIFFERENTIAL Backupset
     elif args.diff:
         if not args.name:
@@ -606,10 +660,13 @@ def main():
         )
         data = get_webstorage_data(archive_name)
         changed = diff(filestorage, data, blacklist_func)
+        profiling.checkpoint("diff")
         if changed is False:
             logging.info("Nothing changed")
         else:
             save_webstorage_archive(data)
+            profiling.checkpoint("metadata_save")
+        log_phases(data["starttime"])
     # EXTRACT Backupset to path
     elif args.extract:
         # -x <archive_name> <destination_path>
@@ -625,7 +682,9 @@ def main():
             sys.exit(1)
         logging.info("restoring {archive_name} to {destination_path}")
         data = get_webstorage_data(archive_name)
+        profiling.checkpoint("read_archive")
         restore(filestorage, data, destination_path, overwrite=args.overwrite)
+        log_block_cache(filestorage)
     # GET Backupset to path
     elif args.extract_file:
         # -X  <archive_name> <destination_path> <filename in archive>
@@ -654,6 +713,7 @@ def main():
             checksum,
             overwrite=args.overwrite,
         )
+        log_block_cache(filestorage)
     else:
         logging.error("nice, you have started this program without any purpose?")
 
@@ -758,9 +818,49 @@ if __name__ == "__main__":
     group_optional.add_argument(
         "--hostname", dest="hostname", help="set specific hostname"
     )
+    group_optional.add_argument(
+        "--workers",
+        type=int,
+        help="number of parallel block transfers, defaults to WORKERS of backend config",
+    )
+    group_optional.add_argument(
+        "--file-workers",
+        type=int,
+        help="number of files stored in parallel by --create and -d, overrides FILE_WORKERS of backend config",
+    )
     group_optional.add_argument(
         "--backend", default="DEFAULT", help="backend configuration profile to use"
     )
+    group_optional.add_argument(
+        "--upload-limit",
+        metavar="RATE",
+        help="bytes per second of all uploads, like 500K or 10M, overrides UPLOAD_LIMIT of backend config",
+    )
+    group_optional.add_argument(
+        "--download-limit",
+        metavar="RATE",
+        help="bytes per second of all downloads, like 500K or 10M, overrides DOWNLOAD_LIMIT of backend config",
+    )
+    group_optional.add_argument(
+        "--low-impact",
+        action="store_true",
+        default=None,
+        help="drop read files from page cache, like LOW_IMPACT in backend config",
+    )
+    group_optional.add_argument(
+        "--metrics",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="write json summary of operation metrics and phases at end of run, to stdout without FILE",
+    )
+    group_optional.add_argument(
+        "--metrics-textfile",
+        metavar="FILE",
+        help="write operation metrics as prometheus textfile, e.g. for node exporter",
+    )
+
+    profiling.add_arguments(parser)
 
     group_special = parser.add_argument_group("some special functions")
     group_special.add_argument(
@@ -798,9 +898,24 @@ if __name__ == "__main__":
     if args.verbose is True:
         logging.getLogger("").setLevel(logging.DEBUG)
 
+    registry.override(
+        args.homepath,
+        args.backend,
+        UPLOAD_LIMIT=args.upload_limit,
+        DOWNLOAD_LIMIT=args.download_limit,
+        LOW_IMPACT=args.low_impact,
+        FILE_WORKERS=args.file_workers,
+    )
     wsa = WebStorageArchiveClient(homepath=args.homepath, s3_backend=args.backend)
     filestorage = FileStorageClient(
-        cache=args.cache, homepath=args.homepath, s3_backend=args.backend
+        cache=args.cache,
+        homepath=args.homepath,
+        s3_backend=args.backend,
+        workers=args.workers,
     )
 
-    main()
+    try:
+        with profiling.from_args(args):
+            main()
+    finally:
+        METRICS.export(args.metrics, args.metrics_textfile)
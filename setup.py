@@ -36,4 +36,6 @@ setuptools.setup(
     ],
     requires=["requests", "boto3", "PyYAML"],
     install_requires=["requests>=2.22.0", "boto3>=1.9.253", "PyYAML>=5.4"],
+    # content defined chunking and large checksum caches are much faster with numpy
+    extras_require={"fast": ["numpy>=1.17"]},
 )
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import FileStorageClient
+from webstorageS3.archiving import ArchivePipeline
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    BLOCKSIZE: 4096
+    PACK_THRESHOLD: %d
+"""
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = os.path.join(self.tmpdir.name, "data")
+        os.mkdir(self.datadir)
+        x, y, z = (os.urandom(4096) for _ in range(3))
+        files = [
+            ("a", x, "PUT"),
+            ("b", x + y, "BDEDUP"),  # x stored by a
+            ("c", y, "BDEDUP"),  # y stored by b
+            ("d", x, "FDEDUP"),  # same content as a
+            ("e", z + z, "BDEDUP"),  # second block is the first
+            ("f", os.urandom(3 * 4096 + 100), "PUT"),
+        ]
+        files.extend((f"g{number:03d}", os.urandom(5000), "PUT") for number in range(50))
+        files.append(("h", x + y + z, "BDEDUP"))
+        self.filenames = []
+        self.expected = []
+        for name, data, action in files:
+            filename = os.path.join(self.datadir, name)
+            with open(filename, "wb") as outfile:
+                outfile.write(data)
+            self.filenames.append(filename)
+            self.expected.append(action)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def store(self, workers, pack_threshold=0, run=0):
+        """return results of storing all files into a new memory backend"""
+        homepath = os.path.join(self.tmpdir.name, f"home_{workers}_{pack_threshold}_{run}")
+        os.mkdir(homepath)
+        with open(os.path.join(homepath, "webstorage.yml"), "wt") as outfile:
+            outfile.write(CONFIG % pack_threshold)
+        client = FileStorageClient(homepath=homepath, cache=False)
+        pipeline = ArchivePipeline(client, workers)
+        results = list(pipeline.put_files(self.filenames))
+        client.flush()
+        again = list(pipeline.put_files(self.filenames))
+        for result in results:
+            if result.error is not None:
+                continue
+            with open(result.filename, "rb") as infile:
+                self.assertEqual(b"".join(client.read(result.checksum)), infile.read())
+        client.close()
+        self.assertEqual([result.action for result in again if result.error is None], ["FDEDUP"] * len(self.expected))
+        return results
+
+    def test_actions(self):
+        """
+        actions do not depend on number of workers and timing
+        """
+        for pack_threshold in (0, 8192):
+            for workers in (1, 8):
+                for run in range(3):
+                    results = self.store(workers, pack_threshold, run)
+                    print(pack_threshold, workers, run, [result.action for result in results[:6]])
+                    self.assertEqual([result.filename for result in results], self.filenames)
+                    self.assertEqual([result.action for result in results], self.expected)
+                    self.assertEqual(results[0].checksum, results[3].checksum)
+                    self.assertEqual(results[0].stat[6], 4096)
+                    self.assertTrue(all(result.error is None for result in results))
+
+    def test_errors(self):
+        """
+        expected errors are returned in order, others are raised
+        """
+        self.filenames.insert(2, os.path.join(self.datadir, "missing"))
+        results = self.store(4)
+        self.assertIsInstance(results[2].error, FileNotFoundError)
+        self.assertIsNone(results[2].action)
+        self.assertEqual([result.action for result in results if result.error is None], self.expected)
+        homepath = os.path.join(self.tmpdir.name, "home_raise")
+        os.mkdir(homepath)
+        with open(os.path.join(homepath, "webstorage.yml"), "wt") as outfile:
+            outfile.write(CONFIG % 0)
+        client = FileStorageClient(homepath=homepath, cache=False)
+        with self.assertRaises(FileNotFoundError):
+            list(ArchivePipeline(client, 4).put_files(self.filenames, errors=(PermissionError,)))
+        client.close()
+
+    def test_failed_file(self):
+        """
+        blocks stored for a file failing afterwards are not new for following files
+
+        with one worker b is stored before c, with more c could store y first
+        """
+        homepath = os.path.join(self.tmpdir.name, "home_failed")
+        os.mkdir(homepath)
+        with open(os.path.join(homepath, "webstorage.yml"), "wt") as outfile:
+            outfile.write(CONFIG % 0)
+        client = FileStorageClient(homepath=homepath, cache=False)
+        put = client.put
+
+        def failing_put(infile, journal=None):
+            metadata = put(infile, journal=journal)
+            if infile.name.endswith("/b"):
+                raise OSError("failed after storing")
+            return metadata
+
+        client.put = failing_put
+        results = list(ArchivePipeline(client, 1).put_files(self.filenames[:3]))
+        self.assertIsInstance(results[1].error, OSError)
+        self.assertEqual(results[2].action, "BDEDUP")  # y was stored by b
+        client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3.aio import AsyncBlockStorageClient, AsyncFileStorageClient, AsyncWebStorageArchiveClient
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    ASYNC_CONCURRENCY: 16
+"""
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.homepath = self.tmpdir.name
+        with open(os.path.join(self.homepath, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+            outfile.write(CONFIG)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_blocks(self):
+        """
+        many concurrent block operations in one event loop
+        """
+        async def run():
+            async with AsyncBlockStorageClient(self.homepath, cache=False) as client:
+                self.assertEqual(client.concurrency, 16)
+                blocks = [os.urandom(1000) for _ in range(1000)]
+                results = await asyncio.gather(*(client.put(data) for data in blocks))
+                checksums = [checksum for checksum, _ in results]
+                datas = await asyncio.gather(*(client.get(checksum, verify=True) for checksum in checksums))
+                self.assertEqual(datas, blocks)
+                self.assertTrue(await client.exists(checksums[0]))
+                self.assertEqual(await client.exists_many(checksums + ["0" * 40]), ["0" * 40])
+        asyncio.run(run())
+
+    def test_files(self):
+        """
+        put, get and read files
+        """
+        async def run():
+            async with AsyncFileStorageClient(self.homepath, cache=False) as client:
+                data = os.urandom(3 * 1024 * 1024 + 1000)
+                metadata = await client.put(io.BytesIO(data))
+                print(metadata["checksum"], len(metadata["blockchain"]))
+                recipe = await client.get(metadata["checksum"])
+                self.assertEqual(recipe["blockchain"], metadata["blockchain"])
+                self.assertTrue(await client.exists(metadata["checksum"]))
+                blocks = [block async for block in client.read(metadata["checksum"], window=2)]
+                self.assertEqual(b"".join(blocks), data)
+                self.assertEqual(await client.blockstorage.exists_many(recipe["blockchain"]), [])
+        asyncio.run(run())
+
+    def test_archives(self):
+        """
+        save and read archives
+        """
+        async def run():
+            async with AsyncWebStorageArchiveClient(self.homepath) as client:
+                data = {"hostname": "host", "tag": "test", "datetime": "2024-01-01T00:00:00.000000", "filedata": {}}
+                await client.save(data)
+                key = await client.get_latest_backupset("host")
+                self.assertTrue(await client.exists(key))
+                self.assertEqual((await client.read(key))["tag"], "test")
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+import io
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import FileStorageClient
+from webstorageS3.backends import LocalBackend, MemoryBackend, ObjectNotFound
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: local
+    LOCAL_PATH: {path}
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+"""
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config = {"LOCAL_PATH": self.tmpdir.name, "BLOCKSTORAGE_BUCKET_NAME": "bucket"}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_operations(self):
+        """
+        every backend behaves the same
+        """
+        for backend in (LocalBackend(self.config), MemoryBackend(self.config, ("test", id(self)))):
+            print(f"testing {backend.__class__.__name__}")
+            self.assertIn("bucket", backend.list_buckets())
+            backend.put("bucket", "ab01", b"0123456789", {"codec": "zlib"})
+            backend.put("bucket", "packs/ab02.idx", b"[]")
+            backend.put("bucket", ".hidden", b"dot")
+            data, metadata = backend.get("bucket", "ab01")
+            self.assertEqual((data, metadata), (b"0123456789", {"codec": "zlib"}))
+            self.assertEqual(backend.get("bucket", "ab01", 2, 3)[0], b"234")
+            self.assertEqual(backend.head("bucket", "ab01")["ContentLength"], 10)
+            self.assertEqual(backend.get("bucket", "packs/ab02.idx"), (b"[]", {}))
+            self.assertEqual(sorted(entry["Key"] for entry in backend.list("bucket")), [".hidden", "ab01", "packs/ab02.idx"])
+            self.assertEqual([entry["Key"] for entry in backend.list("bucket", "packs/")], ["packs/ab02.idx"])
+            self.assertEqual([entry["Key"] for entry in backend.list("bucket", "a")], ["ab01"])
+            backend.delete("bucket", "ab01")
+            backend.delete("bucket", "ab01")
+            with self.assertRaises(ObjectNotFound):
+                backend.get("bucket", "ab01")
+            with self.assertRaises(ObjectNotFound):
+                backend.head("bucket", "ab01")
+
+    def test_filestorage(self):
+        """
+        storage clients work on local backend
+        """
+        homepath = os.path.join(self.tmpdir.name, "home")
+        os.mkdir(homepath)
+        with open(os.path.join(homepath, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+            outfile.write(CONFIG.format(path=os.path.join(self.tmpdir.name, "objects")))
+        data = os.urandom(2500000)
+        fs = FileStorageClient(homepath=homepath)
+        metadata = fs.put(io.BytesIO(data))
+        self.assertEqual(fs.exists_many([metadata["checksum"], "0" * 40]), ["0" * 40])
+        self.assertEqual(b"".join(fs.read(metadata["checksum"])), data)
+        self.assertEqual(len(list(fs.blockstorage.checksums)), 3)
+        fs.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+import hashlib
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3.blockcache import BlockCache
+from webstorageS3.storageclient_s3 import HASH_ALGORITHMS
+
+
+class Test(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        """
+        stored blocks are returned, unknown are not
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = BlockCache(tmpdir, 1000000, HASH_ALGORITHMS)
+            data = os.urandom(1000)
+            checksum = hashlib.sha256(data).hexdigest()
+            self.assertIsNone(cache.get(checksum))
+            cache.put(checksum, data, "sha256")
+            self.assertEqual(cache.get(checksum), data)
+            stats = cache.stats()
+            print(stats)
+            self.assertEqual((stats["hits"], stats["misses"], stats["blocks"], stats["bytes"]), (1, 1, 1, 1000))
+            # survives restart
+            cache = BlockCache(tmpdir, 1000000, HASH_ALGORITHMS)
+            self.assertEqual(cache.get(checksum), data)
+
+    def test_eviction(self):
+        """
+        least recently used blocks are deleted above budget
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = BlockCache(tmpdir, 3000, HASH_ALGORITHMS)
+            blocks = [os.urandom(1000) for _ in range(4)]
+            checksums = [hashlib.sha1(data).hexdigest() for data in blocks]
+            for checksum, data in zip(checksums[:3], blocks[:3]):
+                cache.put(checksum, data, "sha1")
+            self.assertEqual(cache.get(checksums[0]), blocks[0])  # now most recently used
+            cache.put(checksums[3], blocks[3], "sha1")
+            self.assertIsNone(cache.get(checksums[1]))
+            for index in (0, 2, 3):
+                self.assertEqual(cache.get(checksums[index]), blocks[index])
+            self.assertEqual(cache.stats()["evicted"], 1)
+            self.assertLessEqual(cache.stats()["bytes"], 3000)
+
+    def test_corrupt(self):
+        """
+        blocks not matching their checksum are removed
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = BlockCache(tmpdir, 1000000, HASH_ALGORITHMS)
+            data = b"some block data"
+            checksum = hashlib.sha1(data).hexdigest()
+            cache.put(checksum, data, "sha1")
+            with open(os.path.join(tmpdir, "sha1", checksum[:2], checksum), "wb") as outfile:
+                outfile.write(b"some other data")
+            self.assertIsNone(cache.get(checksum))
+            self.assertEqual(cache.stats()["corrupt"], 1)
+            self.assertEqual(cache.stats()["blocks"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
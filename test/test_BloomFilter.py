@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+import hashlib
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import BlockStorageClient
+from webstorageS3.bloomfilter import BloomFilter
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    HASH_ALGORITHM: blake2b
+    BLOOM_FILTER: true
+"""
+
+
+def digest(number):
+    return hashlib.sha1(str(number).encode("ascii")).digest()
+
+
+class Test(unittest.TestCase):
+
+    def test_contains(self):
+        """
+        added digests are always found, others only at about error_rate
+        """
+        bloomfilter = BloomFilter(capacity=1000, error_rate=0.01)
+        bloomfilter.update(digest(number) for number in range(1000))
+        self.assertEqual(len(bloomfilter), 1000)
+        self.assertTrue(all(digest(number) in bloomfilter for number in range(1000)))
+        false_positives = sum(digest(number) in bloomfilter for number in range(1000, 11000))
+        print(f"{false_positives} false positives of 10000, estimated rate {bloomfilter.false_positive_rate}")
+        self.assertLess(false_positives, 300)
+        self.assertAlmostEqual(bloomfilter.false_positive_rate, 0.01, delta=0.005)
+
+    def test_save(self):
+        """
+        store filter and load it again
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, "DEFAULT_blockstorage.bloom")
+            bloomfilter = BloomFilter(capacity=100)
+            bloomfilter.update(digest(number) for number in range(100))
+            bloomfilter.save(filename)
+            loaded = BloomFilter.load(filename)
+            self.assertEqual(len(loaded), 100)
+            self.assertTrue(all(digest(number) in loaded for number in range(100)))
+            with open(filename, "r+b") as outfile:
+                outfile.write(b"XXXX")
+            with self.assertRaises(ValueError):
+                BloomFilter.load(filename)
+
+    def test_merge(self):
+        """
+        merged filter holds digests of both filters, counted once
+        """
+        first = BloomFilter(capacity=1000)
+        first.update(digest(number) for number in range(600))
+        second = BloomFilter(capacity=1000)
+        second.update(digest(number) for number in range(400, 1000))
+        first.merge(second)
+        self.assertTrue(all(digest(number) in first for number in range(1000)))
+        print(f"estimated {len(first)} of 1000 digests")
+        self.assertAlmostEqual(len(first), 1000, delta=50)
+        with self.assertRaises(ValueError):
+            first.merge(BloomFilter(capacity=2000))
+
+    def test_save_merges(self):
+        """
+        clients saving the same filter keep the keys of each other
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            with open(os.path.join(tempdir, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+                outfile.write(CONFIG)
+            first = BlockStorageClient(homepath=tempdir, cache=False)
+            first.rebuild_filter()
+            second = BlockStorageClient(homepath=tempdir, cache=False)
+            self.assertIsNotNone(second._get_filter())  # loaded before the other one changes it
+            checksums = [first.put(os.urandom(1000))[0], second.put(os.urandom(1000))[0]]
+            first.close()
+            second.close()  # other process removed dirty marker already
+            self.assertFalse(os.path.isfile(f"{first._filter_filename}.dirty"))
+            saved = BloomFilter.load(first._filter_filename)
+            self.assertTrue(all(bytes.fromhex(checksum) in saved for checksum in checksums))
+
+    def test_rebuild_filter(self):
+        """
+        rebuilt filter holds all keys, also of hash algorithms other than sha1
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            with open(os.path.join(tempdir, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+                outfile.write(CONFIG)
+            bs = BlockStorageClient(homepath=tempdir)
+            checksums = [bs.put(os.urandom(1000))[0] for _ in range(50)]
+            self.assertEqual(len(checksums[0]), 64)
+            bs.rebuild_filter()
+            bs.close()
+            bs = BlockStorageClient(homepath=tempdir, cache=False)  # nothing known but the filter
+            unknown = hashlib.blake2b(b"unknown", digest_size=32).hexdigest()
+            self.assertEqual(bs.exists_many(checksums + [unknown]), [unknown])
+            self.assertEqual(bs.filter_stats()["keys"], 50)
+            bs.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
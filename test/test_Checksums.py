@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+import hashlib
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import checksums as checksums_module
+from webstorageS3.checksums import Checksums, DigestIndex
+from webstorageS3.metrics import METRICS
+
+
+def checksum(number):
+    return hashlib.sha1(str(number).encode("ascii")).hexdigest()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tempdir.name, "checksums.db")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_add(self):
+        """
+        add checksums and find them again, also after reopening database
+        """
+        checksums = Checksums(self.filename)
+        for number in range(100):
+            checksums.add(checksum(number))
+        checksums.add(checksum(0))  # already known, nothing happens
+        self.assertEqual(len(checksums), 100)
+        self.assertTrue(checksum(50) in checksums)
+        self.assertFalse(checksum(100) in checksums)
+        self.assertFalse("0" * 39 in checksums)  # illegal checksum
+        self.assertFalse("x" * 40 in checksums)  # illegal checksum
+        checksums.close()
+        checksums = Checksums(self.filename)
+        self.assertEqual(set(checksums), set(checksum(number) for number in range(100)))
+
+    def test_update(self):
+        """
+        import some list of checksums
+        """
+        checksums = Checksums(self.filename)
+        checksums.update([checksum(number) for number in range(10)])
+        self.assertEqual(len(checksums), 10)
+        checksums.close()
+        self.assertEqual(len(Checksums(self.filename)), 10)
+        with self.assertRaises(AttributeError):
+            checksums.update(["0" * 39])
+
+    def test_write_behind(self):
+        """
+        checksums are written in batches, but at latest on close
+        """
+        checksums = Checksums(self.filename)
+        checksums.FLUSH_SIZE = 10
+        for number in range(15):
+            checksums.add(checksum(number))
+        self.assertTrue(checksum(14) in checksums)  # known in memory at once
+        self.assertEqual(len(Checksums(self.filename)), 10)  # first batch written
+        checksums.close()
+        self.assertEqual(len(Checksums(self.filename)), 15)
+        self.assertTrue(checksum(14) in checksums)  # reopened on next use
+
+    def test_write_behind_update(self):
+        """
+        single checksums remembered by update, e.g. of read blocks, are written in batches too
+        """
+        METRICS.reset()
+        checksums = Checksums(self.filename)
+        for number in range(200):
+            checksums.update([checksum(number)])
+        self.assertEqual(len(Checksums(self.filename)), 0)  # nothing written yet
+        self.assertNotIn("checksums.commit", METRICS.summary()["operations"])
+        checksums.close()
+        self.assertEqual(len(Checksums(self.filename)), 200)
+        self.assertEqual(METRICS.summary()["operations"]["checksums.commit"]["count"], 1)
+        checksums = Checksums(self.filename, write_behind=False)
+        checksums.update([checksum(200)])
+        self.assertEqual(len(Checksums(self.filename)), 201)
+
+    def test_contains_many(self):
+        """
+        bulk membership test
+        """
+        checksums = Checksums()  # memory only
+        checksums.update([checksum(number) for number in range(0, 100, 2)])
+        wanted = [checksum(number) for number in range(100)] + ["illegal"]
+        result = checksums.contains_many(wanted)
+        self.assertEqual(result, [number % 2 == 0 for number in range(100)] + [False])
+
+    def test_width(self):
+        """
+        checksums of other hash algorithms, e.g. 64 characters of sha256
+        """
+        checksums = Checksums(self.filename, width=32)
+        checksums.update([hashlib.sha256(bytes([number])).hexdigest() for number in range(10)])
+        checksums.close()
+        checksums = Checksums(self.filename, width=32)
+        self.assertTrue(hashlib.sha256(bytes([5])).hexdigest() in checksums)
+        self.assertFalse(checksum(5) in checksums)  # sha1 does not fit
+        with self.assertRaises(AttributeError):
+            checksums.add(checksum(5))
+
+    def test_digest_index_merge(self):
+        """
+        pending digests are merged into sorted buffer
+        """
+        index = DigestIndex(20)
+        index.MERGE_SIZE = 16
+        digests = [hashlib.sha1(bytes([number])).digest() for number in range(200)]
+        for digest in digests:
+            index.add(digest)
+        self.assertEqual(len(index), 200)
+        self.assertEqual(sorted(index), sorted(digests))
+        self.assertTrue(all(index.contains_many(digests)))
+        self.assertFalse(hashlib.sha1(b"unknown").digest() in index)
+
+    @unittest.skipIf(checksums_module.numpy is None, "numpy is not installed, nothing to compare with")
+    def test_digest_index_fallback(self):
+        """
+        pure python merging and lookups give the same results as numpy
+        """
+        digests = [hashlib.sha1(bytes([number])).digest() for number in range(200)]
+        unknown = [hashlib.sha1(bytes([number, 1])).digest() for number in range(50)]
+        results = []
+        numpy = checksums_module.numpy
+        try:
+            for module in (numpy, None):
+                checksums_module.numpy = module
+                index = DigestIndex(20)
+                index.MERGE_SIZE = 16
+                for digest in digests:
+                    index.add(digest)
+                results.append((list(index), index.contains_many(digests + unknown)))
+        finally:
+            checksums_module.numpy = numpy
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][1], [True] * 200 + [False] * 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+import io
+import random
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import chunking
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.data = random.Random(1).randbytes(3 * 1024 * 1024)
+
+    def test_fixed(self):
+        """
+        fixed size blocks
+        """
+        chunker = chunking.FixedChunker(1048576)
+        sizes = [len(chunk) for chunk in chunker.chunks(io.BytesIO(self.data[:2500000]))]
+        self.assertEqual(sizes, [1048576, 1048576, 2500000 - 2 * 1048576])
+
+    def test_fastcdc(self):
+        """
+        chunk sizes are within limits, inserted data only changes the first chunk
+        """
+        chunker = chunking.FastCDC(16384, 65536, 262144)
+        chunks = list(chunker.chunks(io.BytesIO(self.data)))
+        print(f"{len(chunks)} chunks, average size {len(self.data) // len(chunks)}")
+        self.assertEqual(b"".join(chunks), self.data)
+        self.assertTrue(all(16384 <= len(chunk) <= 262144 for chunk in chunks[:-1]))
+        shifted = list(chunker.chunks(io.BytesIO(b"inserted" + self.data)))
+        self.assertEqual(chunks[1:], shifted[1:])
+
+    @unittest.skipIf(chunking.numpy is None, "numpy is not installed, nothing to compare with")
+    def test_fallback(self):
+        """
+        pure python hashing finds the same boundaries as numpy
+        """
+        chunker = chunking.FastCDC(1024, 4096, 16384)
+        expected = chunker._candidates(self.data[:200000])
+        numpy, chunking.numpy = chunking.numpy, None
+        try:
+            self.assertEqual(chunker._candidates(self.data[:200000]), expected)
+        finally:
+            chunking.numpy = numpy
+
+    def test_get_chunker(self):
+        """
+        maximum chunk size is limited by blocksize
+        """
+        self.assertIsInstance(chunking.get_chunker({}, 1048576), chunking.FixedChunker)
+        chunker = chunking.get_chunker({"CHUNKER": "fastcdc"}, 1048576)
+        self.assertEqual(chunker.description, {"name": "fastcdc", "min": 65536, "avg": 262144, "max": 1048576})
+        with self.assertRaises(ValueError):
+            chunking.get_chunker({"CHUNKER": "fastcdc", "CDC_MAX_SIZE": 2097152}, 1048576)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+import os
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import compression
+
+
+class Test(unittest.TestCase):
+
+    def test_roundtrip(self):
+        """
+        compress and decompress with every available codec
+        """
+        data = b"".join(b"line %d of some log file\n" % number for number in range(10000))
+        for codec in compression.CODECS:
+            used, compressed = compression.compress(data, codec)
+            print(f"{codec:8} {len(data)} -> {len(compressed)}")
+            self.assertEqual(used, codec)
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(compression.decompress(compressed, used), data)
+
+    def test_incompressible(self):
+        """
+        random data is stored raw
+        """
+        for size in (1000, 1048576):
+            data = os.urandom(size)
+            self.assertEqual(compression.compress(data, "zlib"), (compression.RAW, data))
+        self.assertEqual(compression.decompress(b"old block", None), b"old block")
+
+    def test_unknown_codec(self):
+        """
+        unknown codecs are rejected
+        """
+        with self.assertRaises(compression.CompressionError):
+            compression.check_codec("unknown")
+        with self.assertRaises(compression.CompressionError):
+            compression.decompress(b"data", "unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import FileStorageClient, registry
+from webstorageS3.pagecache import DropBehindReader, drop_behind
+from webstorageS3.scheduler import TokenBucket, parse_rate
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    BLOCKSIZE: 65536
+    UPLOAD_LIMIT: 1M
+    LOW_IMPACT: true
+"""
+
+
+class Test(unittest.TestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("10M"), 10 * 1024 * 1024)
+        self.assertEqual(parse_rate("512KiB"), 512 * 1024)
+        self.assertEqual(parse_rate(4096), 4096)
+        self.assertIsNone(parse_rate(None))
+        self.assertIsNone(parse_rate("0"))
+
+    def test_token_bucket(self):
+        """
+        rate holds for all threads together, also with requests above burst
+        """
+        bucket = TokenBucket(rate=1000000, burst=100000)
+        start = time.monotonic()
+        threads = [threading.Thread(target=lambda: [bucket.consume(50000) for _ in range(5)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - start
+        print(f"1000000 bytes in {duration:.3f} s")
+        self.assertGreater(duration, 0.85)  # first 100000 bytes are burst
+        self.assertLess(duration, 1.5)
+
+    def test_drop_behind(self):
+        """
+        reads are unchanged, streams without file descriptor are not wrapped
+        """
+        stream = io.BytesIO(b"data")
+        self.assertIs(drop_behind(stream), stream)
+        with tempfile.TemporaryFile() as outfile:
+            data = os.urandom(3 * 1024 * 1024)
+            outfile.write(data)
+            outfile.seek(0)
+            reader = drop_behind(outfile)
+            if hasattr(os, "posix_fadvise"):
+                self.assertIsInstance(reader, DropBehindReader)
+            chunks = []
+            while True:
+                chunk = reader.read(1000000)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            self.assertEqual(b"".join(chunks), data)
+            self.assertEqual(reader.tell(), len(data))
+
+    def test_filestorage(self):
+        """
+        uploads of a client are limited by UPLOAD_LIMIT
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "webstorage.yml"), "wt") as outfile:
+                outfile.write(CONFIG)
+            registry.override(tmpdir, UPLOAD_LIMIT="512K")
+            client = FileStorageClient(homepath=tmpdir, cache=False)
+            data = os.urandom(1024 * 1024)
+            filename = os.path.join(tmpdir, "data.bin")
+            with open(filename, "wb") as outfile:
+                outfile.write(data)
+            start = time.monotonic()
+            with open(filename, "rb") as infile:
+                checksum = client.put(infile)["checksum"]
+            client.flush()
+            duration = time.monotonic() - start
+            print(f"stored 1 MiB in {duration:.2f} s")
+            self.assertGreater(duration, 0.9)  # 512 KiB burst, then 512 KiB per second
+            self.assertEqual(b"".join(client.read(checksum)), data)
+            client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
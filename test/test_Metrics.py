@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3.metrics import Histogram, Metrics
+
+
+class Test(unittest.TestCase):
+
+    def test_histogram(self):
+        """
+        quantiles are upper bounds of buckets
+        """
+        histogram = Histogram()
+        for _ in range(98):
+            histogram.observe(0.003)
+        histogram.observe(0.2)
+        histogram.observe(100)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.quantile(0.5), 0.005)
+        self.assertEqual(histogram.quantile(0.99), 0.25)
+        self.assertEqual(histogram.quantile(1.0), 100)
+
+    def test_summary(self):
+        """
+        operations, bytes, counters and phases end up in summary
+        """
+        metrics = Metrics()
+        metrics.observe("blockstorage", "put", 0.02, 1024)
+        metrics.observe("blockstorage", "put", 0.04, 1024)
+        metrics.count("blockstorage", "cache_hit", 3)
+        with metrics.timer("filestorage", "head"):
+            pass
+        self.assertEqual(list(metrics.timed_iter("filestorage", "list", range(5))), list(range(5)))
+        metrics.add_phase("walk", 1.5)
+        summary = metrics.summary()
+        print(summary)
+        put = summary["operations"]["blockstorage.put"]
+        self.assertEqual(put["count"], 2)
+        self.assertAlmostEqual(put["mean_ms"], 30)
+        self.assertEqual(summary["operations"]["filestorage.list"]["count"], 1)
+        self.assertEqual(summary["counters"]["blockstorage.put_bytes"], 2048)
+        self.assertEqual(summary["counters"]["blockstorage.cache_hit"], 3)
+        self.assertEqual(summary["phases_s"], {"walk": 1.5})
+
+    def test_textfile(self):
+        """
+        prometheus textfile with cumulative buckets
+        """
+        metrics = Metrics()
+        metrics.observe("archive", "get", 0.002, 10)
+        metrics.observe("archive", "get", 3)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "webstorage.prom")
+            metrics.export(textfile=filename)
+            self.assertEqual(os.listdir(tmpdir), ["webstorage.prom"])
+            with open(filename, "rt", encoding="utf8") as infile:
+                lines = infile.read().splitlines()
+        self.assertIn('webstorage_operation_seconds_bucket{client="archive",operation="get",le="0.0025"} 1', lines)
+        self.assertIn('webstorage_operation_seconds_bucket{client="archive",operation="get",le="+Inf"} 2', lines)
+        self.assertIn('webstorage_operation_seconds_count{client="archive",operation="get"} 2', lines)
+        self.assertIn('webstorage_events_total{client="archive",name="get_bytes"} 10', lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
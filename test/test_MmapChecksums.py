@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+import hashlib
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import BlockStorageClient
+from webstorageS3.checksums import Checksums
+from webstorageS3.mmap_checksums import MmapChecksums
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    CACHE_FORMAT: mmap
+"""
+
+
+def checksum(number):
+    return hashlib.sha1(str(number).encode("ascii")).hexdigest()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.basename = os.path.join(self.tempdir.name, "DEFAULT_blockstorage")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_add(self):
+        """
+        add checksums, reopen and merge delta into sorted file
+        """
+        checksums = MmapChecksums(self.basename)
+        checksums.MERGE_SIZE = 50
+        for number in range(120):
+            checksums.add(checksum(number))
+        checksums.add(checksum(0))  # already known, nothing happens
+        self.assertEqual(len(checksums), 120)
+        self.assertTrue(checksum(119) in checksums)
+        self.assertFalse(checksum(120) in checksums)
+        self.assertFalse("x" * 40 in checksums)  # illegal checksum
+        checksums.close()
+        checksums = MmapChecksums(self.basename)
+        self.assertEqual(set(checksums), set(checksum(number) for number in range(120)))
+        checksums.merge()
+        self.assertEqual(os.path.getsize(f"{self.basename}.idx"), 120 * 20)
+        self.assertEqual(os.path.getsize(f"{self.basename}.delta"), 0)
+        self.assertEqual(
+            checksums.contains_many([checksum(10), checksum(200), "illegal"]),
+            [True, False, False],
+        )
+
+    def test_migrate(self):
+        """
+        convert existing sqlite cache
+        """
+        database = f"{self.basename}.db"
+        old = Checksums(database)
+        old.update([checksum(number) for number in range(100)])
+        old.close()
+        MmapChecksums.migrate(database, self.basename)
+        checksums = MmapChecksums(self.basename)
+        self.assertEqual(len(checksums), 100)
+        self.assertEqual(sorted(checksums), sorted(checksum(number) for number in range(100)))
+
+    def test_purge(self):
+        """
+        purged cache stays empty, neither delta nor migrated sqlite cache bring checksums back
+        """
+        homepath = self.tempdir.name
+        with open(os.path.join(homepath, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+            outfile.write(CONFIG)
+        os.mkdir(os.path.join(homepath, ".cache"))
+        old = Checksums(os.path.join(homepath, ".cache", "DEFAULT_blockstorage.db"))
+        old.update([checksum(number) for number in range(5)])
+        old.close()
+        bs = BlockStorageClient(homepath=homepath)
+        self.assertEqual(len(bs.cache), 5)  # migrated
+        for _ in range(5):
+            bs.put(os.urandom(100))
+        self.assertEqual(len(bs.cache), 10)
+        bs.purge_cache()
+        self.assertEqual([name for name in os.listdir(os.path.join(homepath, ".cache")) if "blockstorage" in name], [])
+        bs = BlockStorageClient(homepath=homepath)
+        self.assertEqual(len(bs.cache), 0)
+        bs.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+import os
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import BlockStorageClient, registry
+from webstorageS3.packs import Pack, PackIndex, PREFIX, INDEX_SUFFIX
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    PACK_THRESHOLD: 65536
+    HASH_ALGORITHM: {hashname}
+"""
+
+
+class Test(unittest.TestCase):
+
+    def test_pack(self):
+        """
+        objects are appended and read back by location
+        """
+        pack = Pack()
+        self.assertEqual(pack.key, f"{PREFIX}{pack.id}")
+        self.assertEqual(pack.index_key, f"{PREFIX}{pack.id}{INDEX_SUFFIX}")
+        first = pack.add("a" * 40, b"first object", "raw")
+        second = pack.add("b" * 40, b"second", "zlib")
+        print(first, second)
+        self.assertEqual(first, [pack.id, 0, 12, "raw"])
+        self.assertEqual(second, [pack.id, 12, 6, "zlib"])
+        self.assertEqual(pack.read(*second[1:3]), b"second")
+        self.assertEqual(pack.locations["a" * 40], first)
+        self.assertIn(b'"zlib"', pack.index())
+
+    def test_index(self):
+        """
+        index remembers packed objects in memory and on disk
+        """
+        pack = Pack()
+        pack.add("a" * 40, b"data", "raw")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for filename in (None, os.path.join(tmpdir, "packs.db")):
+                index = PackIndex(filename)
+                self.assertIsNone(index.get("a" * 40))
+                index.add_pack(pack.id, pack.entries)
+                self.assertEqual(index.get("a" * 40), [pack.id, 0, 4, "raw"])
+                self.assertIn("a" * 40, index)
+                self.assertEqual(list(index), ["a" * 40])
+                self.assertEqual(index.packs(), {pack.id})
+                index.close()
+                if filename:
+                    index = PackIndex(filename)
+                    self.assertEqual(index.get("a" * 40), [pack.id, 0, 4, "raw"])
+                    index.purge()
+                    self.assertFalse(os.path.isfile(filename))
+
+    def test_verify_other_hash(self):
+        """
+        packed blocks stored with another hash algorithm are verified with their own
+        """
+        with tempfile.TemporaryDirectory() as homepath:
+            blocks = {}
+            for hashname in ("sha1", "sha256", "blake2b"):  # same backend, HASH_ALGORITHM changed
+                with open(os.path.join(homepath, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+                    outfile.write(CONFIG.format(hashname=hashname))
+                registry._configs.clear()  # like a new process
+                bs = BlockStorageClient(homepath=homepath)
+                for _ in range(2):
+                    data = os.urandom(1000)
+                    blocks[bs.submit(data)[0]] = data  # packed, second one at offset in pack
+                bs.flush()
+                for checksum, data in blocks.items():  # also blocks of hash algorithms used before
+                    self.assertIsNotNone(bs._locate(checksum, sync=True))
+                    self.assertEqual(bs.get(checksum, verify=True), data)
+                bs.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+import os
+import pstats
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import profiling
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+class Test(unittest.TestCase):
+
+    def test_cprofile(self):
+        """
+        pstats file with memory report per checkpoint
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "run.prof")
+            with profiling.Profiler(filename, memory=True):
+                data = [bytearray(1024) for _ in range(1000)]
+                profiling.checkpoint("allocate")
+                busy(0.05)
+            self.assertIsNone(profiling._active)
+            stats = pstats.Stats(filename)
+            self.assertTrue(any(function[2] == "busy" for function in stats.stats))
+            with open(f"{filename}.memory", "rt", encoding="utf8") as infile:
+                report = infile.read()
+            print(report[:500])
+            self.assertIn("## allocate", report)
+            self.assertIn("## end", report)
+            self.assertIn("test_Profiling.py", report)
+            del data
+
+    def test_cprofile_threads(self):
+        """
+        functions called in worker threads are in the profile too
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "run.prof")
+            with profiling.Profiler(filename):
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(busy, (0.05, 0.05)))
+            stats = pstats.Stats(filename)
+            calls = [values[1] for function, values in stats.stats.items() if function[2] == "busy"]
+            self.assertEqual(sum(calls), 2)
+
+    def test_sample(self):
+        """
+        collapsed stacks of sampled threads
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "run.stacks")
+            with profiling.Profiler(filename, mode="sample", interval=0.001):
+                busy(0.2)
+            with open(filename, "rt", encoding="utf8") as infile:
+                lines = infile.read().splitlines()
+        busy_lines = [line for line in lines if "busy (" in line]
+        print(busy_lines[0])
+        stack, count = busy_lines[0].rsplit(" ", 1)
+        self.assertTrue(stack.startswith("MainThread;"))
+        self.assertGreater(int(count), 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            profiling.Profiler("run.prof", mode="perf")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+import os
+import sqlite3
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3.recipecache import RecipeCache
+
+
+class Test(unittest.TestCase):
+
+    def test_memory(self):
+        """
+        least recently used recipes are dropped
+        """
+        cache = RecipeCache(max_entries=2)
+        for number in range(3):
+            cache.add(f"{number}" * 40, {"blockchain": [number]})
+        self.assertIsNone(cache.get("0" * 40))
+        self.assertEqual(cache.get("2" * 40), {"blockchain": [2]})
+        stats = cache.stats()
+        print(stats)
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 2))
+
+    def test_persistent(self):
+        """
+        recipes survive restart in database
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "recipes.db")
+            cache = RecipeCache(max_entries=1, filename=filename)
+            cache.add("a" * 40, {"blockchain": ["b" * 40]}, b'{"blockchain": ["' + b"b" * 40 + b'"]}')
+            cache.add("c" * 40, {"blockchain": []})
+            cache.close()
+            cache = RecipeCache(max_entries=1, filename=filename)
+            self.assertEqual(cache.get("a" * 40), {"blockchain": ["b" * 40]})
+            self.assertEqual(cache.get("a" * 40), {"blockchain": ["b" * 40]})
+            self.assertEqual(cache.stats()["persistent_hits"], 1)
+            self.assertEqual(cache.stats()["hits"], 1)
+            cache.purge()
+            self.assertFalse(os.path.isfile(filename))
+            self.assertIsNone(cache.get("a" * 40))
+
+    def test_batches(self):
+        """
+        recipes are written in batches, unwritten ones are found anyway
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "recipes.db")
+
+            def stored():
+                con = sqlite3.connect(filename)
+                count = con.execute("SELECT count(*) FROM tbl_recipes").fetchone()[0]
+                con.close()
+                return count
+
+            cache = RecipeCache(max_entries=1, filename=filename)
+            for number in range(RecipeCache.FLUSH_SIZE + 50):
+                cache.add(f"{number:040d}", {"blockchain": [number]})
+            self.assertEqual(stored(), RecipeCache.FLUSH_SIZE)
+            self.assertEqual(cache.get(f"{RecipeCache.FLUSH_SIZE:040d}"), {"blockchain": [RecipeCache.FLUSH_SIZE]})
+            cache.add("a" * 40, {"blockchain": []})
+            cache.close()
+            self.assertEqual(stored(), RecipeCache.FLUSH_SIZE + 51)
+
+
+if __name__ == "__main__":
+    unittest.main()
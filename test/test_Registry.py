@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import BlockStorageClient, FileStorageClient, registry
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+  OTHER:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+"""
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def homepath(self, name):
+        """return new homepath with memory backends DEFAULT and OTHER"""
+        homepath = os.path.join(self.tmpdir.name, name)
+        os.mkdir(homepath)
+        with open(os.path.join(homepath, "webstorage.yml"), "wt") as outfile:
+            outfile.write(CONFIG)
+        return homepath
+
+    def test_shared(self):
+        """
+        clients of one backend share config, backend and scheduler
+        """
+        homepath = self.homepath("shared")
+        fs = FileStorageClient(homepath=homepath, cache=False)
+        bs = BlockStorageClient(homepath=homepath, cache=False)
+        self.assertIs(fs.blockstorage._config, bs._config)
+        self.assertIs(fs._config, registry.get_config(homepath))
+        self.assertIs(fs.blockstorage._backend, bs._backend)
+        self.assertIs(fs._scheduler, bs._scheduler)
+        # relative and absolute homepath are the same backend
+        self.assertIs(registry.get_config(os.path.relpath(homepath)), registry.get_config(homepath))
+        other = BlockStorageClient(homepath=homepath, s3_backend="OTHER", cache=False)
+        self.assertIsNot(other._config, bs._config)
+        self.assertIsNot(other._backend, bs._backend)
+        self.assertIsNot(other._scheduler, bs._scheduler)
+        for client in (fs, bs, other):
+            client.close()
+
+    def test_reserve(self):
+        """
+        concurrency of shared scheduler grows with every client
+        """
+        homepath = self.homepath("reserve")
+        first = BlockStorageClient(homepath=homepath, cache=False, workers=4)
+        concurrency = first._scheduler.max_concurrency
+        print(concurrency)
+        self.assertGreaterEqual(concurrency, 5)  # workers and calling thread
+        second = BlockStorageClient(homepath=homepath, cache=False, workers=6)
+        self.assertIs(second._scheduler, first._scheduler)
+        self.assertEqual(second._scheduler.max_concurrency, concurrency + 7)
+        first.close()
+        second.close()
+
+    def test_bucket_list(self):
+        """
+        bucket list is remembered in .cache, a missing bucket refreshes it
+        """
+        homepath = self.homepath("bucket_list")
+        filename = os.path.join(homepath, ".cache", "DEFAULT_buckets.json")
+        bs = BlockStorageClient(homepath=homepath, cache=False)
+        self.assertTrue(os.path.isfile(filename))
+        bs.close()
+        with open(filename, "wt") as outfile:
+            outfile.write('["blockstorage"]')  # outdated list
+        registry._buckets.clear()  # like a new process
+        calls = []
+        backend = registry.get_backend(homepath)
+        list_buckets = backend.list_buckets
+
+        def counting_list_buckets():
+            calls.append(1)
+            return list_buckets()
+
+        backend.list_buckets = counting_list_buckets
+        bs = BlockStorageClient(homepath=homepath, cache=False)
+        self.assertEqual(calls, [])  # blockstorage is remembered
+        fs = FileStorageClient(homepath=homepath, cache=False)
+        self.assertEqual(calls, [1])  # filestorage was missing
+        self.assertIn("filestorage", registry.get_buckets(homepath))
+        for client in (fs, bs):
+            client.close()
+
+    def test_lazy_cache(self):
+        """
+        cache database is created and loaded on first use
+        """
+        homepath = self.homepath("lazy_cache")
+        bs = BlockStorageClient(homepath=homepath)
+        self.assertFalse(os.path.isfile(bs._cache_filename))
+        checksum = bs.put(b"some data")[0]
+        self.assertTrue(os.path.isfile(bs._cache_filename))
+        bs.close()
+        bs = BlockStorageClient(homepath=homepath)
+        self.assertIsNone(bs.cache._con)  # not opened yet
+        self.assertTrue(checksum in bs.cache)  # loaded from database
+        self.assertIsNotNone(bs.cache._con)
+        bs.close()
+
+    def test_lazy_import(self):
+        """
+        importing the package does not import boto3, botocore or yaml
+        """
+        code = "import sys, webstorageS3; print(sorted({'boto3', 'botocore', 'yaml'}.intersection(sys.modules)))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=root,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        self.assertEqual(output.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
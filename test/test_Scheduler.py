@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import FileStorageClient, registry
+from webstorageS3.backends import ObjectNotFound
+from webstorageS3.scheduler import TransferScheduler
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    BLOCKSIZE: 1024
+    TRANSFER_BACKOFF: 0.001
+"""
+
+
+def is_transient(exc):
+    return isinstance(exc, ConnectionError)
+
+
+class Flaky:
+    """fails with ConnectionResetError every n-th call"""
+
+    def __init__(self, function, every):
+        self.function = function
+        self.every = every
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            self.calls += 1
+            fail = self.calls % self.every == 0
+        if fail:
+            raise ConnectionResetError("connection reset by peer")
+        return self.function(*args)
+
+
+class Test(unittest.TestCase):
+
+    def test_retry(self):
+        """
+        transient errors are retried and halve concurrency
+        """
+        scheduler = TransferScheduler(max_concurrency=8, retries=3, backoff=0.001)
+        attempts = []
+
+        def flaky(value):
+            attempts.append(value)
+            if len(attempts) < 3:
+                raise ConnectionResetError("reset")
+            return value * 2
+
+        self.assertEqual(scheduler.run(flaky, 21, is_transient=is_transient), 42)
+        stats = scheduler.stats()
+        print(stats)
+        self.assertEqual((stats["retries"], stats["transient_errors"], stats["transfers"]), (2, 2, 1))
+        self.assertEqual(scheduler.concurrency, 4)  # decreased only once per burst
+        with self.assertRaises(ConnectionResetError):
+            scheduler.run(Flaky(abs, 1), 1, is_transient=is_transient)
+        self.assertEqual(scheduler.stats()["failed"], 1)
+
+    def test_not_transient(self):
+        """
+        other errors are raised at once
+        """
+        scheduler = TransferScheduler(retries=3)
+        calls = []
+
+        def missing():
+            calls.append(1)
+            raise ObjectNotFound("key")
+
+        with self.assertRaises(ObjectNotFound):
+            scheduler.run(missing, is_transient=is_transient)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(scheduler.concurrency, 64)
+
+    def test_aimd(self):
+        """
+        concurrency limit is kept and increases again after successes
+        """
+        scheduler = TransferScheduler(max_concurrency=4, retries=0)
+        with self.assertRaises(ConnectionResetError):
+            scheduler.run(Flaky(abs, 1), 1, is_transient=is_transient)
+        self.assertEqual(scheduler.concurrency, 2)
+        active = [0, 0]  # current, maximum
+        lock = threading.Lock()
+
+        def transfer():
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.002)
+            with lock:
+                active[0] -= 1
+
+        threads = [threading.Thread(target=lambda: [scheduler.run(transfer) for _ in range(20)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(scheduler.stats(), active)
+        self.assertLessEqual(active[1], 4)
+        self.assertEqual(scheduler.concurrency, 4)
+
+    def test_filestorage(self):
+        """
+        file is stored and read although every third request fails
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "webstorage.yml"), "wt") as outfile:
+                outfile.write(CONFIG)
+            backend = registry.get_backend(tmpdir)
+            backend.put = Flaky(backend.put, 3)
+            backend.get = Flaky(backend.get, 3)
+            client = FileStorageClient(homepath=tmpdir, cache=False)
+            data = os.urandom(10000)
+            checksum = client.put(io.BytesIO(data))["checksum"]
+            self.assertEqual(b"".join(client.read(checksum)), data)
+            client.close()
+            stats = registry.get_scheduler(tmpdir).stats()
+            print(stats)
+            self.assertGreater(stats["retries"], 3)
+            self.assertEqual(stats["failed"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
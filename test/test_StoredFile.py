@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+import io
+import os
+import random
+import tarfile
+import tempfile
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import FileStorageClient
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    BLOCKSIZE: 65536
+  CDC:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    BLOCKSIZE: 65536
+    CHUNKER: fastcdc
+    CDC_MIN_SIZE: 4096
+    CDC_AVG_SIZE: 16384
+"""
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.homepath = self.tmpdir.name
+        with open(os.path.join(self.homepath, "webstorage.yml"), "wt", encoding="utf8") as outfile:
+            outfile.write(CONFIG)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_random_reads(self):
+        """
+        reads at random positions return the same data as the original
+        """
+        data = os.urandom(1000000)
+        for backend in ("DEFAULT", "CDC"):
+            fs = FileStorageClient(cache=False, homepath=self.homepath, s3_backend=backend)
+            checksum = fs.put(io.BytesIO(data))["checksum"]
+            with fs.open(checksum) as infile:
+                self.assertEqual(infile.seek(0, io.SEEK_END), len(data))
+                for _ in range(100):
+                    position = random.randrange(len(data))
+                    length = random.randrange(200000)
+                    infile.seek(position)
+                    self.assertEqual(infile.read(length), data[position:position + length])
+                infile.seek(len(data) - 4096)
+                self.assertEqual(infile.read(), data[-4096:])
+                self.assertEqual(infile.read(), b"")
+            with fs.open(checksum, buffering=0) as infile:
+                self.assertEqual(infile.readall(), data)
+            fs.close()
+
+    def test_tarfile(self):
+        """
+        tarfile reads members of stored archive without downloading everything
+        """
+        buffer = io.BytesIO()
+        members = {f"member{number}": os.urandom(100000) for number in range(10)}
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            for name, content in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        fs = FileStorageClient(cache=False, homepath=self.homepath)
+        checksum = fs.put(io.BytesIO(buffer.getvalue()))["checksum"]
+        with fs.open(checksum) as infile, tarfile.open(fileobj=infile, mode="r") as tar:
+            self.assertEqual(tar.extractfile("member7").read(), members["member7"])
+        fs.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
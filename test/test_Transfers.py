@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+import logging
+logging.basicConfig(level=logging.INFO)
+# own modules
+from webstorageS3 import BlockStorageClient, FileStorageClient, registry
+
+CONFIG = """
+S3Backends:
+  DEFAULT:
+    BACKEND_TYPE: memory
+    BLOCKSTORAGE_BUCKET_NAME: blockstorage
+    FILESTORAGE_BUCKET_NAME: filestorage
+    WEBSTORAGE_BUCKET_NAME: webstorage
+    WORKERS: %d
+"""
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def homepath(self, name, workers=2):
+        """return new homepath of memory backend"""
+        homepath = os.path.join(self.tmpdir.name, name)
+        os.mkdir(homepath)
+        with open(os.path.join(homepath, "webstorage.yml"), "wt") as outfile:
+            outfile.write(CONFIG % workers)
+        return homepath
+
+    def test_put_order(self):
+        """
+        blocks uploaded in parallel are in blockchain in order of data
+        """
+        fs = FileStorageClient(homepath=self.homepath("put_order"))
+        blocksize = fs.blockstorage.blocksize
+        x, y, z = (os.urandom(blocksize) for _ in range(3))
+        blocks = [x, y, x, z] + [os.urandom(blocksize) for _ in range(8)] + [b"last"]
+        data = b"".join(blocks)
+        metadata = fs.put(io.BytesIO(data))
+        print(metadata["blockhash_exists"], len(metadata["blockchain"]))
+        self.assertEqual(metadata["blockchain"], [hashlib.sha1(block).hexdigest() for block in blocks])
+        self.assertEqual(metadata["checksum"], hashlib.sha1(data).hexdigest())
+        self.assertEqual(metadata["size"], len(data))
+        self.assertEqual(metadata["blockhash_exists"], 1)  # second x, in cache or uploading
+        self.assertFalse(metadata["filehash_exists"])
+        self.assertEqual(b"".join(fs.read(metadata["checksum"])), data)
+        metadata = fs.put(io.BytesIO(data))
+        self.assertEqual(metadata["blockhash_exists"], len(blocks))
+        self.assertTrue(metadata["filehash_exists"])
+
+    def test_put_error(self):
+        """
+        failed background upload is raised by put
+        """
+        homepath = self.homepath("put_error")
+        fs = FileStorageClient(homepath=homepath)
+        backend = registry.get_backend(homepath)
+        put = backend.put
+
+        def failing_put(bucket, key, data, metadata=None):
+            if bucket == "blockstorage" and data.startswith(b"\xff" * 16):
+                raise ValueError("upload failed")
+            return put(bucket, key, data, metadata)
+
+        backend.put = failing_put
+        blocksize = fs.blockstorage.blocksize
+        data = os.urandom(blocksize * 4) + b"\xff" * blocksize
+        with self.assertRaises(ValueError):
+            fs.put(io.BytesIO(data))
+        self.assertFalse(fs.exists(hashlib.sha1(data).hexdigest()))  # no recipe without all blocks
+
+    def test_read_ahead(self):
+        """
+        read downloads at most window blocks ahead of the returned one
+        """
+        fs = FileStorageClient(homepath=self.homepath("read_ahead", workers=8))
+        blocks = [os.urandom(fs.blockstorage.blocksize) for _ in range(12)]
+        checksum = fs.put(io.BytesIO(b"".join(blocks)))["checksum"]
+        requested = []
+        get = fs.blockstorage.get
+
+        def recording_get(checksum, *args, **kwargs):
+            requested.append(checksum)
+            return get(checksum, *args, **kwargs)
+
+        fs.blockstorage.get = recording_get
+        for window in (0, 1, 3):
+            requested.clear()
+            reader = fs.read(checksum, window)
+            self.assertEqual(next(reader), blocks[0])
+            time.sleep(0.1)  # let the executor run everything submitted
+            print(window, len(requested))
+            self.assertLessEqual(len(requested), max(window, 1) + 1)
+            reader.close()
+            time.sleep(0.1)
+            self.assertLessEqual(len(requested), max(window, 1) + 1)  # nothing submitted after close
+        self.assertEqual(list(fs.read(checksum, 4)), blocks)
+        self.assertEqual(list(fs.read(checksum)), blocks)  # window defaults to workers
+
+    def test_exists_many(self):
+        """
+        missing checksums in order, known checksums are not asked for again
+        """
+        homepath = self.homepath("exists_many")
+        bs = BlockStorageClient(homepath=homepath, cache=False)
+        stored = [bs.put(os.urandom(100))[0] for _ in range(10)]
+        missing = [hashlib.sha1(os.urandom(100)).hexdigest() for _ in range(5)]
+        backend = registry.get_backend(homepath)
+        heads = []
+        lock = threading.Lock()
+        head = backend.head
+
+        def counting_head(bucket, key):
+            with lock:
+                heads.append(key)
+            return head(bucket, key)
+
+        backend.head = counting_head
+        for list_threshold in (64, 1):  # by HEAD, by listing prefixes
+            bs = BlockStorageClient(homepath=homepath, cache=False)
+            bs.LIST_THRESHOLD = list_threshold
+            checksums = [stored[0], missing[0], stored[1], missing[1]] + stored[2:] + missing[2:] + [missing[0]]
+            heads.clear()
+            self.assertEqual(bs.exists_many(checksums), missing)
+            print(list_threshold, len(heads))
+            if list_threshold == 1:
+                self.assertEqual(heads, [])
+            else:
+                self.assertEqual(sorted(heads), sorted(stored + missing))
+            heads.clear()
+            self.assertEqual(bs.exists_many(stored), [])  # remembered in cache
+            self.assertEqual(heads, [])
+            self.assertEqual(bs.exists_many(missing), missing)  # missing are asked again
+            self.assertTrue(all(checksum in bs.cache for checksum in stored))
+        self.assertEqual(bs.exists_many([]), [])
+
+    def test_small_objects(self):
+        """
+        blocks and recipes up to blocksize survive put and get unchanged
+        """
+        homepath = self.homepath("small_objects")
+        bs = BlockStorageClient(homepath=homepath, cache=False)
+        blocksize = bs.blocksize
+        for size in (0, 1, 100, blocksize - 1, blocksize):
+            data = os.urandom(size)
+            checksum, status = bs.put(data)
+            self.assertEqual(status, 200)
+            self.assertEqual(bytes(bs.get(checksum, verify=True)), data)
+        bs.close()
+        fs = FileStorageClient(homepath=homepath, cache=False)
+        for data in (b"", b"x", os.urandom(blocksize + 1)):
+            checksum = fs.put(io.BytesIO(data))["checksum"]
+            self.assertEqual(fs.get(checksum)["size"], len(data))
+            self.assertEqual(b"".join(fs.read(checksum)), data)
+        fs.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
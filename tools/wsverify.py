@@ -34,8 +34,9 @@ try:
         else:
             print("checking aganinst local cache database only")
         fs =webstorageS3.FileStorageClient(cache=not args.nocache)
+        missing = set(fs.exists_many(entry['checksum'] for entry in data["filedata"].values()))
         for filename, entry in data["filedata"].items():
-            if not fs.exist(entry['checksum'], force=True) or args.verbose:
+            if entry['checksum'] in missing or args.verbose:
                 print(f"{entry['checksum']} {entry['stat'][6]:12} {filename}")
 except KeyboardInterrupt:
     print("existing by user interruption")
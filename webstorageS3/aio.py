@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+"""
+asyncio interface of the storage clients
+
+every async client wraps the synchronous client of this package, so
+caches, packs and configuration behave the same; blocking calls run in a
+thread pool of ASYNC_CONCURRENCY threads, an asyncio semaphore of the same
+size limits the operations in progress, so any number of coroutines can
+wait for them without holding threads
+
+    async with AsyncFileStorageClient(homepath) as client:
+        metadata = await client.put(fh)
+        async for data in client.read(metadata["checksum"]):
+            ...
+"""
+import asyncio
+import functools
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# own modules
+from . import registry
+from .blockstorage_client_s3 import BlockStorageClient
+from .filestorage_client_s3 import FileStorageClient
+from .webstorage_archive_client_s3 import WebStorageArchiveClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 64
+
+
+class _Limiter:
+    """thread pool and semaphore shared by async clients of one top level client"""
+
+    def __init__(self, homepath: str, s3_backend: str, concurrency: int) -> None:
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="webstorage-aio")
+        self._semaphores = {}  # event loop -> semaphore, semaphores are bound to their loop
+        registry.reserve(homepath, s3_backend, concurrency)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[loop]
+
+    async def run(self, function, *args, **kwargs):
+        """run blocking function in thread pool, at most concurrency at once"""
+        async with self._semaphore():
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(function, *args, **kwargs)
+            )
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._semaphores.clear()
+
+
+def _concurrency(homepath: str, s3_backend: str, concurrency: int) -> int:
+    if concurrency is None:
+        concurrency = int(registry.get_config(homepath, s3_backend).get("ASYNC_CONCURRENCY", DEFAULT_CONCURRENCY))
+    return max(concurrency, 1)
+
+
+class _AsyncClient:
+    """common part of async clients, wraps synchronous client"""
+
+    def __init__(self, client, limiter: _Limiter, owner: bool) -> None:
+        self._client = client
+        self._limiter = limiter
+        self._owner = owner  # close client and thread pool on close
+
+    @property
+    def client(self):
+        """wrapped synchronous client"""
+        return self._client
+
+    @property
+    def concurrency(self) -> int:
+        """maximum number of operations in progress"""
+        return self._limiter.concurrency
+
+    async def _run(self, function, *args, **kwargs):
+        return await self._limiter.run(function, *args, **kwargs)
+
+    async def exists(self, checksum: str) -> bool:
+        """like exists of wrapped client"""
+        return await self._run(self._client.exists, checksum)
+
+    async def close(self) -> None:
+        """store pending data and close caches, like close of wrapped client"""
+        if self._owner:
+            await self._run(self._client.close)
+            self._limiter.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+class AsyncBlockStorageClient(_AsyncClient):
+    """asyncio interface of BlockStorageClient"""
+
+    def __init__(
+        self,
+        homepath: str,
+        cache: bool = True,
+        s3_backend: str = "DEFAULT",
+        concurrency: int = None,
+        client: BlockStorageClient = None,
+        limiter: _Limiter = None,
+    ):
+        """
+        :param homepath <str>: path to config directory and place for cache
+        :param cache <bool>: use persistent checksum cache
+        :param s3_backend <str>: backend in config file
+        :param concurrency <int>: maximum number of operations in progress, defaults to ASYNC_CONCURRENCY
+        :param client <BlockStorageClient>: existing client to wrap, not closed by close
+        :param limiter: used internally to share the thread pool
+        """
+        owner = client is None
+        if client is None:
+            client = BlockStorageClient(homepath=homepath, cache=cache, s3_backend=s3_backend)
+        if limiter is None:
+            limiter = _Limiter(homepath, s3_backend, _concurrency(homepath, s3_backend, concurrency))
+        super().__init__(client, limiter, owner)
+
+    async def put(self, data: bytes, use_cache: bool = False) -> tuple:
+        """like BlockStorageClient.put"""
+        return await self._run(self._client.put, data, use_cache)
+
+    async def get(self, checksum: str, verify: bool = False, location: list = None) -> bytes:
+        """like BlockStorageClient.get"""
+        return await self._run(self._client.get, checksum, verify, location)
+
+    async def exists_many(self, checksums) -> list:
+        """like BlockStorageClient.exists_many"""
+        return await self._run(self._client.exists_many, list(checksums))
+
+    async def flush(self) -> None:
+        """upload open packs, like BlockStorageClient.flush"""
+        await self._run(self._client.flush)
+
+
+class AsyncFileStorageClient(_AsyncClient):
+    """asyncio interface of FileStorageClient"""
+
+    def __init__(
+        self,
+        homepath: str,
+        cache: bool = True,
+        s3_backend: str = "DEFAULT",
+        concurrency: int = None,
+    ):
+        """
+        :param homepath <str>: path to config directory and place for cache
+        :param cache <bool>: use persistent checksum cache
+        :param s3_backend <str>: backend in config file
+        :param concurrency <int>: maximum number of operations in progress, defaults to ASYNC_CONCURRENCY
+        """
+        limiter = _Limiter(homepath, s3_backend, _concurrency(homepath, s3_backend, concurrency))
+        super().__init__(
+            FileStorageClient(cache=cache, homepath=homepath, s3_backend=s3_backend), limiter, True
+        )
+        self._bs = AsyncBlockStorageClient(
+            homepath, s3_backend=s3_backend, client=self._client.blockstorage, limiter=limiter
+        )
+
+    @property
+    def blockstorage(self) -> AsyncBlockStorageClient:
+        """async client of used BlockStorage, sharing the concurrency limit"""
+        return self._bs
+
+    async def put(self, fh, mime_type: str = "application/octet-stream") -> dict:
+        """
+        like FileStorageClient.put, fh is read in a worker thread
+
+        the blocks of one file are uploaded by the blockstorage workers,
+        like the synchronous client does
+        """
+        return await self._run(self._client.put, fh, mime_type)
+
+    async def get(self, checksum: str) -> dict:
+        """like FileStorageClient.get, returns recipe"""
+        return await self._run(self._client.get, checksum)
+
+    async def exists_many(self, checksums) -> list:
+        """like FileStorageClient.exists_many"""
+        return await self._run(self._client.exists_many, list(checksums))
+
+    async def read(self, checksum: str, window: int = None):
+        """
+        async generator of data blocks of file, like FileStorageClient.read
+
+        the next window blocks are downloaded concurrently
+
+        :param checksum <str>: hexdigest of file
+        :param window <int>: number of blocks to read ahead, defaults to workers of client
+        """
+        if window is None:
+            window = self._client.workers
+        recipe = await self.get(checksum)
+        packed = recipe.get("packed", {})  # locations of packed blocks
+        blocks = iter(recipe["blockchain"])
+        pending = deque(
+            asyncio.ensure_future(self._bs.get(block, location=packed.get(block)))
+            for block in islice(blocks, max(window, 1))
+        )
+        try:
+            while pending:
+                data = await pending.popleft()
+                for block in islice(blocks, 1):  # keep read-ahead window filled
+                    pending.append(asyncio.ensure_future(self._bs.get(block, location=packed.get(block))))
+                yield data
+        finally:  # generator closed before end, do not download the rest
+            for task in pending:
+                task.cancel()
+
+    async def flush(self) -> None:
+        """store pending blocks and recipes, like FileStorageClient.flush"""
+        await self._run(self._client.flush)
+
+
+class AsyncWebStorageArchiveClient(_AsyncClient):
+    """asyncio interface of WebStorageArchiveClient"""
+
+    def __init__(self, homepath: str, s3_backend: str = "DEFAULT", concurrency: int = None):
+        """
+        :param homepath <str>: path to config directory
+        :param s3_backend <str>: backend in config file
+        :param concurrency <int>: maximum number of operations in progress, defaults to ASYNC_CONCURRENCY
+        """
+        limiter = _Limiter(homepath, s3_backend, _concurrency(homepath, s3_backend, concurrency))
+        super().__init__(WebStorageArchiveClient(homepath=homepath, s3_backend=s3_backend), limiter, True)
+
+    async def exists(self, key: str) -> bool:
+        """True if archive of this key exists"""
+        return await self._run(self._client._exists, key)
+
+    async def get_backupsets(self, hostname: str) -> list:
+        """like WebStorageArchiveClient.get_backupsets"""
+        return await self._run(self._client.get_backupsets, hostname)
+
+    async def get_latest_backupset(self, hostname: str) -> str:
+        """like WebStorageArchiveClient.get_latest_backupset"""
+        return await self._run(self._client.get_latest_backupset, hostname)
+
+    async def read(self, filename: str) -> dict:
+        """like WebStorageArchiveClient.read"""
+        return await self._run(self._client.read, filename)
+
+    async def save(self, data: dict) -> None:
+        """like WebStorageArchiveClient.save"""
+        await self._run(self._client.save, data)
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+"""
+storing many files in parallel for archiving tools like wstar
+
+the caller walks the directory tree and feeds the filenames in, a pool of
+FILE_WORKERS threads stats, reads, chunks and hashes the files (hashlib and
+file reads release the GIL), their blocks are uploaded by the executor of
+the blockstorage client; at most 2 * FILE_WORKERS files are in progress and
+every file holds at most 2 * WORKERS blocks, so memory stays bounded
+
+results are returned in order of the filenames, the action of every file
+(PUT, FDEDUP or BDEDUP) is the same as if the files were stored one after
+another, although it depends on timing which thread finds a block existing
+"""
+import logging
+import os
+import threading
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# own modules
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# stat is the tuple stored in archives, error the exception if storing failed
+ArchivedFile = namedtuple("ArchivedFile", ("filename", "stat", "checksum", "action", "error"))
+
+
+def stat_tuple(stats: os.stat_result) -> tuple:
+    """return stat values as stored in filedata of archives"""
+    return (
+        stats.st_mtime,
+        stats.st_atime,
+        stats.st_ctime,
+        stats.st_uid,
+        stats.st_gid,
+        stats.st_mode,
+        stats.st_size,
+    )
+
+
+class StoreJournal:
+    """
+    checksums of blocks and recipes stored by this run, not classified yet
+
+    the clients record a checksum at the moment they decide to store it,
+    under the same lock other threads check for existing blocks and
+    recipes, so any file finding a block existing, because a file stored in
+    parallel uploads it, sees it in the journal
+    """
+
+    def __init__(self) -> None:
+        self._blocks = Counter()  # checksum -> number of files storing it
+        self._recipes = Counter()
+        self._classified_recipes = set()  # recipes are stored twice if files with same content race
+        self._lock = threading.Lock()
+
+    def add_block(self, checksum: str) -> None:
+        """called by BlockStorageClient.submit if it uploads a block"""
+        with self._lock:
+            self._blocks[checksum] += 1
+
+    def add_recipe(self, checksum: str) -> None:
+        """called by FileStorageClient.put if it stores a recipe"""
+        with self._lock:
+            self._recipes[checksum] += 1
+
+    def for_file(self) -> "FileJournal":
+        """return FileJournal recording the checksums stored for one file"""
+        return FileJournal(self)
+
+    def remove(self, blocks: list, recipes: list) -> None:
+        """forget records of a file which failed to store"""
+        with self._lock:
+            for counter, checksums in ((self._blocks, blocks), (self._recipes, recipes)):
+                for checksum in checksums:
+                    if counter[checksum] > 1:
+                        counter[checksum] -= 1
+                    else:
+                        counter.pop(checksum, None)
+
+    def classify(self, metadata: dict) -> str:
+        """
+        return action of file as if files were stored one after another
+
+        a block or recipe counts as existing, if it was not stored by this
+        run, or by a file classified before, so files have to be classified
+        in the order they are archived
+
+        :param metadata <dict>: returned by FileStorageClient.put
+        :return <str>: FDEDUP, BDEDUP or PUT
+        """
+        checksum = metadata["checksum"]
+        with self._lock:
+            filehash_exists = checksum not in self._recipes or checksum in self._classified_recipes
+            if self._recipes.pop(checksum, None) is not None:
+                self._classified_recipes.add(checksum)
+            blockhash_exists = 0
+            for blockchecksum in metadata["blockchain"]:
+                if self._blocks.pop(blockchecksum, None) is None:  # not stored by this run, or used before
+                    blockhash_exists += 1
+        if filehash_exists:
+            return "FDEDUP"
+        if blockhash_exists > 0:
+            return "BDEDUP"
+        return "PUT"
+
+
+class FileJournal:
+    """records of one file in StoreJournal, removed again if storing the file fails"""
+
+    def __init__(self, journal: StoreJournal) -> None:
+        self._journal = journal
+        self._blocks = []
+        self._recipes = []
+
+    def add_block(self, checksum: str) -> None:
+        self._journal.add_block(checksum)
+        self._blocks.append(checksum)
+
+    def add_recipe(self, checksum: str) -> None:
+        self._journal.add_recipe(checksum)
+        self._recipes.append(checksum)
+
+    def rollback(self) -> None:
+        """remove all records of this file"""
+        self._journal.remove(self._blocks, self._recipes)
+        self._blocks = []
+        self._recipes = []
+
+
+class ArchivePipeline:
+    """stores files with a pool of threads, returns results in order"""
+
+    def __init__(self, filestorage, workers: int = None) -> None:
+        """
+        :param filestorage <FileStorageClient>: to store files with
+        :param workers <int>: files stored in parallel, defaults to FILE_WORKERS of config
+        """
+        self._filestorage = filestorage
+        self.workers = max(int(workers or filestorage.file_workers), 1)
+        self.journal = StoreJournal()
+
+    def _store(self, filename: str, journal: FileJournal) -> tuple:
+        """stat and store one file, called by pool threads"""
+        with METRICS.phase("stat"):
+            stats = os.stat(filename)
+        with open(filename, "rb") as infile:
+            metadata = self._filestorage.put(infile, journal=journal)
+        return stats, metadata
+
+    def _submit(self, executor: ThreadPoolExecutor, filename: str) -> tuple:
+        journal = self.journal.for_file()
+        return filename, journal, executor.submit(self._store, filename, journal)
+
+    def put_files(self, filenames, errors: tuple = (OSError,)):
+        """
+        generator of ArchivedFile for every filename, in order of filenames
+
+        filenames are consumed ahead of the returned results, at most
+        2 * workers files are stored at once
+
+        :param filenames <iterable>: absolute filenames, e.g. of a directory walk
+        :param errors <tuple>: exceptions returned as error of the file, others are raised
+        """
+        filenames = iter(filenames)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="webstorage-archive") as executor:
+            pending = deque(self._submit(executor, filename) for filename in islice(filenames, 2 * self.workers))
+            try:
+                while pending:
+                    filename, journal, future = pending.popleft()
+                    for nextname in islice(filenames, 1):  # keep the pool busy
+                        pending.append(self._submit(executor, nextname))
+                    try:
+                        stats, metadata = future.result()
+                    except errors as exc:
+                        journal.rollback()  # its blocks must not count as new for following files
+                        yield ArchivedFile(filename, None, None, None, exc)
+                        continue
+                    yield ArchivedFile(
+                        filename,
+                        stat_tuple(stats),
+                        metadata["checksum"],
+                        self.journal.classify(metadata),
+                        None,
+                    )
+            finally:  # generator closed or error raised, do not start the rest
+                for _, _, future in pending:
+                    future.cancel()
@@ -0,0 +1,410 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+object storage backends, selected by BACKEND_TYPE in backend config
+
+  s3        S3 compatible service with boto3, the default
+  local     directory LOCAL_PATH on local disk or NAS
+  memory    objects held in memory of this process, for tests and benchmarks
+
+the storage clients use only the methods of Backend, a missing object is
+reported by ObjectNotFound on every backend
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import urllib.parse
+import uuid
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TYPES = ("s3", "local", "memory")
+_memory_stores = {}  # key of backend -> buckets of memory backend, survive rebuilt backends
+_memory_lock = threading.Lock()
+
+
+class ObjectNotFound(Exception):
+    """object does not exist in bucket"""
+
+
+class Backend:
+    """
+    interface of object storage backends
+
+    list entries and head results are dicts with at least Key, Size and
+    LastModified, or ContentLength, Metadata and LastModified, named like
+    in S3 responses
+    """
+
+    def list_buckets(self) -> list:
+        """return names of buckets"""
+        raise NotImplementedError
+
+    def put(self, bucket: str, key: str, data: bytes, metadata: dict = None) -> None:
+        """
+        store object
+
+        :param bucket <str>: name of bucket
+        :param key <str>: key of object
+        :param data <bytes>: binary data of object
+        :param metadata <dict>: optional user metadata of object, str values
+        """
+        raise NotImplementedError
+
+    def get(self, bucket: str, key: str, offset: int = None, length: int = None) -> tuple:
+        """
+        return data and user metadata of object, raise ObjectNotFound if missing
+
+        :param bucket <str>: name of bucket
+        :param key <str>: key of object
+        :param offset <int>: start of range to read, with length
+        :param length <int>: length of range to read
+        :return <tuple>: bytearray of data and metadata dict
+        """
+        raise NotImplementedError
+
+    def head(self, bucket: str, key: str) -> dict:
+        """return ContentLength, Metadata and LastModified of object, raise ObjectNotFound if missing"""
+        raise NotImplementedError
+
+    def list(self, bucket: str, prefix: str = ""):
+        """generator of entries of objects with key starting with prefix"""
+        raise NotImplementedError
+
+    def delete(self, bucket: str, key: str) -> None:
+        """delete object, missing objects are ignored"""
+        raise NotImplementedError
+
+    def is_transient(self, exc: Exception) -> bool:
+        """True if exception of an operation is temporary, so retrying could succeed"""
+        return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class S3Backend(Backend):
+    """S3 compatible service, used with boto3"""
+
+    SMALL_OBJECT_SIZE = 1048576  # objects up to this size are sent in one put_object
+    # error codes of throttling and temporary server errors
+    TRANSIENT_CODES = (
+        "SlowDown",
+        "503",
+        "ServiceUnavailable",
+        "Throttling",
+        "ThrottlingException",
+        "RequestLimitExceeded",
+        "TooManyRequests",
+        "429",
+        "500",
+        "InternalError",
+        "RequestTimeout",
+    )
+
+    def __init__(self, client) -> None:
+        """
+        :param client <botocore.client.S3>: boto3 client
+        """
+        self._client = client
+
+    @property
+    def client(self):
+        """boto3 client, for S3 specific operations"""
+        return self._client
+
+    @staticmethod
+    def _is_missing(exc) -> bool:
+        """True if botocore ClientError means, that the object does not exist"""
+        return exc.response["Error"]["Code"] in ("404", "NoSuchKey")
+
+    def is_transient(self, exc: Exception) -> bool:
+        """throttling, server errors, connection errors and timeouts of botocore"""
+        import botocore.exceptions  # pylint: disable=import-outside-toplevel
+
+        if isinstance(exc, botocore.exceptions.ClientError):
+            return exc.response["Error"]["Code"] in self.TRANSIENT_CODES
+        transient = [botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError]
+        transient.extend(  # not in all versions
+            getattr(botocore.exceptions, name)
+            for name in ("IncompleteReadError", "ResponseStreamingError")
+            if hasattr(botocore.exceptions, name)
+        )
+        return isinstance(exc, tuple(transient)) or super().is_transient(exc)
+
+    def list_buckets(self) -> list:
+        return [entry["Name"] for entry in self._client.list_buckets()["Buckets"]]
+
+    def put(self, bucket: str, key: str, data: bytes, metadata: dict = None) -> None:
+        """
+        objects up to SMALL_OBJECT_SIZE are sent with a single put_object,
+        without the thread handoffs of the s3transfer machinery
+        """
+        if len(data) <= self.SMALL_OBJECT_SIZE:
+            kwargs = {"Metadata": metadata} if metadata else {}
+            self._client.put_object(Bucket=bucket, Key=key, Body=data, **kwargs)
+        else:
+            extra_args = {"Metadata": metadata} if metadata else None
+            self._client.upload_fileobj(BytesIO(data), bucket, key, ExtraArgs=extra_args)
+
+    def get(self, bucket: str, key: str, offset: int = None, length: int = None) -> tuple:
+        """
+        the body is streamed into a buffer of ContentLength bytes,
+        so there is no intermediate copy
+        """
+        import botocore.exceptions  # pylint: disable=import-outside-toplevel
+
+        kwargs = {}
+        if offset is not None:
+            kwargs["Range"] = f"bytes={offset}-{offset + length - 1}"
+        try:
+            response = self._client.get_object(Bucket=bucket, Key=key, **kwargs)
+        except botocore.exceptions.ClientError as exc:
+            if self._is_missing(exc):
+                raise ObjectNotFound(key) from exc
+            raise exc
+        return self._read_body(key, response), response.get("Metadata", {})
+
+    @staticmethod
+    def _read_body(key: str, response: dict) -> bytearray:
+        """read body of get_object response into buffer of ContentLength bytes"""
+        body = response["Body"]
+        # the raw stream supports readinto, the StreamingBody wrapper does not
+        readinto = getattr(getattr(body, "_raw_stream", body), "readinto", None)
+        try:
+            if readinto is None:
+                return bytearray(body.read())
+            size = response["ContentLength"]
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+            offset = 0
+            while offset < size:
+                length = readinto(view[offset:])
+                if not length:
+                    raise ConnectionError(f"incomplete read of {key}, got {offset} of {size} bytes")
+                offset += length
+            return buffer
+        finally:
+            body.close()
+
+    def head(self, bucket: str, key: str) -> dict:
+        import botocore.exceptions  # pylint: disable=import-outside-toplevel
+
+        try:
+            return self._client.head_object(Bucket=bucket, Key=key)
+        except botocore.exceptions.ClientError as exc:
+            if self._is_missing(exc):
+                raise ObjectNotFound(key) from exc
+            # Something else has gone wrong.
+            raise exc
+
+    def list(self, bucket: str, prefix: str = ""):
+        paginator = self._client.get_paginator("list_objects")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            yield from page.get("Contents", ())
+
+    def delete(self, bucket: str, key: str) -> None:
+        res = self._client.delete_object(Bucket=bucket, Key=key)
+        logger.debug(f"result: {res}")
+
+
+class MemoryBackend(Backend):
+    """
+    objects held in memory
+
+    buckets named in config are created, the objects are shared by all
+    clients of the same backend in this process
+    """
+
+    def __init__(self, config: dict, key: tuple) -> None:
+        """
+        :param config <dict>: backend configuration
+        :param key <tuple>: identifies backend in process
+        """
+        with _memory_lock:
+            self._buckets = _memory_stores.setdefault(key, {})
+            for name in _bucket_names(config):
+                self._buckets.setdefault(name, {})
+        self._lock = threading.Lock()
+
+    def _bucket(self, bucket: str) -> dict:
+        if bucket not in self._buckets:
+            raise ObjectNotFound(bucket)
+        return self._buckets[bucket]
+
+    def _object(self, bucket: str, key: str) -> tuple:
+        with self._lock:
+            entry = self._bucket(bucket).get(key)
+        if entry is None:
+            raise ObjectNotFound(key)
+        return entry
+
+    def list_buckets(self) -> list:
+        with self._lock:
+            return list(self._buckets)
+
+    def put(self, bucket: str, key: str, data: bytes, metadata: dict = None) -> None:
+        entry = (bytes(data), dict(metadata or {}), datetime.datetime.now(datetime.timezone.utc))
+        with self._lock:
+            self._bucket(bucket)[key] = entry
+
+    def get(self, bucket: str, key: str, offset: int = None, length: int = None) -> tuple:
+        data, metadata, _ = self._object(bucket, key)
+        if offset is not None:
+            return bytearray(data[offset:offset + length]), dict(metadata)
+        return bytearray(data), dict(metadata)
+
+    def head(self, bucket: str, key: str) -> dict:
+        data, metadata, modified = self._object(bucket, key)
+        return {"ContentLength": len(data), "Metadata": dict(metadata), "LastModified": modified}
+
+    def list(self, bucket: str, prefix: str = ""):
+        with self._lock:
+            entries = [(key, value) for key, value in self._bucket(bucket).items() if key.startswith(prefix)]
+        for key, (data, _, modified) in sorted(entries, key=lambda entry: entry[0]):
+            yield {"Key": key, "Size": len(data), "LastModified": modified, "ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def delete(self, bucket: str, key: str) -> None:
+        with self._lock:
+            self._bucket(bucket).pop(key, None)
+
+
+class LocalBackend(Backend):
+    """
+    objects stored as files in a local directory
+
+    an object is stored as <root>/<bucket>/<first 2 characters>/<quoted key>,
+    so listing a prefix of 2 or more characters reads only one directory,
+    metadata is stored next to it in <root>/<bucket>/.metadata/ as json
+    files are written to <root>/<bucket>/.tmp/ first and then moved in place
+    """
+
+    PREFIX_LENGTH = 2
+
+    def __init__(self, config: dict) -> None:
+        """
+        :param config <dict>: backend configuration, LOCAL_PATH is the root directory
+        """
+        self._root = os.path.expanduser(config["LOCAL_PATH"])
+        for name in _bucket_names(config):
+            for subdir in (".tmp", ".metadata"):
+                os.makedirs(os.path.join(self._root, name, subdir), exist_ok=True)
+
+    @staticmethod
+    def _quote(key: str) -> str:
+        quoted = urllib.parse.quote(key, safe="")
+        if quoted.startswith("."):  # names starting with dot are used internally
+            quoted = "%2E" + quoted[1:]
+        return quoted
+
+    def _bucket_path(self, bucket: str) -> str:
+        path = os.path.join(self._root, bucket)
+        if not os.path.isdir(path):
+            raise ObjectNotFound(bucket)
+        return path
+
+    def _path(self, bucket: str, key: str, subdir: str = "") -> str:
+        quoted = self._quote(key)
+        return os.path.join(self._bucket_path(bucket), subdir, quoted[:self.PREFIX_LENGTH], quoted)
+
+    def _write(self, bucket: str, path: str, data: bytes) -> None:
+        """write file atomically, readers never see partial objects"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpname = os.path.join(self._bucket_path(bucket), ".tmp", uuid.uuid4().hex)
+        with open(tmpname, "wb") as outfile:
+            outfile.write(data)
+        os.replace(tmpname, path)
+
+    def list_buckets(self) -> list:
+        return sorted(entry.name for entry in os.scandir(self._root) if entry.is_dir())
+
+    def put(self, bucket: str, key: str, data: bytes, metadata: dict = None) -> None:
+        metadata_path = self._path(bucket, key, ".metadata")
+        if metadata:
+            self._write(bucket, metadata_path, json.dumps(metadata).encode("utf-8"))
+        elif os.path.isfile(metadata_path):  # overwritten without metadata
+            os.unlink(metadata_path)
+        self._write(bucket, self._path(bucket, key), data)
+
+    def _metadata(self, bucket: str, key: str) -> dict:
+        try:
+            with open(self._path(bucket, key, ".metadata"), "rb") as infile:
+                return json.loads(infile.read())
+        except FileNotFoundError:
+            return {}
+
+    def get(self, bucket: str, key: str, offset: int = None, length: int = None) -> tuple:
+        try:
+            with open(self._path(bucket, key), "rb") as infile:
+                if offset is not None:
+                    infile.seek(offset)
+                    data = bytearray(length)
+                    data = data[:infile.readinto(data)]
+                else:
+                    data = bytearray(os.fstat(infile.fileno()).st_size)
+                    data = data[:infile.readinto(data)]
+        except FileNotFoundError as exc:
+            raise ObjectNotFound(key) from exc
+        return data, self._metadata(bucket, key)
+
+    def head(self, bucket: str, key: str) -> dict:
+        try:
+            stat = os.stat(self._path(bucket, key))
+        except FileNotFoundError as exc:
+            raise ObjectNotFound(key) from exc
+        return {
+            "ContentLength": stat.st_size,
+            "Metadata": self._metadata(bucket, key),
+            "LastModified": datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc),
+        }
+
+    def list(self, bucket: str, prefix: str = ""):
+        path = self._bucket_path(bucket)
+        quoted_prefix = self._quote(prefix)
+        if len(quoted_prefix) >= self.PREFIX_LENGTH:
+            subdirs = [quoted_prefix[:self.PREFIX_LENGTH]]
+        else:
+            subdirs = sorted(entry.name for entry in os.scandir(path) if entry.is_dir() and not entry.name.startswith("."))
+        for subdir in subdirs:
+            if not os.path.isdir(os.path.join(path, subdir)):
+                continue
+            for entry in sorted(os.scandir(os.path.join(path, subdir)), key=lambda entry: entry.name):
+                key = urllib.parse.unquote(entry.name)
+                if not key.startswith(prefix):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # deleted meanwhile
+                    continue
+                yield {
+                    "Key": key,
+                    "Size": stat.st_size,
+                    "LastModified": datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc),
+                }
+
+    def delete(self, bucket: str, key: str) -> None:
+        for path in (self._path(bucket, key), self._path(bucket, key, ".metadata")):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def _bucket_names(config: dict) -> list:
+    return [config[name] for name in ("BLOCKSTORAGE_BUCKET_NAME", "FILESTORAGE_BUCKET_NAME", "WEBSTORAGE_BUCKET_NAME") if name in config]
+
+
+def create_backend(backend_type: str, config: dict, key: tuple) -> Backend:
+    """
+    return backend other than s3, which is created by registry with shared connection pool
+
+    :param backend_type <str>: BACKEND_TYPE of backend config
+    :param config <dict>: backend configuration
+    :param key <tuple>: identifies backend in process
+    """
+    if backend_type == "memory":
+        return MemoryBackend(config, key)
+    if backend_type == "local":
+        return LocalBackend(config)
+    raise ValueError(f"unknown BACKEND_TYPE {backend_type}, use one of {', '.join(BACKEND_TYPES)}")
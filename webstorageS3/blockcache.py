@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+"""
+size bounded local cache of block data
+
+blocks read from S3 are stored as files <hash>/<prefix>/<checksum> below
+the cache directory, the least recently used blocks are deleted if the
+cache grows above its byte budget
+the modification time of a file is its last use, so the order survives
+restarts; data is verified against its checksum on every hit
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class BlockCache:
+    """read through cache of blocks in a local directory with LRU eviction"""
+
+    def __init__(self, directory: str, max_bytes: int, hash_algorithms: dict) -> None:
+        """
+        :param directory <str>: directory to store blocks in, created if missing
+        :param max_bytes <int>: byte budget of cached data
+        :param hash_algorithms <dict>: name -> hash constructor, to verify blocks
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._hash_algorithms = hash_algorithms
+        self._entries = None  # checksum -> (hashname, size), least recently used first
+        self._bytes = 0  # size of all cached blocks
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "corrupt": 0}
+
+    def _filename(self, checksum: str, hashname: str) -> str:
+        return os.path.join(self._directory, hashname, checksum[:2], checksum)
+
+    def _load(self) -> None:
+        """scan directory once, lock must be held"""
+        if self._entries is not None:
+            return
+        found = []
+        for hashname in self._hash_algorithms:
+            basedir = os.path.join(self._directory, hashname)
+            if not os.path.isdir(basedir):
+                continue
+            for dirpath, _, filenames in os.walk(basedir):
+                for filename in filenames:
+                    if filename.endswith(".tmp"):  # left by interrupted store
+                        os.unlink(os.path.join(dirpath, filename))
+                        continue
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    found.append((stat.st_mtime, filename, hashname, stat.st_size))
+        self._entries = OrderedDict()
+        for _, checksum, hashname, size in sorted(found):
+            self._entries[checksum] = (hashname, size)
+            self._bytes += size
+        logger.debug(f"block cache {self._directory} holds {len(self._entries)} blocks of {self._bytes} bytes")
+        self._evict()
+
+    def _forget(self, checksum: str) -> None:
+        """remove entry and its file, lock must be held"""
+        hashname, size = self._entries.pop(checksum)
+        self._bytes -= size
+        try:
+            os.unlink(self._filename(checksum, hashname))
+        except FileNotFoundError:  # removed by another process
+            pass
+
+    def _evict(self) -> None:
+        """delete least recently used blocks above budget, lock must be held"""
+        while self._bytes > self._max_bytes and self._entries:
+            self._forget(next(iter(self._entries)))
+            self._stats["evicted"] += 1
+
+    def get(self, checksum: str) -> bytes:
+        """
+        return cached data of block, verified against checksum
+
+        :param checksum <str>: hexdigest of block
+        :return <bytes>: data or None if not cached or corrupt
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(checksum)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(checksum)
+        filename = self._filename(checksum, entry[0])
+        try:
+            with open(filename, "rb") as infile:
+                data = infile.read()
+            os.utime(filename)  # remember use for next process
+        except FileNotFoundError:
+            data = None
+        if data is None or self._hash_algorithms[entry[0]](data).hexdigest() != checksum:
+            with self._lock:
+                if data is not None:
+                    logger.warning(f"cached block {checksum} is corrupt, removed from block cache")
+                    self._stats["corrupt"] += 1
+                self._stats["misses"] += 1
+                if checksum in self._entries:
+                    self._forget(checksum)
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+        return data
+
+    def put(self, checksum: str, data: bytes, hashname: str) -> None:
+        """
+        store block, blocks larger than the whole budget are not stored
+
+        :param checksum <str>: hexdigest of data
+        :param data <bytes>: data of block
+        :param hashname <str>: name of hash algorithm of checksum
+        """
+        if len(data) > self._max_bytes:
+            return
+        with self._lock:
+            self._load()
+            if checksum in self._entries:
+                return
+        filename = self._filename(checksum, hashname)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpname = f"{filename}.{uuid.uuid4().hex}.tmp"
+        with open(tmpname, "wb") as outfile:
+            outfile.write(data)
+        os.replace(tmpname, filename)  # readers never see partial blocks
+        with self._lock:
+            if checksum not in self._entries:
+                self._entries[checksum] = (hashname, len(data))
+                self._bytes += len(data)
+                self._stats["stored"] += 1
+                self._evict()
+
+    def stats(self) -> dict:
+        """return counters and size of cache"""
+        with self._lock:
+            self._load()
+            stats = dict(self._stats)
+            stats["blocks"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        stats["max_bytes"] = self._max_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+        return stats
+
+    def purge(self) -> None:
+        """delete all cached blocks"""
+        with self._lock:
+            self._load()
+            for checksum in list(self._entries):
+                self._forget(checksum)
@@ -5,11 +5,14 @@ RestFUL Webclient to use BlockStorage WebApps
 """
 import logging
 import os
-from io import BytesIO
+import threading
 
 # own modules
-from .checksums import Checksums
-from .storageclient_s3 import StorageClient
+from . import compression
+from .backends import ObjectNotFound
+from .blockcache import BlockCache
+from .metrics import METRICS
+from .storageclient_s3 import DEFAULT_HASH, HASH_ALGORITHMS, StorageClient
 
 logger = logging.getLogger(__name__)
 
@@ -21,21 +24,47 @@ class BlockStorageError(Exception):
 class BlockStorageClient(StorageClient):
     """stores chunks of data into BlockStorage"""
 
-    def __init__(self, homepath: str, cache: bool = True, s3_backend: str = "DEFAULT"):
+    METRICS_NAME = "blockstorage"
+
+    def __init__(
+        self,
+        homepath: str,
+        cache: bool = True,
+        s3_backend: str = "DEFAULT",
+        workers: int = None,
+    ):
         """__init__"""
-        super().__init__(homepath=homepath, s3_backend=s3_backend)
+        super().__init__(homepath=homepath, s3_backend=s3_backend, workers=workers)
 
         self._cache = None  # bool to indicate if persistent cache is used
+        self._inflight = {}  # checksum -> future of running background uploads
+        self._inflight_lock = threading.Lock()
         self._bucket_name = self._config["BLOCKSTORAGE_BUCKET_NAME"]
         logger.info(f"{s3_backend} bucket to use: {self._bucket_name}")
+        self._codec = self._config.get("BLOCK_COMPRESSION", compression.RAW)
+        self._codec_level = self._config.get("BLOCK_COMPRESSION_LEVEL")
+        compression.check_codec(self._codec)
 
         self._check_bucket()
         self._init_cache(cache, "blockstorage")
+        self._block_cache = None  # BlockCache of read blocks, if BLOCK_CACHE_SIZE is set
+        block_cache_size = int(self._config.get("BLOCK_CACHE_SIZE", 0))
+        if block_cache_size > 0:
+            self._block_cache = BlockCache(
+                os.path.join(homepath, ".cache", f"{s3_backend}_blocks"),
+                block_cache_size,
+                HASH_ALGORITHMS,
+            )
 
     @property
     def cache(self):
         return self._cache
 
+    @property
+    def codec(self):
+        """name of compression codec for new blocks"""
+        return self._codec
+
     def put(self, data: str, use_cache: bool = False):
         """
         put some arbitrary data into storage
@@ -50,41 +79,163 @@ class BlockStorageClient(StorageClient):
             )
         checksum = self._blockdigest(data)
         if use_cache and (checksum in self._cache):
+            METRICS.count(self.METRICS_NAME, "cache_hit")
             logger.debug(
                 "202 - skip this block, checksum is in list of cached checksums"
             )
             return checksum, 202
-        self._client.upload_fileobj(
-            BytesIO(data), self._bucket_name, checksum
-        )  # TODO: exceptions
+        self._put(checksum, data)
+        return checksum, 200  # fake
+
+    def submit(self, data: bytes, journal=None) -> tuple:
+        """
+        put some arbitrary data into storage in background
+
+        like put with use_cache=True, but the upload is done by the executor.
+        a block which is already uploading is not uploaded twice, the caller
+        gets the future of the running upload instead
+        blocks smaller than PACK_THRESHOLD are added to a pack, the future
+        is done if the pack is uploaded, use flush to upload a partial pack
+
+        :param data <bytes>: arbitrary data up to blocksize long
+        :param journal <StoreJournal>: checksums of uploaded blocks are recorded by journal.add_block
+        :return <tuple>: checksum, status and future, future is None if nothing to wait for
+        """
+        if len(data) > self.blocksize:  # assure maximum length
+            raise BlockStorageError(
+                "length of providede data (%s) is above maximum blocksize of %s"
+                % (len(data), self.blocksize)
+            )
+        checksum = self._blockdigest(data)
+        with self._inflight_lock:
+            if checksum in self._cache:
+                METRICS.count(self.METRICS_NAME, "cache_hit")
+                logger.debug(
+                    "202 - skip this block, checksum is in list of cached checksums"
+                )
+                return checksum, 202, None
+            METRICS.count(self.METRICS_NAME, "cache_miss")
+            future = self._inflight.get(checksum)
+            if future is not None:
+                logger.debug("202 - skip this block, checksum is already uploading")
+                return checksum, 202, future
+            if len(data) < self._pack_threshold:
+                codec, payload = compression.compress(data, self._codec, self._codec_level)
+                future = self._submit_packed(checksum, payload, codec)[0]
+            else:
+                future = self.executor.submit(self._put, checksum, data)
+            self._inflight[checksum] = future
+            if journal is not None:  # before any other caller can see the block as existing
+                journal.add_block(checksum)
+        future.add_done_callback(lambda _: self._upload_done(checksum))
+        return checksum, 200, future
+
+    def _upload_done(self, checksum: str) -> None:
+        """called if background upload is finished, successful or not"""
+        with self._inflight_lock:
+            self._inflight.pop(checksum, None)
+
+    def _put(self, checksum: str, data: bytes) -> None:
+        """
+        upload already digested data, without any checks
 
+        safe to call from worker threads, used by parallel uploads
+        data is compressed with the configured codec, the key stays
+        the checksum of the uncompressed data
+
+        :param checksum <str>: hexdigest of data
+        :param data <bytes>: data up to blocksize long
+        """
+        metadata = {}
+        if self._hashname != DEFAULT_HASH:  # blocks without hash in metadata are sha1
+            metadata["hash"] = self._hashname
+        codec, payload = compression.compress(data, self._codec, self._codec_level)
+        if codec != compression.RAW:
+            logger.debug(f"compressed block {checksum} with {codec} from {len(data)} to {len(payload)}")
+            metadata["codec"] = codec
+        self._put_object(checksum, payload, metadata)
         self._cache.add(checksum)  # add to local cache
-        return checksum, 200  # fake
+        self._filter_add(checksum)
 
-    def get(self, checksum: str, verify: bool = False):
+    def get(self, checksum: str, verify: bool = False, location: list = None):
         """
         get data defined by hexdigest from storage
         if verify - recheck checksum locally
 
+        packed blocks are read from their pack with a ranged GET
+        with BLOCK_CACHE_SIZE set blocks are read from the local block cache
+        first, cached blocks are always verified
+
         :param checksum <str>: hexdigest of data
         :param verify <bool>: to verify checksum locally, or not
+        :param location <list>: optional location of packed block, as recorded in recipes
         """
-        b_buffer = BytesIO()
-        self._client.download_fileobj(
-            self._bucket_name, checksum, b_buffer
-        )  # TODO: exceptions
-        b_buffer.seek(0)  # do not forget this tiny little line !!
-        data = b_buffer.read()
+        if self._block_cache is not None:
+            data = self._block_cache.get(checksum)
+            if data is not None:
+                METRICS.count(self.METRICS_NAME, "block_cache_hit")
+                self._remember([checksum])
+                return data
+            METRICS.count(self.METRICS_NAME, "block_cache_miss")
+        if location is None:
+            location = self._locate(checksum)
+        if location is None:
+            try:
+                data, metadata = self._get_object_with_metadata(checksum)
+            except ObjectNotFound as exc:
+                location = self._locate(checksum, sync=True)
+                if location is None:
+                    raise exc
+        if location is not None:
+            data = self._get_packed(location)
+            metadata = {"codec": location[3]}
+        data = compression.decompress(data, metadata.get("codec"))
+        if location is not None and (verify or self._block_cache is not None):
+            metadata["hash"] = self._packed_hash(checksum, data)
         if verify:
-            if checksum != self._blockdigest(data):
+            # block could be stored by a client using another hash algorithm
+            digest = HASH_ALGORITHMS[metadata.get("hash", DEFAULT_HASH)](data).hexdigest()
+            if checksum != digest:
                 raise BlockStorageError(
-                    "Checksum mismatch %s requested, %s get"
-                    % (checksum, self._blockdigest(data))
+                    "Checksum mismatch %s requested, %s get" % (checksum, digest)
                 )
+        if self._block_cache is not None:
+            self._block_cache.put(checksum, data, metadata.get("hash", DEFAULT_HASH))
 
-        self._cache.add(checksum)  # add to local cache
+        self._remember([checksum])  # add to local cache
         return data
 
+    def _packed_hash(self, checksum: str, data: bytes) -> str:
+        """
+        return name of hash algorithm a packed block was stored with
+
+        pack entries do not record it, so it is derived from the length of
+        checksum, if several algorithms have this length, e.g. sha256 and
+        blake2b, the one reproducing checksum is used
+
+        :param checksum <str>: hexdigest of data
+        :param data <bytes>: uncompressed data of block
+        """
+        candidates = sorted(
+            (name for name, hashfunc in HASH_ALGORITHMS.items() if 2 * hashfunc().digest_size == len(checksum)),
+            key=lambda name: name != self._hashname,  # configured algorithm first
+        )
+        if len(candidates) > 1:
+            for name in candidates:
+                if HASH_ALGORITHMS[name](data).hexdigest() == checksum:
+                    return name
+        return candidates[0] if candidates else self._hashname
+
+    def block_cache_stats(self) -> dict:
+        """
+        return hit and miss counters and size of local block cache
+
+        :return <dict>: statistics or None if BLOCK_CACHE_SIZE is not set
+        """
+        if self._block_cache is None:
+            return None
+        return self._block_cache.stats()
+
     def exists(self, checksum: str) -> bool:
         """
         return True if checksum is in local cache
@@ -93,16 +244,35 @@ class BlockStorageClient(StorageClient):
         :return <bool>: True if checksum also known
         """
         if checksum in self.cache:  # if in cache, ok
+            METRICS.count(self.METRICS_NAME, "cache_hit")
+            return True
+        METRICS.count(self.METRICS_NAME, "cache_miss")
+        if self._locate(checksum) is not None:
             return True
-        return self._exists(checksum)
+        return self._exists_filtered(checksum) or self._locate(checksum, sync=True) is not None
 
-    def purge_cache(self):
+    def exists_many(self, checksums) -> list:
         """
-        delete locally cached checksums
+        return checksums not existing in BlockStorage
+
+        checksums found in local cache are not checked against S3,
+        found checksums are added to local cache
+
+        :param checksums <iterable>: hexdigests of checksums
+        :return <list>: missing checksums
         """
-        logger.info(
-            f"deleting local cached checksum database in file {self._cache_filename}"
-        )
-        del self.checksums  # to close database and release file
-        os.unlink(self._cache_filename)
-        self.checksums = Checksums(self._cache_filename)
+        checksums = list(dict.fromkeys(checksums))
+        unknown = [
+            checksum
+            for checksum, known in zip(checksums, self._cache.contains_many(checksums))
+            if not known
+        ]
+        METRICS.count(self.METRICS_NAME, "cache_hit", len(checksums) - len(unknown))
+        METRICS.count(self.METRICS_NAME, "cache_miss", len(unknown))
+        missing = [
+            checksum
+            for checksum in self._exists_many(unknown)
+            if self._locate(checksum, sync=True) is None
+        ]
+        self._remember(set(unknown).difference(missing))
+        return missing
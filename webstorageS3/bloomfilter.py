@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+"""
+persistent bloom filter of binary digests
+"""
+import contextlib
+import logging
+import math
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:  # not on windows, filters are not locked there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    probabilistic set of binary digests
+
+    if a digest is not in the filter, it was never added
+    if a digest is in the filter, it was added with probability 1 - false_positive_rate
+
+    digests are random already, so bit positions are derived from the digest
+    itself by double hashing, no additional hash function is needed
+    """
+
+    MAGIC = b"WSBF"
+    HEADER = struct.Struct(">4sQBQ")  # magic, number of bits, number of hashes, count
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """
+        :param capacity <int>: number of digests to hold at error_rate
+        :param error_rate <float>: wanted false positive rate at capacity
+        """
+        capacity = max(capacity, 1)
+        self._size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))  # bits
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+        self._count = 0  # number of added digests
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _positions(self, digest: bytes):
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        size = self._size
+        return ((first + index * second) % size for index in range(self._hashes))
+
+    @property
+    def false_positive_rate(self) -> float:
+        """estimated false positive rate at current number of digests"""
+        return (1 - math.exp(-self._hashes * self._count / self._size)) ** self._hashes
+
+    def add(self, digest: bytes) -> None:
+        """
+        add single digest
+
+        :param digest <bytes>: binary digest, at least 16 bytes long
+        """
+        bits = self._bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+
+    def update(self, digests) -> None:
+        """
+        add many digests
+
+        :param digests <iterable>: binary digests
+        """
+        for digest in digests:
+            self.add(digest)
+
+    def compatible(self, other) -> bool:
+        """
+        filters of the same number of bits and hashes can be merged
+
+        :param other <BloomFilter>:
+        """
+        return self._size == other._size and self._hashes == other._hashes
+
+    def merge(self, other) -> None:
+        """
+        add all digests of other filter, by combining the bits of both
+
+        the number of digests is estimated from the bits set, digests added
+        to both filters are counted once
+
+        :param other <BloomFilter>: filter with the same number of bits and hashes
+        """
+        if not self.compatible(other):
+            raise ValueError("bloom filters of different size can not be merged")
+        merged = int.from_bytes(self._bits, "little") | int.from_bytes(other._bits, "little")
+        self._bits = bytearray(merged.to_bytes(len(self._bits), "little"))
+        ones = bin(merged).count("1")
+        if ones < self._size:
+            estimate = round(-self._size / self._hashes * math.log(1 - ones / self._size))
+        else:
+            estimate = self._count + other._count
+        self._count = max(self._count, other._count, estimate)
+
+    def save(self, filename: str) -> None:
+        """
+        store filter in file, replaced atomically
+
+        :param filename <str>: path of filter file
+        """
+        tempname = f"{filename}.tmp"
+        with open(tempname, "wb") as outfile:
+            outfile.write(self.HEADER.pack(self.MAGIC, self._size, self._hashes, self._count))
+            outfile.write(self._bits)
+        os.replace(tempname, filename)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def locked(filename: str):
+        """
+        hold exclusive lock of filter file, while it is read, merged and replaced
+
+        the lock is taken on filename.lock, because save replaces the filter
+        file itself, without fcntl (windows) nothing is locked
+
+        :param filename <str>: path of filter file
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{filename}.lock", "ab") as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    @classmethod
+    def load(cls, filename: str):
+        """
+        read filter stored by save
+
+        :param filename <str>: path of filter file
+        :return <BloomFilter>:
+        """
+        with open(filename, "rb") as infile:
+            magic, size, hashes, count = cls.HEADER.unpack(infile.read(cls.HEADER.size))
+            if magic != cls.MAGIC:
+                raise ValueError(f"{filename} is no bloom filter file")
+            bloomfilter = cls.__new__(cls)
+            bloomfilter._size = size
+            bloomfilter._hashes = hashes
+            bloomfilter._count = count
+            bloomfilter._bits = bytearray(infile.read())
+        if len(bloomfilter._bits) != (size + 7) // 8:
+            raise ValueError(f"{filename} is truncated")
+        return bloomfilter
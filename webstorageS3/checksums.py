@@ -1,43 +1,232 @@
 #!/usr/bin/python3
+import atexit
+import heapq
 import logging
 import os
 import sqlite3
+import threading
+import time
+import weakref
+
+try:
+    import numpy
+except ImportError:  # optional, only used to speed up merging and bulk lookups
+    numpy = None
+
+# own modules
+from .metrics import METRICS
 
 logger = logging.getLogger(__name__)
 
+_open_instances = weakref.WeakSet()  # Checksums with possibly unwritten rows
+
+
+@atexit.register
+def _close_all() -> None:
+    """guaranteed flush of write behind buffers on exit"""
+    for checksums in list(_open_instances):
+        checksums.close()
+
+
+def to_digest(checksum: str, width: int = 20) -> bytes:
+    """
+    return binary digest of checksum or None if this is no valid checksum
+
+    :param checksum <str>: hexdigest
+    :param width <int>: length of digest in bytes, 20 for sha1
+    """
+    if len(checksum) != 2 * width:  # hexdigest has two characters per byte
+        return None
+    try:
+        return bytes.fromhex(checksum)
+    except ValueError:  # not hexadecimal
+        return None
+
+
+class DigestIndex:
+    """
+    compact set of binary digests of fixed width
+
+    digests are stored back to back in one sorted buffer and found by
+    binary search, about width bytes per entry instead of a python str in a set
+    new digests are collected in a small set and merged into the buffer in batches
+    numpy is used for merging and contains_many if available
+    """
+
+    MERGE_SIZE = 65536  # minimum number of pending digests before merging
+
+    def __init__(self, width: int = 20, buffer: bytes = b"") -> None:
+        """
+        :param width <int>: length of every digest in bytes
+        :param buffer <bytes>: optional, already sorted digests back to back
+        """
+        self._width = width
+        self._sorted = buffer  # sorted digests back to back
+        self._pending = set()  # digests not merged yet
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._pending or self._search(digest)
+
+    def __iter__(self):
+        width = self._width
+        buffer = self._sorted
+        for offset in range(0, len(buffer), width):
+            yield bytes(buffer[offset:offset + width])
+        yield from list(self._pending)
+
+    def __len__(self) -> int:
+        return len(self._sorted) // self._width + len(self._pending)
+
+    def _search(self, digest: bytes) -> bool:
+        width = self._width
+        buffer = self._sorted
+        low, high = 0, len(buffer) // width
+        while low < high:
+            middle = (low + high) // 2
+            if buffer[middle * width:(middle + 1) * width] < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return buffer[low * width:(low + 1) * width] == digest
+
+    def add(self, digest: bytes) -> None:
+        """
+        add single digest
+
+        :param digest <bytes>: digest of width bytes
+        """
+        if len(digest) != self._width:
+            raise AttributeError(f"digests are always {self._width} bytes long")
+        if digest in self:
+            return
+        self._pending.add(digest)
+        # merging copies the whole buffer, so merge less often if it is big
+        if len(self._pending) >= max(self.MERGE_SIZE, len(self._sorted) // self._width // 32):
+            self._merge()
+
+    def update(self, digests) -> None:
+        """
+        add many digests, merged into buffer at once
+
+        :param digests <iterable>: digests of width bytes
+        """
+        for digest in digests:
+            if len(digest) != self._width:
+                raise AttributeError(f"digests are always {self._width} bytes long")
+            if digest not in self:
+                self._pending.add(digest)
+        if len(self._pending) >= self.MERGE_SIZE:
+            self._merge()
+
+    def contains_many(self, digests: list) -> list:
+        """
+        vectorized membership test
+
+        :param digests <list>: digests to look for
+        :return <list>: of bool, True if digest at this position is known
+        """
+        if numpy is None or not self._sorted or not digests:
+            return [digest in self for digest in digests]
+        dtype = f"S{self._width}"
+        known = numpy.frombuffer(self._sorted, dtype=dtype)
+        wanted = numpy.array(digests, dtype=dtype)
+        positions = numpy.minimum(numpy.searchsorted(known, wanted), len(known) - 1)
+        found = known[positions] == wanted
+        return [bool(hit) or digest in self._pending for hit, digest in zip(found, digests)]
+
+    def _merge(self) -> None:
+        """merge pending digests into sorted buffer"""
+        if not self._pending:
+            return
+        width = self._width
+        if numpy is not None:
+            dtype = f"S{width}"
+            known = numpy.frombuffer(self._sorted, dtype=dtype)
+            pending = numpy.sort(numpy.array(list(self._pending), dtype=dtype))
+            merged = numpy.insert(known, numpy.searchsorted(known, pending), pending)
+            self._sorted = merged.tobytes()
+        else:
+            buffer = self._sorted
+            known = (buffer[offset:offset + width] for offset in range(0, len(buffer), width))
+            self._sorted = b"".join(heapq.merge(known, sorted(self._pending)))
+        self._pending = set()
+
 
 class Checksums:
     """
     storing persistent set in sqlite database
+
+    the database is opened and loaded on first use, not on creation
+    checksums are held in memory as binary digests in a DigestIndex
+    without filename only the memory part is used
+    all checksums have width bytes, so use one database per hash algorithm
+
+    in write behind mode new checksums are known in memory at once,
+    but written to database in batches, at least every FLUSH_SIZE checksums
+    or FLUSH_INTERVAL seconds, on close and on exit
     """
 
-    def __init__(self, filename: str) -> None:
+    FLUSH_SIZE = 1000  # maximum number of unwritten checksums
+    FLUSH_INTERVAL = 5.0  # maximum age of unwritten checksums in seconds
+
+    def __init__(self, filename: str = None, write_behind: bool = True, width: int = 20) -> None:
+        """
+        :param filename <str>: sqlite database, None for memory only
+        :param write_behind <bool>: write new checksums in batches
+        :param width <int>: length of digests in bytes, 20 for sha1
+        """
         self._filename = filename
+        self._write_behind = write_behind
+        self._width = width
 
-        self._checksums = set()  # uniqueset of checksums
+        self._checksums = DigestIndex(width)  # uniqueset of binary digests
+        self._loaded = False  # set on first use
         self._con = None  # database connection
         self._cur = None  # database cursor
-
-        if not os.path.isfile(filename):
-            self._create_database(filename)
-        else:
-            self._load_checksums(filename)
+        self._lock = threading.Lock()  # clients may add from worker threads
+        self._unwritten = []  # checksums not yet written to database
+        self._flushed = time.monotonic()  # time of last flush
 
     def __contains__(self, checksum: str) -> bool:
-        if len(checksum) != 40:  # sha1 checksums ar always 40 characters long
+        digest = to_digest(checksum, self._width)
+        if digest is None:
             return False
-        return checksum in self._checksums
+        if not self._loaded:
+            self._open()
+        return digest in self._checksums
 
-    def __iter__(self) -> set:
-        return self._checksums.__iter__()
+    def __iter__(self):
+        if not self._loaded:
+            self._open()
+        return (digest.hex() for digest in self._checksums)
 
     def __len__(self) -> int:
+        if not self._loaded:
+            self._open()
         return len(self._checksums)
 
+    def _open(self) -> None:
+        with self._lock:
+            if self._loaded:  # opened by other thread meanwhile
+                return
+            if self._filename is None:
+                pass
+            elif not os.path.isfile(self._filename):
+                self._create_database(self._filename)
+            else:
+                self._load_checksums(self._filename)
+            self._loaded = True
+
+    def _connect(self, filename: str) -> None:
+        self._con = sqlite3.connect(filename, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")  # safe in WAL mode
+        self._cur = self._con.cursor()
+        _open_instances.add(self)
+
     def _create_database(self, filename: str) -> None:
         logger.debug(f"creating empty database {filename}")
-        self._con = sqlite3.connect(filename)
-        self._cur = self._con.cursor()
+        self._connect(filename)
         sqlstring = """
         CREATE TABLE IF NOT EXISTS
         tbl_checksums(checksum char(40) UNIQUE)
@@ -46,40 +235,97 @@ class Checksums:
 
     def _load_checksums(self, filename: str) -> None:
         logger.debug(f"using existing database {filename}")
-        self._con = sqlite3.connect(filename)
-        self._cur = self._con.cursor()
+        self._connect(filename)
         sqlstring = """
-        SELECT checksum FROM tbl_checksums
+        SELECT checksum FROM tbl_checksums ORDER BY checksum
         """
-        result = self._cur.execute(sqlstring)
+        result = self._cur.execute(sqlstring)  # sorted by unique index
+        buffer = bytearray()
         for entry in result:
-            self._checksums.add(entry[0])
+            buffer += bytes.fromhex(entry[0])
+        self._checksums = DigestIndex(self._width, buffer)
         logger.info(f"loaded {len(self._checksums)} checksums from cache")
 
+    def _flush_due(self) -> bool:
+        """True if unwritten checksums have to be written now, lock must be held"""
+        due = len(self._unwritten) >= self.FLUSH_SIZE or time.monotonic() - self._flushed >= self.FLUSH_INTERVAL
+        return not self._write_behind or due
+
+    def _flush(self) -> None:
+        """write unwritten checksums in one transaction, lock must be held"""
+        if self._unwritten and self._con is not None:
+            with METRICS.timer("checksums", "commit"):
+                self._cur.executemany(
+                    "INSERT OR IGNORE INTO tbl_checksums VALUES(?)",
+                    ((checksum,) for checksum in self._unwritten),
+                )
+                self._con.commit()
+        self._unwritten = []
+        self._flushed = time.monotonic()
+
+    def flush(self) -> None:
+        """write all unwritten checksums to database"""
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        """flush and close database, will be reopened on next use"""
+        with self._lock:
+            self._flush()
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+                self._cur = None
+                self._loaded = False
+                self._checksums = DigestIndex(self._width)
+            _open_instances.discard(self)
+
+    def contains_many(self, checksums: list) -> list:
+        """
+        bulk membership test, e.g. for the blockchain of a recipe
+
+        :param checksums <list>: checksums to look for
+        :return <list>: of bool, True if checksum at this position is known
+        """
+        if not self._loaded:
+            self._open()
+        digests = [to_digest(checksum, self._width) for checksum in checksums]
+        found = iter(self._checksums.contains_many([digest for digest in digests if digest]))
+        return [digest is not None and next(found) for digest in digests]
+
     def update(self, checksums: str) -> None:
         """
         import some list of checksums to database and memory
+        written in batches like add, unless write_behind is disabled
         :param checksums <list>:
         """
-        for checksum in checksums:
-            if len(checksum) != 40:
-                raise AttributeError("sha1 checksums are always 40 characters long")
-            self._cur.execute(f"INSERT INTO tbl_checksums VALUES('{checksum}')")
-            self._checksums.add(checksum)
-        self._con.commit()
+        if not self._loaded:
+            self._open()
+        with self._lock:
+            for checksum in checksums:
+                if len(checksum) != 2 * self._width:
+                    raise AttributeError(f"checksums are always {2 * self._width} characters long")
+                digest = bytes.fromhex(checksum)
+                if digest not in self._checksums:
+                    self._checksums.add(digest)
+                    self._unwritten.append(checksum)
+            if self._flush_due():
+                self._flush()
 
     def add(self, checksum: str) -> None:
         """
         add single checksum to set and database
         :param checksum <str>: checksum to store
         """
-        if len(checksum) != 40:
-            raise AttributeError("sha1 checksums are always 40 characters long")
-        if checksum not in self._checksums:  # otherwise unique constraint error
-            try:
-                self._cur.execute(f"INSERT INTO tbl_checksums VALUES('{checksum}')")
-                self._con.commit()
-                self._checksums.add(checksum)
-            except sqlite3.IntegrityError as exc:
-                logger.exception(exc)
-                logger.error(f"error adding checksum {checksum} to cache")
+        if len(checksum) != 2 * self._width:
+            raise AttributeError(f"checksums are always {2 * self._width} characters long")
+        if not self._loaded:
+            self._open()
+        digest = bytes.fromhex(checksum)
+        with self._lock:
+            if digest in self._checksums:
+                return
+            self._checksums.add(digest)
+            self._unwritten.append(checksum)
+            if self._flush_due():
+                self._flush()
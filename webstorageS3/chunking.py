@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+"""
+splitting files into blocks
+
+FixedChunker cuts at fixed offsets, FastCDC cuts at content defined
+positions, so inserting or removing data only changes the blocks around
+the change and not every following block
+"""
+import hashlib
+import logging
+
+try:
+    import numpy
+except ImportError:  # optional, only used to speed up hashing
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# gear table of FastCDC, derived from sha256 to be stable across versions
+GEAR = [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:4], "big") for value in range(256)]
+WINDOW = 32  # bytes influencing one 32 bit gear hash value
+MASK32 = (1 << 32) - 1
+_GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint32) if numpy is not None else None
+
+
+class FixedChunker:
+    """cuts files at fixed offsets of blocksize"""
+
+    name = "fixed"
+
+    def __init__(self, blocksize: int) -> None:
+        """
+        :param blocksize <int>: size of every block, but the last
+        """
+        self.blocksize = blocksize
+        self.max_size = blocksize
+
+    @property
+    def description(self) -> dict:
+        """parameters of chunker, stored in recipes"""
+        return {"name": self.name, "blocksize": self.blocksize}
+
+    def chunks(self, fh):
+        """
+        generator of blocks of data read from fh
+
+        :param fh <filehandle>: to read data from in binary mode
+        """
+        data = fh.read(self.blocksize)
+        while data:
+            yield data
+            data = fh.read(self.blocksize)
+
+
+class FastCDC:
+    """
+    content defined chunking with gear hash and normalized chunking
+
+    the gear hash at every position depends only on the last WINDOW bytes,
+    so it is calculated for whole buffers at once, with numpy if available
+    a chunk ends at the first position after min_size where the high bits
+    of the hash are zero, more bits are tested before avg_size than after,
+    so chunk sizes concentrate around avg_size, no chunk is longer than max_size
+    """
+
+    name = "fastcdc"
+    READ_SIZE = 262144  # bytes read and hashed at once, small enough to stay in cpu cache
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int) -> None:
+        """
+        :param min_size <int>: minimum size of chunks, but the last
+        :param avg_size <int>: wanted average size of chunks, power of 2
+        :param max_size <int>: maximum size of chunks
+        """
+        if not WINDOW <= min_size <= avg_size <= max_size:
+            raise ValueError(f"chunk sizes have to be {WINDOW} <= min <= avg <= max")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = avg_size.bit_length() - 1
+        if bits + 2 > 32:
+            raise ValueError("average chunk size has to be below 1 GiB")
+        self._strong_shift = 32 - (bits + 2)  # used before avg_size
+        self._weak_shift = 32 - max(bits - 2, 1)  # used after avg_size
+
+    @property
+    def description(self) -> dict:
+        """parameters of chunker, stored in recipes"""
+        return {"name": self.name, "min": self.min_size, "avg": self.avg_size, "max": self.max_size}
+
+    def _candidates(self, segment: bytes) -> tuple:
+        """
+        return end offsets of possible chunks in segment
+
+        :param segment <bytes>: data to hash
+        :return <tuple>: lists of ends with strong and weak condition, ascending
+        """
+        if numpy is not None:
+            hashes = numpy.take(_GEAR_ARRAY, numpy.frombuffer(segment, dtype=numpy.uint8))
+            shifted = numpy.empty_like(hashes)
+            width = 1
+            while width < WINDOW:  # hash of width bytes -> hash of 2 * width bytes
+                numpy.left_shift(hashes[:-width], width, out=shifted[width:])
+                hashes[width:] += shifted[width:]
+                width *= 2
+            weak = numpy.flatnonzero(hashes < numpy.uint32(1 << self._weak_shift))
+            strong = weak[hashes[weak] < numpy.uint32(1 << self._strong_shift)]
+            return (strong + 1).tolist(), (weak + 1).tolist()
+        strong = []
+        weak = []
+        value = 0
+        strong_shift = self._strong_shift
+        weak_shift = self._weak_shift
+        for position, byte in enumerate(segment, 1):
+            value = ((value << 1) + GEAR[byte]) & MASK32
+            if not value >> weak_shift:
+                weak.append(position)
+                if not value >> strong_shift:
+                    strong.append(position)
+        return strong, weak
+
+    def _cut(self, strong: list, weak: list, length: int) -> int:
+        """return size of next chunk, candidates are relative to chunk start"""
+        if length <= self.min_size:
+            return length
+        end = min(length, self.max_size)
+        for candidate in strong:
+            if candidate >= self.avg_size or candidate > end:
+                break
+            if candidate >= self.min_size:
+                return candidate
+        for candidate in weak:
+            if candidate > end:
+                break
+            if candidate >= self.avg_size:
+                return candidate
+        return end
+
+    def chunks(self, fh):
+        """
+        generator of content defined chunks of data read from fh
+
+        :param fh <filehandle>: to read data from in binary mode
+        """
+        buffer = bytearray()  # data not yielded yet, starts with next chunk
+        strong = []  # candidate ends relative to buffer start
+        weak = []
+        eof = False
+        while True:
+            while not eof and len(buffer) < self.max_size:
+                data = fh.read(self.READ_SIZE)
+                if not data:
+                    eof = True
+                    break
+                # hashes at the start of data need the last bytes before
+                context = min(len(buffer), WINDOW - 1)
+                offset = len(buffer) - context
+                new_strong, new_weak = self._candidates(bytes(buffer[offset:]) + data)
+                strong.extend(end + offset for end in new_strong if end > context)
+                weak.extend(end + offset for end in new_weak if end > context)
+                buffer += data
+            if not buffer:
+                return
+            size = self._cut(strong, weak, len(buffer))
+            yield bytes(buffer[:size])
+            del buffer[:size]
+            strong = [end - size for end in strong if end > size]
+            weak = [end - size for end in weak if end > size]
+
+
+def get_chunker(config: dict, blocksize: int):
+    """
+    return chunker selected by CHUNKER in backend config
+
+    :param config <dict>: backend configuration
+    :param blocksize <int>: maximum size of blocks in BlockStorage
+    :return: FixedChunker or FastCDC
+    """
+    name = config.get("CHUNKER", FixedChunker.name)
+    if name == FixedChunker.name:
+        return FixedChunker(blocksize)
+    if name == FastCDC.name:
+        max_size = config.get("CDC_MAX_SIZE", blocksize)
+        if max_size > blocksize:
+            raise ValueError(f"CDC_MAX_SIZE {max_size} is above maximum blocksize of {blocksize}")
+        avg_size = config.get("CDC_AVG_SIZE", max_size // 4)
+        return FastCDC(config.get("CDC_MIN_SIZE", avg_size // 4), avg_size, max_size)
+    raise ValueError(f"unknown CHUNKER {name}, use {FixedChunker.name} or {FastCDC.name}")
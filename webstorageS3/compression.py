@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+"""
+compression codecs for blocks
+
+zlib, lzma and bz2 are always available, zstd, lz4 and brotli only if the
+modules zstandard, lz4 and brotli are installed
+
+the name of the codec is stored in object metadata, objects without
+codec in metadata are stored raw
+"""
+import bz2
+import logging
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional codec
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:  # optional codec
+    lz4 = None
+try:
+    import brotli
+except ImportError:  # optional codec
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+RAW = "raw"
+SAMPLE_SIZE = 65536  # bigger blocks are tested for compressibility on a sample first
+MAX_RATIO = 0.9  # store raw if compressed size is above this part of the original
+
+
+class CompressionError(Exception):
+    pass
+
+
+def _codecs() -> dict:
+    """return name -> (compress(data, level), decompress(data)) of available codecs"""
+    codecs = {
+        "zlib": (
+            lambda data, level: zlib.compress(data, 6 if level is None else level),
+            zlib.decompress,
+        ),
+        "lzma": (
+            lambda data, level: lzma.compress(data, preset=6 if level is None else level),
+            lzma.decompress,
+        ),
+        "bz2": (
+            lambda data, level: bz2.compress(data, 9 if level is None else level),
+            bz2.decompress,
+        ),
+    }
+    if zstandard is not None:
+        codecs["zstd"] = (
+            lambda data, level: zstandard.ZstdCompressor(level=3 if level is None else level).compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data),
+        )
+    if lz4 is not None:
+        codecs["lz4"] = (
+            lambda data, level: lz4.frame.compress(data, compression_level=0 if level is None else level),
+            lz4.frame.decompress,
+        )
+    if brotli is not None:
+        codecs["brotli"] = (
+            lambda data, level: brotli.compress(data, quality=5 if level is None else level),
+            brotli.decompress,
+        )
+    return codecs
+
+
+CODECS = _codecs()
+
+
+def check_codec(codec: str) -> None:
+    """raise CompressionError if codec is not usable"""
+    if codec != RAW and codec not in CODECS:
+        raise CompressionError(f"compression codec {codec} is not available, use one of {RAW}, {', '.join(CODECS)}")
+
+
+def compressible(data: bytes) -> bool:
+    """
+    cheap test on a sample, to not waste time compressing random data
+
+    :param data <bytes>: some data
+    :return <bool>: False if the sample is not compressible by fast zlib
+    """
+    if len(data) <= SAMPLE_SIZE:
+        return True
+    offset = (len(data) - SAMPLE_SIZE) // 2  # headers are often compressible
+    sample = bytes(data[offset:offset + SAMPLE_SIZE])
+    return len(zlib.compress(sample, 1)) <= len(sample) * MAX_RATIO
+
+
+def compress(data: bytes, codec: str, level: int = None) -> tuple:
+    """
+    compress data, incompressible data is returned unchanged
+
+    :param data <bytes>: data to compress
+    :param codec <str>: name of codec, raw for no compression
+    :param level <int>: optional codec specific compression level
+    :return <tuple>: name of used codec and compressed data
+    """
+    if codec == RAW or not data or not compressible(data):
+        return RAW, data
+    compressed = CODECS[codec][0](data, level)
+    if len(compressed) > len(data) * MAX_RATIO:
+        return RAW, data
+    return codec, compressed
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """
+    decompress data stored by compress
+
+    :param data <bytes>: compressed data
+    :param codec <str>: name of codec from metadata, None or raw for uncompressed
+    :return <bytes>: original data
+    """
+    if codec is None or codec == RAW:
+        return data
+    if codec not in CODECS:
+        raise CompressionError(f"compression codec {codec} is not available, install its module")
+    return CODECS[codec][1](data)
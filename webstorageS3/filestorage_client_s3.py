@@ -3,16 +3,27 @@
 """
 RestFUL Webclient to use FileStorage WebApp
 """
+import io
 import json
 import logging
+import os
+import threading
+import time
 # import os
 # import sys
-from io import BytesIO
+from collections import deque
+from itertools import islice
 
+from .backends import ObjectNotFound
 from .blockstorage_client_s3 import BlockStorageClient
+from .chunking import FixedChunker, get_chunker
+from .metrics import METRICS
+from .pagecache import drop_behind
+from .recipecache import RecipeCache
 # from .Checksums import Checksums
 # own modules
 from .storageclient_s3 import StorageClient
+from .storedfile import StoredFile
 
 logger = logging.getLogger(__name__)
 
@@ -23,18 +34,37 @@ class FileStorageClient(StorageClient):
     the recipe to reassemble will be stored in FileStorage
     """
 
+    METRICS_NAME = "filestorage"
+
     def __init__(
-        self, cache: bool = True, homepath: str = None, s3_backend: str = "DEFAULT"
+        self,
+        cache: bool = True,
+        homepath: str = None,
+        s3_backend: str = "DEFAULT",
+        workers: int = None,
     ):
         """__init__"""
-        super().__init__(homepath=homepath, s3_backend=s3_backend)
+        super().__init__(homepath=homepath, s3_backend=s3_backend, workers=workers)
         self._bs = BlockStorageClient(
-            cache=cache, homepath=homepath, s3_backend=s3_backend
+            cache=cache, homepath=homepath, s3_backend=s3_backend, workers=self._workers
         )
+        self._max_in_flight = 2 * self._workers  # bounds memory used by put
+        self._inflight = {}  # checksum -> future of recipes not stored yet, in pack mode
+        self._inflight_lock = threading.Lock()
+        self._chunker = get_chunker(self._config, self._bs.blocksize)
+        self._low_impact = self._config.get("LOW_IMPACT", False)  # keep page cache of read files clean
+        # files stored in parallel by archiving tools, one at a time in low impact mode
+        self._file_workers = int(self._config.get("FILE_WORKERS") or (1 if self._low_impact else 4))
         self._bucket_name = self._config["FILESTORAGE_BUCKET_NAME"]
 
         self._check_bucket()
         self._init_cache(cache, "filestorage")
+        recipe_cache_filename = None
+        if cache and self._config.get("RECIPE_CACHE_PERSISTENT", False):
+            recipe_cache_filename = os.path.join(homepath, ".cache", f"{s3_backend}_filestorage_recipes.db")
+        self._recipe_cache = RecipeCache(
+            int(self._config.get("RECIPE_CACHE_SIZE", 1024)), recipe_cache_filename
+        )
 
     @property
     def blockstorage(self):
@@ -47,19 +77,72 @@ class FileStorageClient(StorageClient):
     def cache(self):
         return self._cache
 
-    def put(self, fh, mime_type="application/octet-stream"):
+    @property
+    def file_workers(self):
+        """number of files archiving tools store in parallel, FILE_WORKERS in config"""
+        return self._file_workers
+
+    @property
+    def chunker(self):
+        """splits files into blocks, selected by CHUNKER in config"""
+        return self._chunker
+
+    def flush(self):
+        """store all pending blocks and recipes, in pack mode put does not wait for them"""
+        self._bs.flush()  # recipes are stored after their blocks
+        super().flush()
+        with self._inflight_lock:
+            pending = list(self._inflight.values())
+        for future in pending:
+            future.result()
+
+    def close(self):
+        """write pending cache entries and close cache databases"""
+        self.flush()
+        super().close()
+        self._recipe_cache.close()
+        self._bs.close()
+
+    def purge_cache(self):
+        """delete locally cached checksums and recipes"""
+        super().purge_cache()
+        self._recipe_cache.purge()
+
+    def recipe_cache_stats(self) -> dict:
+        """return hit and miss counters of recipe cache"""
+        return self._recipe_cache.stats()
+
+    def put(self, fh, mime_type="application/octet-stream", journal=None):
         """
         save data of fileobject in Blockstorage
 
-        data is read in blocks
+        data is split into blocks by the configured chunker
         every block will be checksummed and tested if exists against
         BlockStorage
           if not existing, put it into BlockStorage
         the whole file is also checksummed and tested against FileStorage
           if not existing, put it into FileStorage
 
+        blocks are uploaded in parallel by the blockstorage executor,
+        at most 2 * workers blocks are held in memory
+
+        with PACK_THRESHOLD small blocks and recipes are collected in packs,
+        put returns before they are stored, recipes are stored after their
+        blocks, call flush or close before relying on them
+
+        wall time is added to the read, hash and upload phases of METRICS,
+        upload is the time spent waiting for blocks being stored
+
+        with LOW_IMPACT read pages of files are dropped from the page cache
+
+        put may be called by several threads at once, which of them finds a
+        block or recipe existing depends on timing then, with journal the
+        checksums of blocks and recipes stored by this call are recorded,
+        see archiving.StoreJournal
+
         :param fh <filehandle>: to read data from in binary mode
         :param mime_type <str>: defaults to application/octet-stream if not given
+        :param journal <StoreJournal>: records checksums of stored blocks and recipes
         """
         metadata = {
             "blockchain": [],
@@ -68,14 +151,42 @@ class FileStorageClient(StorageClient):
             "mime_type": mime_type,
             "filehash_exists": False,  # indicate if the filehash already
             "blockhash_exists": 0,  # how many blocks existed already
+            "chunker": self._chunker.description,
+            "hash": self._hashname,  # of file and block checksums
         }
+        if self._low_impact:
+            fh = drop_behind(fh)
+        if not isinstance(self._chunker, FixedChunker):  # sizes are not implied
+            metadata["blocksizes"] = []
+        packing = self._pack_threshold > 0
+        if packing:
+            metadata["packed"] = {}  # block checksum -> location in pack
+        packed = set()  # futures of packs with blocks of this file
         filehash = self._hashfunc()
+        pending = deque()  # futures of block uploads, in order of blockchain
+        timings = {"read": 0.0, "hash": 0.0, "upload": 0.0}
+        clock = time.perf_counter()
         # Put blocks in Blockstorage
-        data = fh.read(self._bs.blocksize)
-        while data:
+        for data in self._chunker.chunks(fh):
+            now = time.perf_counter()
+            timings["read"] += now - clock
             metadata["size"] += len(data)
             filehash.update(data)  # running filehash until end
-            checksum, status = self._bs.put(data, use_cache=True)
+            checksum, status, future = self._bs.submit(data, journal)  # digest of block, upload in background
+            clock = time.perf_counter()
+            timings["hash"] += clock - now
+            location = self._bs._locate(checksum) if packing and len(data) < self._pack_threshold else None
+            if location is not None:  # packs are not waited for, they are uploaded if full
+                metadata["packed"][checksum] = location
+                if future is not None:
+                    packed.add(future)
+            elif future is not None:
+                pending.append(future)
+                while len(pending) >= self._max_in_flight:
+                    pending.popleft().result()  # raises exception of upload
+                now = time.perf_counter()
+                timings["upload"] += now - clock
+                clock = now
             logger.debug(
                 "PUT blockcount: %d, checksum: %s, status: %s",
                 len(metadata["blockchain"]),
@@ -86,7 +197,15 @@ class FileStorageClient(StorageClient):
             if status in (201, 202):
                 metadata["blockhash_exists"] += 1
             metadata["blockchain"].append(checksum)
-            data = fh.read(self._bs.blocksize)
+            if "blocksizes" in metadata:
+                metadata["blocksizes"].append(len(data))
+        now = time.perf_counter()
+        timings["read"] += now - clock  # end of file detected
+        while pending:  # all blocks have to be stored, before storing the recipe
+            pending.popleft().result()
+        timings["upload"] += time.perf_counter() - now
+        for name, seconds in timings.items():
+            METRICS.add_phase(name, seconds)
         logger.debug(
             "put %d blocks in BlockStorage, %d existed already",
             len(metadata["blockchain"]),
@@ -95,14 +214,57 @@ class FileStorageClient(StorageClient):
         # put file composition into filestorage
         filedigest = filehash.hexdigest()
         metadata["checksum"] = filedigest
+        if packing:
+            return self._submit_recipe(metadata, list(packed), journal)
         if filedigest not in self._cache:  # check if filehash is already stored
+            METRICS.count(self.METRICS_NAME, "cache_miss")
             logger.debug("storing recipe for filechecksum: %s", filedigest)
+            if journal is not None:  # before the recipe is in cache
+                journal.add_recipe(filedigest)
             self._put(filedigest, metadata)
             return metadata
+        METRICS.count(self.METRICS_NAME, "cache_hit")
         logger.debug("filehash %s already stored", filedigest)
         metadata["filehash_exists"] = True
         return metadata
 
+    def _submit_recipe(self, metadata: dict, depends: list, journal=None) -> dict:
+        """
+        store recipe in background after its blocks, used in pack mode
+
+        small recipes are packed, others are stored as single objects
+
+        :param metadata <dict>: recipe of file
+        :param depends <list>: futures of packs with blocks of this file
+        :param journal <StoreJournal>: checksum of stored recipe is recorded by journal.add_recipe
+        :return <dict>: metadata
+        """
+        filedigest = metadata["checksum"]
+        with self._inflight_lock:
+            if filedigest in self._cache or filedigest in self._inflight:
+                logger.debug("filehash %s already stored", filedigest)
+                metadata["filehash_exists"] = True
+                return metadata
+            if self._locate(filedigest) is not None:
+                metadata["filehash_exists"] = True
+                return metadata
+            logger.debug("storing recipe for filechecksum: %s", filedigest)
+            recipe = json.dumps(metadata).encode("utf-8")
+            if len(recipe) < self._pack_threshold:
+                future = self._submit_packed(filedigest, recipe, depends=depends)[0]
+            else:
+                future = self._after(depends, self._put, filedigest, metadata)
+            self._inflight[filedigest] = future
+            if journal is not None:
+                journal.add_recipe(filedigest)
+        future.add_done_callback(lambda _: self._recipe_done(filedigest))
+        return metadata
+
+    def _recipe_done(self, checksum: str) -> None:
+        """called if background storing of recipe is finished, successful or not"""
+        with self._inflight_lock:
+            self._inflight.pop(checksum, None)
+
     def _put(self, checksum: str, data: dict) -> tuple:
         """
         put some arbitrary data into storage
@@ -114,37 +276,89 @@ class FileStorageClient(StorageClient):
                 "202 - skip this block, checksum is in list of cached checksums"
             )
             return checksum, 202
-        self._client.upload_fileobj(
-            BytesIO(json.dumps(data).encode("utf-8")), self._bucket_name, checksum
-        )  # TODO: exceptions
-        self._cache.add(checksum)  # add to local cache
+        self._put_object(checksum, json.dumps(data).encode("utf-8"))
+        self._remember([checksum])  # add to local cache
+        self._filter_add(checksum)
         return checksum, 200  # fake
 
-    def read(self, checksum: str):
+    def read(self, checksum: str, window: int = None):
         """
         return data as generator
-        yields data blocks of self.blocksize
+        yields data blocks as stored, of self.blocksize for fixed size chunking
         the last block is almost all times less than self.blocksize
+
+        the next window blocks are downloaded in parallel, so at most
+        window + 1 blocks are held in memory
+
         :param checksum <str>: hexdigest of checksum
+        :param window <int>: number of blocks to read ahead, defaults to workers
+        """
+        if window is None:
+            window = self._workers
+        recipe = self.get(checksum)
+        packed = recipe.get("packed", {})  # locations of packed blocks
+        blocks = iter(recipe["blockchain"])
+        pending = deque(
+            self._bs.executor.submit(self._bs.get, block, location=packed.get(block))
+            for block in islice(blocks, max(window, 1))
+        )
+        try:
+            while pending:
+                data = pending.popleft().result()
+                for block in islice(blocks, 1):  # keep read-ahead window filled
+                    pending.append(self._bs.executor.submit(self._bs.get, block, location=packed.get(block)))
+                yield data
+        finally:  # generator closed before end, do not download the rest
+            for future in pending:
+                future.cancel()
+
+    def open(self, checksum: str, buffering: int = io.DEFAULT_BUFFER_SIZE, cache_blocks: int = 4):
         """
-        for block in self.get(checksum)["blockchain"]:
-            yield self._bs.get(block)
+        return seekable read only file object of stored file
+
+        only blocks covering the read ranges are downloaded, usable with
+        tarfile, zipfile or anything else expecting a binary file
+
+        :param checksum <str>: hexdigest of file
+        :param buffering <int>: size of read buffer, 0 for unbuffered StoredFile
+        :param cache_blocks <int>: number of blocks kept in memory
+        :return <io.BufferedReader>: or StoredFile if buffering is 0
+        """
+        raw = StoredFile(self, self.get(checksum), cache_blocks)
+        if buffering == 0:
+            return raw
+        return io.BufferedReader(raw, buffer_size=buffering)
 
     def get(self, checksum: str) -> str:
         """
         returns blockchain of file defined by hexdigest
 
         this is not the data of this file, only the plan how to assemble the file
+        recipes are cached, RECIPE_CACHE_SIZE in memory and with
+        RECIPE_CACHE_PERSISTENT all in .cache, the returned dict is a copy,
+        but its lists are shared with the cache and must not be changed
 
         :param checksum <str>: hexdigest of checksum
         """
-        b_buffer = BytesIO()
-        self._client.download_fileobj(
-            self._bucket_name, checksum, b_buffer
-        )  # TODO: exceptions
-        b_buffer.seek(0)  # do not forget this tiny little line !!
-        data = b_buffer.read().decode("utf-8")
-        return json.loads(data)
+        recipe = self._recipe_cache.get(checksum)
+        METRICS.count(self.METRICS_NAME, "recipe_cache_miss" if recipe is None else "recipe_cache_hit")
+        if recipe is None:
+            raw = self._get_recipe(checksum)
+            recipe = json.loads(raw)
+            self._recipe_cache.add(checksum, recipe, raw)
+        return dict(recipe)
+
+    def _get_recipe(self, checksum: str) -> bytes:
+        """download recipe as stored, from single object or pack"""
+        location = self._locate(checksum)
+        if location is None:
+            try:
+                return self._get_object(checksum)
+            except ObjectNotFound as exc:
+                location = self._locate(checksum, sync=True)
+                if location is None:
+                    raise exc
+        return self._get_packed(location)
 
     def exists(self, checksum: str) -> bool:
         """
@@ -152,4 +366,30 @@ class FileStorageClient(StorageClient):
 
         :param checksum <str>: hexdigest of checksum
         """
-        return self._exists(checksum)
+        if self._locate(checksum) is not None:
+            return True
+        return self._exists_filtered(checksum) or self._locate(checksum, sync=True) is not None
+
+    def exists_many(self, checksums) -> list:
+        """
+        return checksums not existing in FileStorage
+
+        checksums found in local cache are not checked against S3,
+        found checksums are added to local cache
+
+        :param checksums <iterable>: hexdigests of checksums
+        :return <list>: missing checksums
+        """
+        checksums = list(dict.fromkeys(checksums))
+        unknown = [
+            checksum
+            for checksum, known in zip(checksums, self._cache.contains_many(checksums))
+            if not known
+        ]
+        missing = [
+            checksum
+            for checksum in self._exists_many(unknown)
+            if self._locate(checksum, sync=True) is None
+        ]
+        self._remember(set(unknown).difference(missing))
+        return missing
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+"""
+process wide counters and latency histograms of storage operations
+
+every storage client records its backend operations (put, get, head,
+list, ...) with latency and bytes, caches record hits and misses, the
+command line tools record wall time per phase; the collected values are
+exported as json summary or as prometheus textfile for node exporter
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of latency histogram buckets in seconds, like prometheus defaults
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """latency histogram with fixed buckets"""
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction: float) -> float:
+        """return upper bound of bucket holding fraction of observations"""
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted and count:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return 0.0
+
+
+class Metrics:
+    """thread safe registry of histograms, counters and phase times"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms = {}  # (client, operation) -> Histogram
+        self._counters = {}  # (client, name) -> value
+        self._phases = {}  # name -> seconds
+        self._started = time.time()
+
+    def observe(self, client: str, operation: str, seconds: float, size: int = None) -> None:
+        """
+        record one operation
+
+        :param client <str>: kind of client, e.g. blockstorage
+        :param operation <str>: name of operation, e.g. put
+        :param seconds <float>: latency of operation
+        :param size <int>: optional number of transferred bytes
+        """
+        with self._lock:
+            histogram = self._histograms.get((client, operation))
+            if histogram is None:
+                histogram = self._histograms[(client, operation)] = Histogram()
+            histogram.observe(seconds)
+            if size is not None:
+                key = (client, f"{operation}_bytes")
+                self._counters[key] = self._counters.get(key, 0) + size
+
+    def count(self, client: str, name: str, value: int = 1) -> None:
+        """add value to counter, e.g. cache_hit"""
+        with self._lock:
+            self._counters[(client, name)] = self._counters.get((client, name), 0) + value
+
+    @contextlib.contextmanager
+    def timer(self, client: str, operation: str):
+        """context manager to record latency of operation, also if it fails"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(client, operation, time.perf_counter() - start)
+
+    def timed_iter(self, client: str, operation: str, iterable):
+        """generator of items of iterable, time spent producing them is recorded once"""
+        iterator = iter(iterable)
+        spent = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    spent += time.perf_counter() - start
+                    return
+                spent += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe(client, operation, spent)
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """add seconds to wall time of phase"""
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """context manager to add wall time of block to phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        """return all values as json serializable dict"""
+        with self._lock:
+            operations = {
+                f"{client}.{operation}": {
+                    "count": histogram.count,
+                    "sum_s": histogram.sum,
+                    "mean_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                    "p50_ms": histogram.quantile(0.5) * 1000,
+                    "p99_ms": histogram.quantile(0.99) * 1000,
+                    "max_ms": histogram.max * 1000,
+                }
+                for (client, operation), histogram in sorted(self._histograms.items())
+            }
+            counters = {f"{client}.{name}": value for (client, name), value in sorted(self._counters.items())}
+            phases = dict(self._phases)
+        return {
+            "started": self._started,
+            "duration_s": time.time() - self._started,
+            "operations": operations,
+            "counters": counters,
+            "phases_s": phases,
+        }
+
+    def prometheus(self, prefix: str = "webstorage") -> str:
+        """return all values in prometheus text exposition format"""
+        lines = [
+            f"# HELP {prefix}_operation_seconds latency of storage operations",
+            f"# TYPE {prefix}_operation_seconds histogram",
+        ]
+        with self._lock:
+            for (client, operation), histogram in sorted(self._histograms.items()):
+                labels = f'client="{client}",operation="{operation}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_operation_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{prefix}_operation_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{prefix}_operation_seconds_count{{{labels}}} {histogram.count}")
+            lines.append(f"# HELP {prefix}_events_total counted events and transferred bytes")
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for (client, name), value in sorted(self._counters.items()):
+                lines.append(f'{prefix}_events_total{{client="{client}",name="{name}"}} {value}')
+            lines.append(f"# HELP {prefix}_phase_seconds wall time per phase of last run")
+            lines.append(f"# TYPE {prefix}_phase_seconds gauge")
+            for name, seconds in sorted(self._phases.items()):
+                lines.append(f'{prefix}_phase_seconds{{phase="{name}"}} {seconds}')
+        lines.append(f"# HELP {prefix}_last_run_timestamp_seconds end of last run")
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {time.time()}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, filename: str) -> None:
+        """write summary as json, - for stdout"""
+        text = json.dumps(self.summary(), indent=2)
+        if filename == "-":
+            print(text)
+            return
+        with open(filename, "wt", encoding="utf8") as outfile:
+            outfile.write(text)
+
+    def write_textfile(self, filename: str) -> None:
+        """write prometheus textfile atomically, node exporter never reads partial files"""
+        tmpname = f"{filename}.{os.getpid()}.tmp"
+        with open(tmpname, "wt", encoding="utf8") as outfile:
+            outfile.write(self.prometheus())
+        os.replace(tmpname, filename)
+
+    def export(self, filename: str = None, textfile: str = None) -> None:
+        """
+        write json summary and prometheus textfile, used at end of command line tools
+
+        :param filename <str>: json summary, - for stdout, None to skip
+        :param textfile <str>: prometheus textfile, None to skip
+        """
+        if filename is not None:
+            self.write_json(filename)
+        if textfile is not None:
+            self.write_textfile(textfile)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._phases.clear()
+            self._started = time.time()
+
+
+METRICS = Metrics()  # used by all clients of this process
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+"""
+persistent set of checksums as memory mapped sorted digest file
+"""
+import heapq
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+
+from .checksums import DigestIndex, _open_instances, numpy, to_digest
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class MmapChecksums:
+    """
+    storing persistent set in a sorted file of binary digests
+
+    <basename>.idx holds sorted digests of width bytes back to back, it is opened
+    with mmap and searched by binary search, so startup does not depend on
+    the number of known checksums
+    <basename>.delta holds new digests in order of arrival, it is merged
+    into the sorted file if it grows above MERGE_SIZE entries
+
+    same interface as Checksums, new checksums are appended to delta in
+    batches like Checksums in write behind mode
+    """
+
+    MERGE_SIZE = 262144  # maximum number of digests in delta file
+    FLUSH_SIZE = 1000  # maximum number of unwritten checksums
+    FLUSH_INTERVAL = 5.0  # maximum age of unwritten checksums in seconds
+
+    def __init__(self, basename: str, width: int = 20) -> None:
+        """
+        :param basename <str>: path of files without extension
+        :param width <int>: length of digests in bytes, 20 for sha1
+        """
+        self._width = width
+        self._filename = f"{basename}.idx"
+        self._delta_filename = f"{basename}.delta"
+
+        self._index = None  # DigestIndex on mapped sorted file, set on first use
+        self._mmap = None
+        self._delta = set()  # digests in delta file or unwritten
+        self._unwritten = []  # digests not yet appended to delta file
+        self._flushed = time.monotonic()  # time of last flush
+        self._lock = threading.Lock()
+
+    def __contains__(self, checksum: str) -> bool:
+        digest = to_digest(checksum, self._width)
+        if digest is None:
+            return False
+        if self._index is None:
+            self._open()
+        return digest in self._delta or digest in self._index
+
+    def __iter__(self):
+        if self._index is None:
+            self._open()
+        for digest in self._index:
+            yield digest.hex()
+        for digest in list(self._delta):
+            yield digest.hex()
+
+    def __len__(self) -> int:
+        if self._index is None:
+            self._open()
+        return len(self._index) + len(self._delta)
+
+    def _open(self) -> None:
+        with self._lock:
+            if self._index is not None:  # opened by other thread meanwhile
+                return
+            self._map()
+            if os.path.isfile(self._delta_filename):
+                with open(self._delta_filename, "rb") as infile:
+                    data = infile.read()
+                for offset in range(0, len(data) - len(data) % self._width, self._width):
+                    digest = data[offset:offset + self._width]
+                    if digest not in self._index:  # delta could be merged already
+                        self._delta.add(digest)
+            _open_instances.add(self)
+            logger.info(f"using {len(self._index)} checksums from {self._filename}, {len(self._delta)} from delta")
+
+    def _unmap(self, close: bool = True) -> None:
+        """
+        release mapped file, lock must be held
+
+        :param close <bool>: close map at once, otherwise it is closed
+          if the last reader releases it
+        """
+        if self._mmap is not None and close:
+            try:
+                self._mmap.close()
+            except BufferError:  # still used by some reader, closed if released
+                pass
+        self._mmap = None
+
+    def _map(self) -> None:
+        """map sorted file into memory, lock must be held"""
+        if os.path.isfile(self._filename) and os.path.getsize(self._filename) > 0:
+            with open(self._filename, "rb") as infile:
+                self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index = DigestIndex(self._width, self._mmap)
+        else:
+            self._index = DigestIndex(self._width)
+
+    def _flush_due(self) -> bool:
+        """True if unwritten digests have to be appended now, lock must be held"""
+        return len(self._unwritten) >= self.FLUSH_SIZE or time.monotonic() - self._flushed >= self.FLUSH_INTERVAL
+
+    def _flush(self) -> None:
+        """append unwritten digests to delta file, lock must be held"""
+        if self._unwritten:
+            with METRICS.timer("checksums", "commit"):
+                with open(self._delta_filename, "ab") as outfile:
+                    outfile.write(b"".join(self._unwritten))
+        self._unwritten = []
+        self._flushed = time.monotonic()
+        if len(self._delta) >= self.MERGE_SIZE:
+            self._merge()
+
+    def _merge(self) -> None:
+        """merge delta into new sorted file, lock must be held"""
+        logger.info(f"merging {len(self._delta)} checksums into {self._filename}")
+        start = time.perf_counter()
+        tempname = f"{self._filename}.tmp"
+        with open(tempname, "wb") as outfile:
+            self._write_merged(outfile, self._mmap if self._mmap is not None else b"", sorted(self._delta))
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        self._unmap(close=os.name == "nt")  # windows is not able to replace a mapped file
+        os.replace(tempname, self._filename)
+        self._map()
+        with open(self._delta_filename, "wb"):  # truncate
+            pass
+        self._delta = set()
+        METRICS.observe("checksums", "merge", time.perf_counter() - start)
+
+    def _write_merged(self, outfile, buffer, delta: list) -> None:
+        """write sorted digests of buffer and delta to outfile"""
+        if numpy is not None:
+            dtype = f"S{self._width}"
+            known = numpy.frombuffer(buffer, dtype=dtype)
+            pending = numpy.array(delta, dtype=dtype)
+            numpy.insert(known, numpy.searchsorted(known, pending), pending).tofile(outfile)
+        else:
+            width = self._width
+            known = (buffer[offset:offset + width] for offset in range(0, len(buffer), width))
+            for digest in heapq.merge(known, delta):
+                outfile.write(digest)
+
+    def flush(self) -> None:
+        """append all unwritten checksums to delta file"""
+        with self._lock:
+            self._flush()
+
+    def merge(self) -> None:
+        """write unwritten checksums and merge delta into sorted file"""
+        if self._index is None:
+            self._open()
+        with self._lock:
+            self._flush()
+            if self._delta:
+                self._merge()
+
+    def close(self) -> None:
+        """flush and unmap, will be reopened on next use"""
+        with self._lock:
+            self._flush()
+            self._unmap()
+            self._index = None
+            self._delta = set()
+            _open_instances.discard(self)
+
+    def contains_many(self, checksums: list) -> list:
+        """
+        bulk membership test, e.g. for the blockchain of a recipe
+
+        :param checksums <list>: checksums to look for
+        :return <list>: of bool, True if checksum at this position is known
+        """
+        if self._index is None:
+            self._open()
+        digests = [to_digest(checksum, self._width) for checksum in checksums]
+        found = iter(self._index.contains_many([digest for digest in digests if digest]))
+        return [digest is not None and (next(found) or digest in self._delta) for digest in digests]
+
+    def update(self, checksums) -> None:
+        """
+        import some list of checksums
+        :param checksums <list>:
+        """
+        if self._index is None:
+            self._open()
+        with self._lock:
+            for checksum in checksums:
+                digest = to_digest(checksum, self._width)
+                if digest is None:
+                    raise AttributeError(f"checksums are always {2 * self._width} characters long")
+                if digest not in self._delta and digest not in self._index:
+                    self._delta.add(digest)
+                    self._unwritten.append(digest)
+            if self._flush_due():
+                self._flush()
+
+    def add(self, checksum: str) -> None:
+        """
+        add single checksum
+        :param checksum <str>: checksum to store
+        """
+        digest = to_digest(checksum, self._width)
+        if digest is None:
+            raise AttributeError(f"checksums are always {2 * self._width} characters long")
+        if self._index is None:
+            self._open()
+        with self._lock:
+            if digest in self._delta or digest in self._index:
+                return
+            self._delta.add(digest)
+            self._unwritten.append(digest)
+            if self._flush_due():
+                self._flush()
+
+    @classmethod
+    def migrate(cls, database: str, basename: str) -> None:
+        """
+        convert sqlite database of Checksums into sorted digest file
+
+        :param database <str>: existing sqlite database, e.g. DEFAULT_blockstorage.db
+        :param basename <str>: path of new files without extension
+        """
+        logger.info(f"migrating checksums from {database} to {basename}.idx")
+        tempname = f"{basename}.idx.tmp"
+        con = sqlite3.connect(database)
+        try:
+            with open(tempname, "wb") as outfile:
+                # sorted by unique index, hex order is the same as binary order
+                for entry in con.execute("SELECT checksum FROM tbl_checksums ORDER BY checksum"):
+                    outfile.write(bytes.fromhex(entry[0]))
+        finally:
+            con.close()
+        os.replace(tempname, f"{basename}.idx")
@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+"""
+packing small objects into larger pack objects
+
+a pack object packs/<id> holds the data of many small objects back to back,
+packs/<id>.idx holds a json list of [key, offset, length, codec] of every
+object in it, so packed objects are read with ranged GETs
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "packs/"  # keys of pack objects and their indexes start with this
+INDEX_SUFFIX = ".idx"
+
+
+class Pack:
+    """pack object being filled, uploaded if full or flushed"""
+
+    def __init__(self) -> None:
+        self.id = uuid.uuid4().hex
+        self.buffer = bytearray()
+        self.entries = []  # [key, offset, length, codec] of every packed object
+        self.locations = {}  # key -> location of packed objects
+        self.depends = []  # futures to wait for before upload
+        self.future = Future()  # done if pack and index are uploaded
+
+    @property
+    def key(self) -> str:
+        return f"{PREFIX}{self.id}"
+
+    @property
+    def index_key(self) -> str:
+        return f"{PREFIX}{self.id}{INDEX_SUFFIX}"
+
+    def add(self, key: str, payload: bytes, codec: str) -> list:
+        """
+        append payload of object
+
+        :param key <str>: key of object
+        :param payload <bytes>: data as stored, possibly compressed
+        :param codec <str>: compression codec of payload
+        :return <list>: location of object [pack, offset, length, codec]
+        """
+        location = [self.id, len(self.buffer), len(payload), codec]
+        self.buffer += payload
+        self.entries.append([key] + location[1:])
+        self.locations[key] = location
+        return location
+
+    def read(self, offset: int, length: int) -> bytes:
+        return bytes(self.buffer[offset:offset + length])
+
+    def index(self) -> bytes:
+        """json index of pack, stored as packs/<id>.idx"""
+        return json.dumps(self.entries).encode("utf-8")
+
+
+class PackIndex:
+    """
+    persistent map of packed keys to their location
+
+    stored in sqlite database like Checksums, opened on first use,
+    without filename only held in memory
+    """
+
+    def __init__(self, filename: str = None) -> None:
+        self._filename = filename
+        self._locations = {}  # key -> location, used without database
+        self._packs = set()  # ids of known packs, used without database
+        self._con = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> None:
+        """connect to database, lock must be held"""
+        if self._con is None and self._filename is not None:
+            self._con = sqlite3.connect(self._filename, check_same_thread=False)
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("PRAGMA synchronous=NORMAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS tbl_packed(key TEXT PRIMARY KEY, pack TEXT, offset INTEGER, length INTEGER, codec TEXT)"
+            )
+            self._con.execute("CREATE TABLE IF NOT EXISTS tbl_packs(pack TEXT PRIMARY KEY)")
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self):
+        with self._lock:
+            self._open()
+            if self._con is None:
+                keys = list(self._locations)
+            else:
+                keys = [entry[0] for entry in self._con.execute("SELECT key FROM tbl_packed")]
+        return iter(keys)
+
+    def get(self, key: str) -> list:
+        """
+        :param key <str>: key of packed object
+        :return <list>: location [pack, offset, length, codec] or None
+        """
+        with self._lock:
+            self._open()
+            if self._con is None:
+                return self._locations.get(key)
+            entry = self._con.execute(
+                "SELECT pack, offset, length, codec FROM tbl_packed WHERE key=?", (key,)
+            ).fetchone()
+        return list(entry) if entry else None
+
+    def packs(self) -> set:
+        """return ids of known packs"""
+        with self._lock:
+            self._open()
+            if self._con is None:
+                return set(self._packs)
+            return {entry[0] for entry in self._con.execute("SELECT pack FROM tbl_packs")}
+
+    def add_pack(self, pack_id: str, entries: list) -> None:
+        """
+        remember all objects of uploaded pack
+
+        :param pack_id <str>: id of pack
+        :param entries <list>: of [key, offset, length, codec]
+        """
+        with self._lock:
+            self._open()
+            if self._con is None:
+                for key, offset, length, codec in entries:
+                    self._locations[key] = [pack_id, offset, length, codec]
+                self._packs.add(pack_id)
+                return
+            self._con.executemany(
+                "INSERT OR IGNORE INTO tbl_packed VALUES(?, ?, ?, ?, ?)",
+                ((key, pack_id, offset, length, codec) for key, offset, length, codec in entries),
+            )
+            self._con.execute("INSERT OR IGNORE INTO tbl_packs VALUES(?)", (pack_id,))
+            self._con.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    def purge(self) -> None:
+        """close and remove database"""
+        self.close()
+        if self._filename is not None:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.isfile(f"{self._filename}{suffix}"):
+                    os.unlink(f"{self._filename}{suffix}")
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+"""
+reading files without pushing other data out of the page cache
+
+a backup reads every file once, so its pages are of no use afterwards,
+but would evict the hot pages of other processes, e.g. databases;
+with posix_fadvise the kernel is told to read ahead sequentially and to
+drop the pages already read, on platforms without posix_fadvise files
+are read as usual
+"""
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DROP_INTERVAL = 8 * 1024 * 1024  # bytes read between dropping pages
+
+
+class DropBehindReader:
+    """file object wrapper dropping read pages from page cache"""
+
+    def __init__(self, fh, fd: int) -> None:
+        """
+        :param fh <filehandle>: opened in binary mode
+        :param fd <int>: file descriptor of fh
+        """
+        self._fh = fh
+        self._fd = fd
+        self._position = fh.tell()
+        self._dropped = self._position  # pages before this offset are dropped
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fh.read(size)
+        self._position += len(data)
+        if not data or self._position - self._dropped >= DROP_INTERVAL:
+            self._drop()
+        return data
+
+    def _drop(self) -> None:
+        if self._position > self._dropped:
+            os.posix_fadvise(self._fd, self._dropped, self._position - self._dropped, os.POSIX_FADV_DONTNEED)
+            self._dropped = self._position
+
+    def close(self) -> None:
+        self._drop()
+        self._fh.close()
+
+    def __getattr__(self, name):
+        return getattr(self._fh, name)
+
+
+def drop_behind(fh):
+    """
+    return fh wrapped by DropBehindReader, or fh if not supported
+
+    :param fh <filehandle>: opened in binary mode, on a regular file
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return fh
+    try:
+        return DropBehindReader(fh, fh.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):  # e.g. in memory, tarfile member or pipe
+        return fh
@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+"""
+profiling of the command line tools, enabled by --profile
+
+  cprofile      deterministic profile of the whole run, FILE is written in
+                pstats format, e.g. for python3 -m pstats FILE or snakeviz,
+                threads started while profiling (file workers, uploads)
+                get a profiler of their own, merged into FILE at the end
+  sample        stacks of all threads are sampled every interval seconds by
+                a background thread, FILE holds collapsed stacks for
+                flamegraph.pl or speedscope, the overhead is small enough to
+                leave it enabled on production hosts
+
+with memory tracemalloc is started too, at every checkpoint the tools pass
+(e.g. after walking and after saving the archive) the largest allocation
+sites and their growth since the last checkpoint are written to FILE.memory
+"""
+import argparse
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample")
+DEFAULT_INTERVAL = 0.01  # seconds between samples
+TOP_ALLOCATIONS = 20  # allocation sites per memory checkpoint
+
+_active = None  # Profiler running in this process
+
+
+class Sampler:
+    """collects stacks of all threads in a background thread"""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL) -> None:
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()  # collapsed stack -> number of samples
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="webstorage-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:  # functions only, so samples of one function add up
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """stacks in collapsed format, one line 'frame;frame;frame count' per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+class Profiler:
+    """cpu and optional memory profile of one run"""
+
+    def __init__(
+        self,
+        filename: str,
+        mode: str = "cprofile",
+        memory: bool = False,
+        interval: float = DEFAULT_INTERVAL,
+    ) -> None:
+        """
+        :param filename <str>: where to write the profile
+        :param mode <str>: cprofile or sample
+        :param memory <bool>: also trace memory allocations with tracemalloc
+        :param interval <float>: seconds between samples in sample mode
+        """
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode {mode}, use one of {', '.join(MODES)}")
+        self.filename = filename
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval
+        self._profile = None
+        self._thread_profiles = []  # of threads started while profiling in cprofile mode
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._snapshot = None  # of last memory checkpoint
+        self._report = []  # lines of memory report
+        self._started = None
+
+    def start(self) -> None:
+        global _active  # pylint: disable=global-statement
+        self._started = time.perf_counter()
+        if self.memory:
+            tracemalloc.start(25)
+            self._snapshot = tracemalloc.take_snapshot()
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            if sys.version_info < (3, 12):  # profilers are per thread, later versions see all threads
+                threading.setprofile(self._profile_thread)
+            self._profile.enable()
+        else:
+            self._sampler = Sampler(self.interval)
+            self._sampler.start()
+        _active = self
+
+    def _profile_thread(self, *_args) -> None:
+        """first profile event of a new thread, replaced by a profiler of this thread"""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def _stats(self) -> pstats.Stats:
+        """stats of main thread and all profiled threads"""
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            profiles, self._thread_profiles = self._thread_profiles, []
+        for profile in profiles:
+            profile.disable()
+            try:
+                stats.add(profile)
+            except TypeError:  # nothing called in this thread
+                pass
+        return stats
+
+    def checkpoint(self, name: str) -> None:
+        """
+        record memory usage at end of a phase, if memory is traced
+
+        :param name <str>: name of finished phase
+        """
+        if not self.memory:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        self._report.append(
+            f"## {name} after {time.perf_counter() - self._started:.2f} s, "
+            f"current {current / 1048576:.1f} MiB, peak {peak / 1048576:.1f} MiB"
+        )
+        self._report.append("largest allocation sites")
+        self._report.extend(str(stat) for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS])
+        self._report.append("growth since last checkpoint")
+        self._report.extend(str(stat) for stat in snapshot.compare_to(self._snapshot, "lineno")[:TOP_ALLOCATIONS])
+        self._report.append("")
+        self._snapshot = snapshot
+        tracemalloc.reset_peak()
+
+    def stop(self) -> None:
+        """stop profiling and write results"""
+        global _active  # pylint: disable=global-statement
+        _active = None
+        if self._profile is not None:
+            threading.setprofile(None)
+            self._profile.disable()
+            stats = self._stats()
+            stats.dump_stats(self.filename)
+            output = io.StringIO()
+            stats.stream = output
+            stats.sort_stats("cumulative").print_stats(15)
+            logger.debug(output.getvalue())
+        if self._sampler is not None:
+            self._sampler.stop()
+            with open(self.filename, "wt", encoding="utf8") as outfile:
+                outfile.write(self._sampler.collapsed())
+        logger.info(f"profile written to {self.filename}")
+        if self.memory:
+            self.checkpoint("end")
+            tracemalloc.stop()
+            with open(f"{self.filename}.memory", "wt", encoding="utf8") as outfile:
+                outfile.write("\n".join(self._report))
+            logger.info(f"memory profile written to {self.filename}.memory")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class _NoProfiler:
+    """used if --profile is not given"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+def checkpoint(name: str) -> None:
+    """record memory usage at end of phase name, if a profiler with memory is running"""
+    if _active is not None:
+        _active.checkpoint(name)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """add --profile options to parser of a command line tool"""
+    group = parser.add_argument_group("profiling")
+    group.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="write cpu profile of this run to FILE",
+    )
+    group.add_argument(
+        "--profile-mode",
+        choices=MODES,
+        default="cprofile",
+        help="cprofile for pstats output, sample for cheap sampling to collapsed stacks",
+    )
+    group.add_argument(
+        "--profile-interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="seconds between samples in sample mode",
+    )
+    group.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="also trace memory allocations per phase to FILE.memory, slows down the run",
+    )
+
+
+def from_args(args: argparse.Namespace):
+    """return context manager profiling the run as requested by args"""
+    if not args.profile:
+        return _NoProfiler()
+    return Profiler(args.profile, args.profile_mode, args.profile_memory, args.profile_interval)
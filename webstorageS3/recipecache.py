@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+"""
+cache of recipes read from FileStorage
+
+recipes are content addressed and never change, so they are cached
+without expiry, the last used in memory and optionally all in a
+sqlite database like Checksums
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_open_instances = weakref.WeakSet()  # RecipeCaches with possibly unwritten rows
+
+
+@atexit.register
+def _close_all() -> None:
+    """guaranteed flush of unwritten recipes on exit"""
+    for cache in list(_open_instances):
+        cache.close()
+
+
+class RecipeCache:
+    """
+    in memory LRU of parsed recipes, in front of an optional persistent database
+
+    new recipes are written to the database in batches, at least every
+    FLUSH_SIZE recipes or FLUSH_INTERVAL seconds, on close and on exit
+    """
+
+    FLUSH_SIZE = 100  # maximum number of unwritten recipes
+    FLUSH_INTERVAL = 5.0  # maximum age of unwritten recipes in seconds
+
+    def __init__(self, max_entries: int = 1024, filename: str = None) -> None:
+        """
+        :param max_entries <int>: number of recipes held in memory
+        :param filename <str>: sqlite database to store all recipes, None for memory only
+        """
+        self._max_entries = max_entries
+        self._filename = filename
+        self._recipes = OrderedDict()  # checksum -> recipe, least recently used first
+        self._con = None
+        self._unwritten = []  # (checksum, recipe as json) not yet written to database
+        self._flushed = time.monotonic()  # time of last flush
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "persistent_hits": 0, "misses": 0}
+
+    def _open(self) -> None:
+        """connect to database, lock must be held"""
+        if self._con is None and self._filename is not None:
+            self._con = sqlite3.connect(self._filename, check_same_thread=False)
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("PRAGMA synchronous=NORMAL")
+            self._con.execute("CREATE TABLE IF NOT EXISTS tbl_recipes(checksum TEXT PRIMARY KEY, recipe TEXT)")
+            _open_instances.add(self)
+
+    def _flush(self) -> None:
+        """write unwritten recipes in one transaction, lock must be held"""
+        if self._unwritten and self._con is not None:
+            self._con.executemany("INSERT OR IGNORE INTO tbl_recipes VALUES(?, ?)", self._unwritten)
+            self._con.commit()
+        self._unwritten = []
+        self._flushed = time.monotonic()
+
+    def _remember(self, checksum: str, recipe: dict) -> None:
+        """add to memory, lock must be held"""
+        self._recipes[checksum] = recipe
+        self._recipes.move_to_end(checksum)
+        while len(self._recipes) > self._max_entries:
+            self._recipes.popitem(last=False)
+
+    def get(self, checksum: str) -> dict:
+        """
+        :param checksum <str>: hexdigest of file
+        :return <dict>: cached recipe, shared with other callers, or None
+        """
+        with self._lock:
+            recipe = self._recipes.get(checksum)
+            if recipe is not None:
+                self._recipes.move_to_end(checksum)
+                self._stats["hits"] += 1
+                return recipe
+            self._open()
+            entry = None
+            if self._con is not None:
+                self._flush()  # could be evicted from memory already
+                entry = self._con.execute("SELECT recipe FROM tbl_recipes WHERE checksum=?", (checksum,)).fetchone()
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            recipe = json.loads(entry[0])
+            self._stats["persistent_hits"] += 1
+            if self._max_entries > 0:
+                self._remember(checksum, recipe)
+            return recipe
+
+    def add(self, checksum: str, recipe: dict, raw: bytes = None) -> None:
+        """
+        :param checksum <str>: hexdigest of file
+        :param recipe <dict>: parsed recipe
+        :param raw <bytes>: recipe as stored, to not serialize it again
+        """
+        with self._lock:
+            if self._max_entries > 0:
+                self._remember(checksum, recipe)
+            self._open()
+            if self._con is not None:
+                text = bytes(raw).decode("utf-8") if raw is not None else json.dumps(recipe)
+                self._unwritten.append((checksum, text))
+                if len(self._unwritten) >= self.FLUSH_SIZE or time.monotonic() - self._flushed >= self.FLUSH_INTERVAL:
+                    self._flush()
+
+    def stats(self) -> dict:
+        """return hit and miss counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._recipes)
+        return stats
+
+    def flush(self) -> None:
+        """write all unwritten recipes to database"""
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        """flush and close database, will be reopened on next use"""
+        with self._lock:
+            self._flush()
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            _open_instances.discard(self)
+
+    def purge(self) -> None:
+        """forget all recipes and remove database"""
+        with self._lock:
+            self._unwritten = []
+        self.close()
+        with self._lock:
+            self._recipes.clear()
+        if self._filename is not None:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.isfile(f"{self._filename}{suffix}"):
+                    os.unlink(f"{self._filename}{suffix}")
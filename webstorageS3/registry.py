@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+process wide registry of backend configurations and S3 clients
+
+all storage clients using the same backend share one parsed configuration,
+one Backend and for S3 therefore one connection pool
+
+boto3 and yaml are imported on first use, to keep startup of the
+command line tools fast
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# own modules
+from . import backends
+from .scheduler import TransferScheduler, parse_rate
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_configs = {}  # (homepath, s3_backend) -> config of backend
+_backends = {}  # (homepath, s3_backend) -> (pool size, Backend)
+_reserved = {}  # (homepath, s3_backend) -> connections reserved by storage clients
+_buckets = {}  # (homepath, s3_backend) -> list of bucket names
+_schedulers = {}  # (homepath, s3_backend) -> TransferScheduler
+
+
+def _key(homepath: str, s3_backend: str) -> tuple:
+    return os.path.abspath(homepath), s3_backend
+
+
+def get_config(homepath: str, s3_backend: str = "DEFAULT") -> dict:
+    """
+    return configuration of backend, webstorage.yml is parsed only once
+
+    :param homepath <str>: directory containing webstorage.yml
+    :param s3_backend <str>: subkey of S3Backends in webstorage.yml
+    :return <dict>: configuration of this backend
+    """
+    key = _key(homepath, s3_backend)
+    with _lock:
+        if key not in _configs:
+            _configs[key] = _load_config(homepath, s3_backend)
+        return _configs[key]
+
+
+def _load_config(homepath: str, s3_backend: str) -> dict:
+    # check config directory
+    logger.debug(f"using config directory {homepath}")
+    if not os.path.isdir(homepath):
+        logger.error(f"create directory {homepath} and place webstorage.yml file in there")
+        sys.exit(1)
+
+    # checking configfile
+    configfile = os.path.join(homepath, "webstorage.yml")
+    if not os.path.isfile(configfile):
+        logger.error(f"configuration file {configfile} is missing")
+        sys.exit(2)
+
+    import yaml  # pylint: disable=import-outside-toplevel
+
+    # load config
+    with open(configfile, "rt", encoding="utf8") as infile:
+        try:
+            config = {}
+            data = yaml.safe_load(infile.read())
+            logger.debug(yaml.dump(data, indent=2))
+            config.update(data["S3Backends"][s3_backend])  # otherwise KeyError - invalid Config
+            # use proxy, if defined in config
+            if "HTTP_PROXY" in config:
+                os.environ["HTTP_PROXY"] = config["HTTP_PROXY"]
+            if "HTTPS_PROXY" in config:
+                os.environ["HTTPS_PROXY"] = config["HTTPS_PROXY"]
+        except KeyError as exc:
+            logger.exception(exc)
+            logger.error("invalid config file format, at least key S3Backends and Subkey DEFAULT must exist")
+            sys.exit(2)
+    if config.get("BACKEND_TYPE", "s3") != "s3":  # no credentials needed
+        return config
+    for name in ("S3_ACCESS_KEY", "S3_SECRET_KEY", "S3_ENDPOINT_URL", "S3_USE_SSL"):
+        if name not in config:
+            logger.error(f"invalid config file format, key {name} is missing in backend {s3_backend}")
+            sys.exit(2)
+    return config
+
+
+def reserve(homepath: str, s3_backend: str, connections: int) -> None:
+    """
+    announce connections used in parallel by some storage client
+
+    the connection pool of the shared S3 client grows to the sum of all
+    reservations, the client is rebuilt on next use if it is too small
+
+    :param homepath <str>: directory containing webstorage.yml
+    :param s3_backend <str>: subkey of S3Backends in webstorage.yml
+    :param connections <int>: number of parallel requests
+    """
+    key = _key(homepath, s3_backend)
+    with _lock:
+        _reserved[key] = _reserved.get(key, 0) + connections
+        if key in _schedulers and "TRANSFER_MAX_CONCURRENCY" not in get_config(homepath, s3_backend):
+            _schedulers[key].grow(_reserved[key])
+        if key in _backends and _backends[key][0] < _reserved[key]:
+            logger.debug(f"connection pool of {s3_backend} too small, will grow to {_reserved[key]}")
+            del _backends[key]
+
+
+def override(homepath: str, s3_backend: str = "DEFAULT", **settings) -> None:
+    """
+    change settings of backend config, e.g. by command line options
+
+    must be called before clients of this backend are created, keys with
+    value None are left unchanged
+
+    :param homepath <str>: directory containing webstorage.yml
+    :param s3_backend <str>: subkey of S3Backends in webstorage.yml
+    :param settings: config keys and values
+    """
+    config = get_config(homepath, s3_backend)
+    with _lock:
+        config.update({name: value for name, value in settings.items() if value is not None})
+
+
+def get_backend(homepath: str, s3_backend: str = "DEFAULT") -> backends.Backend:
+    """
+    return shared Backend of backend config, created on first use
+
+    BACKEND_TYPE selects s3, local or memory, for s3 a boto3 client is
+    created, its pool size, keepalive and timeouts are taken from backend config
+      S3_MAX_POOL_CONNECTIONS, minimum pool size, defaults to 10
+      S3_TCP_KEEPALIVE, defaults to True
+      S3_CONNECT_TIMEOUT and S3_READ_TIMEOUT in seconds, default to 60
+
+    :param homepath <str>: directory containing webstorage.yml
+    :param s3_backend <str>: subkey of S3Backends in webstorage.yml
+    :return <backends.Backend>:
+    """
+    key = _key(homepath, s3_backend)
+    with _lock:
+        if key not in _backends:
+            config = get_config(homepath, s3_backend)
+            if config.get("BACKEND_TYPE", "s3") != "s3":  # without connection pool
+                _backends[key] = (float("inf"), backends.create_backend(config["BACKEND_TYPE"], config, key))
+                return _backends[key][1]
+
+            # pylint: disable=import-outside-toplevel
+            import boto3
+            from botocore.config import Config
+
+            pool_size = max(int(config.get("S3_MAX_POOL_CONNECTIONS", 10)), _reserved.get(key, 0))
+            logger.debug(f"creating client for {s3_backend} with {pool_size} connections")
+            client = boto3.client(
+                "s3",
+                aws_access_key_id=config["S3_ACCESS_KEY"],
+                aws_secret_access_key=config["S3_SECRET_KEY"],
+                endpoint_url=config["S3_ENDPOINT_URL"],
+                use_ssl=config["S3_USE_SSL"],
+                config=Config(
+                    max_pool_connections=pool_size,
+                    tcp_keepalive=config.get("S3_TCP_KEEPALIVE", True),
+                    connect_timeout=config.get("S3_CONNECT_TIMEOUT", 60),
+                    read_timeout=config.get("S3_READ_TIMEOUT", 60),
+                ),
+            )
+            _backends[key] = (pool_size, backends.S3Backend(client))
+        return _backends[key][1]
+
+
+def get_scheduler(homepath: str, s3_backend: str = "DEFAULT") -> TransferScheduler:
+    """
+    return shared TransferScheduler of backend config, created on first use
+
+    parameters are taken from backend config
+      TRANSFER_MAX_CONCURRENCY, defaults to the connections reserved by clients
+      TRANSFER_MIN_CONCURRENCY, defaults to 1
+      TRANSFER_RETRIES, defaults to 8
+      TRANSFER_BACKOFF and TRANSFER_MAX_BACKOFF in seconds, default to 0.2 and 20
+      UPLOAD_LIMIT and DOWNLOAD_LIMIT in bytes per second like 10M, unlimited by default
+
+    :param homepath <str>: directory containing webstorage.yml
+    :param s3_backend <str>: subkey of S3Backends in webstorage.yml
+    :return <TransferScheduler>:
+    """
+    key = _key(homepath, s3_backend)
+    with _lock:
+        if key not in _schedulers:
+            config = get_config(homepath, s3_backend)
+            _schedulers[key] = TransferScheduler(
+                max_concurrency=config.get("TRANSFER_MAX_CONCURRENCY", max(_reserved.get(key, 0), 1)),
+                min_concurrency=config.get("TRANSFER_MIN_CONCURRENCY", 1),
+                retries=config.get("TRANSFER_RETRIES", 8),
+                backoff=config.get("TRANSFER_BACKOFF", 0.2),
+                max_backoff=config.get("TRANSFER_MAX_BACKOFF", 20.0),
+                upload_limit=parse_rate(config.get("UPLOAD_LIMIT")),
+                download_limit=parse_rate(config.get("DOWNLOAD_LIMIT")),
+            )
+        return _schedulers[key]
+
+
+def get_buckets(homepath: str, s3_backend: str = "DEFAULT", refresh: bool = False) -> list:
+    """
+    return names of buckets on backend
+
+    the result of list_buckets is remembered in .cache/<backend>_buckets.json
+    for BUCKET_CHECK_INTERVAL seconds of backend config, defaults to one day
+
+    :param homepath <str>: directory containing webstorage.yml
+    :param s3_backend <str>: subkey of S3Backends in webstorage.yml
+    :param refresh <bool>: ignore remembered list and ask backend
+    :return <list>: names of buckets
+    """
+    key = _key(homepath, s3_backend)
+    with _lock:
+        if refresh or key not in _buckets:
+            filename = os.path.join(homepath, ".cache", f"{s3_backend}_buckets.json")
+            interval = get_config(homepath, s3_backend).get("BUCKET_CHECK_INTERVAL", 86400)
+            if not refresh and os.path.isfile(filename) and time.time() - os.stat(filename).st_mtime < interval:
+                with open(filename, "rt", encoding="utf8") as infile:
+                    _buckets[key] = json.load(infile)
+            else:
+                _buckets[key] = get_backend(homepath, s3_backend).list_buckets()
+                try:
+                    os.makedirs(os.path.dirname(filename), exist_ok=True)
+                    with open(filename, "wt", encoding="utf8") as outfile:
+                        json.dump(_buckets[key], outfile)
+                except OSError as exc:
+                    logger.error(f"unable to remember list of buckets in {filename}: {exc}")
+        return _buckets[key]
@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+"""
+transfer scheduler with retries and adaptive concurrency
+
+all object transfers of the clients of one backend pass one scheduler,
+errors the backend reports as transient (throttling like 503 SlowDown,
+connection resets, timeouts) are retried after a jittered exponential
+backoff, the number of transfers in progress is adapted like TCP does:
+halved on transient errors, increased by one per round of successful
+transfers up to the maximum
+
+optional token buckets limit the bytes per second of all uploads and of
+all downloads of the backend
+"""
+import logging
+import random
+import threading
+import time
+
+# own modules
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_rate(value) -> int:
+    """
+    return bytes per second of value like 500K, 10M or 1G, None or 0 for unlimited
+
+    :param value <str>: number with optional unit K, M or G, 1024 based
+    :return <int>: bytes per second or None
+    """
+    if value is None:
+        return None
+    text = str(value).strip().upper()
+    for suffix in ("B", "I"):  # 10MB, 10MiB
+        if text.endswith(suffix):
+            text = text[:-1]
+    unit = text[-1:] if text[-1:] in _UNITS else ""
+    rate = int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+    return rate or None
+
+
+class TokenBucket:
+    """limits bytes per second shared by any number of threads"""
+
+    def __init__(self, rate: int, burst: int = None) -> None:
+        """
+        :param rate <int>: bytes per second
+        :param burst <int>: bytes usable at once after idle time, defaults to rate
+        """
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size: int) -> float:
+        """
+        take size bytes, wait until the bucket allows them
+
+        larger requests than burst are allowed, the bucket gets into debt,
+        later callers wait until the debt is paid, so the rate holds on average
+
+        :return <float>: seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.burst)
+            self._updated = now
+            self._tokens -= size
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class TransferScheduler:
+    """limits concurrent transfers with AIMD and retries transient errors"""
+
+    DECREASE_INTERVAL = 1.0  # seconds, errors of one burst decrease concurrency only once
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        min_concurrency: int = 1,
+        retries: int = 8,
+        backoff: float = 0.2,
+        max_backoff: float = 20.0,
+        upload_limit: int = None,
+        download_limit: int = None,
+    ) -> None:
+        """
+        :param max_concurrency <int>: upper limit of transfers in progress
+        :param min_concurrency <int>: lower limit the concurrency is never decreased below
+        :param retries <int>: retries of a transfer before its error is raised
+        :param backoff <float>: seconds of first backoff, doubled with every retry
+        :param max_backoff <float>: upper limit of backoff in seconds
+        :param upload_limit <int>: bytes per second of all uploads, None for unlimited
+        :param download_limit <int>: bytes per second of all downloads, None for unlimited
+        """
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.min_concurrency = max(min(int(min_concurrency), self.max_concurrency), 1)
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self._limit = float(self.max_concurrency)  # float to increase by fractions
+        self._active = 0
+        self._decreased = 0.0  # time of last decrease
+        self._condition = threading.Condition()
+        self._stats = {"transfers": 0, "transient_errors": 0, "retries": 0, "failed": 0, "decreases": 0}
+        self._upload = TokenBucket(upload_limit) if upload_limit else None
+        self._download = TokenBucket(download_limit) if download_limit else None
+
+    def limit_upload(self, size: int) -> None:
+        """wait until upload of size bytes is allowed by UPLOAD_LIMIT"""
+        if self._upload is not None:
+            METRICS.observe("scheduler", "upload_limit_wait", self._upload.consume(size))
+
+    def limit_download(self, size: int) -> None:
+        """account download of size bytes, wait if it exceeds DOWNLOAD_LIMIT"""
+        if self._download is not None:
+            METRICS.observe("scheduler", "download_limit_wait", self._download.consume(size))
+
+    @property
+    def concurrency(self) -> int:
+        """current limit of transfers in progress"""
+        return int(self._limit)
+
+    def grow(self, max_concurrency: int) -> None:
+        """raise maximum concurrency, e.g. if more clients use the backend"""
+        with self._condition:
+            if max_concurrency > self.max_concurrency:
+                self._limit += max_concurrency - self.max_concurrency
+                self.max_concurrency = max_concurrency
+                self._condition.notify_all()
+
+    def _acquire(self) -> None:
+        with self._condition:
+            while self._active >= int(self._limit):
+                self._condition.wait()
+            self._active += 1
+
+    def _release(self, success: bool, transient: bool) -> None:
+        with self._condition:
+            self._active -= 1
+            if transient:
+                now = time.monotonic()
+                if now - self._decreased >= self.DECREASE_INTERVAL and self._limit > self.min_concurrency:
+                    self._limit = max(self._limit / 2, self.min_concurrency)
+                    self._decreased = now
+                    self._stats["decreases"] += 1
+                    logger.info(f"backend is throttling, concurrency decreased to {self.concurrency}")
+            elif success and self._limit < self.max_concurrency:
+                # one more per round of limit successful transfers
+                self._limit = min(self._limit + 1 / self._limit, self.max_concurrency)
+            self._condition.notify_all()
+
+    def delay(self, attempt: int) -> float:
+        """seconds to wait before retry attempt, full jitter of exponential backoff"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def run(self, function, *args, is_transient=None):
+        """
+        call function(*args) when concurrency allows, retry on transient errors
+
+        :param function <callable>: transfer to run
+        :param is_transient <callable>: called with exception, True if retrying could help
+        :return: result of function
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = function(*args)
+            except Exception as exc:
+                transient = is_transient is not None and is_transient(exc)
+                self._release(False, transient)
+                if not transient:
+                    raise
+                self._count("transient_errors")
+                if attempt >= self.retries:
+                    self._count("failed")
+                    logger.error(f"giving up after {attempt} retries: {exc!r}")
+                    raise
+                attempt += 1
+                delay = self.delay(attempt)
+                self._count("retries")
+                logger.warning(f"transient error {exc!r}, retry {attempt} of {self.retries} in {delay:.2f} s")
+                time.sleep(delay)
+                continue
+            self._release(True, False)
+            with self._condition:
+                self._stats["transfers"] += 1
+            return result
+
+    def _count(self, name: str) -> None:
+        with self._condition:
+            self._stats[name] += 1
+        METRICS.count("scheduler", name)
+
+    def stats(self) -> dict:
+        """return counters of transfers, errors and retries and current concurrency"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["active"] = self._active
+        stats["concurrency"] = self.concurrency
+        stats["max_concurrency"] = self.max_concurrency
+        return stats
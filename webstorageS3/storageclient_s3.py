@@ -3,21 +3,49 @@
 """
 RestFUL Webclient to use BlockStorage WebApps
 """
+import atexit
+import contextlib
+import functools
 import hashlib
+import json
 import logging
 import os
 import sys
-from io import BytesIO
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
 
-import boto3
-import botocore
-# non std modules
-import yaml
-
-from .checksums import Checksums
+from . import registry
+from .backends import ObjectNotFound
+from .bloomfilter import BloomFilter
+from .checksums import Checksums, to_digest
+from .metrics import METRICS
+from .mmap_checksums import MmapChecksums
+from .packs import INDEX_SUFFIX, PREFIX, Pack, PackIndex
 
 logger = logging.getLogger(__name__)
 
+_packing_clients = weakref.WeakSet()  # clients with possibly unwritten packs
+
+
+@atexit.register
+def _flush_all() -> None:
+    """guaranteed upload of open packs on exit, before caches are closed"""
+    for client in list(_packing_clients):
+        client.flush()
+
+
+# hash algorithms for keys, selected by HASH_ALGORITHM, sha1 is used by older versions
+HASH_ALGORITHMS = {
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "blake2b": functools.partial(hashlib.blake2b, digest_size=32),
+    "blake2s": hashlib.blake2s,
+}
+DEFAULT_HASH = "sha1"
+DEFAULT_BLOCKSIZE = 1024 * 1024
+
 
 class StorageClient:
     """
@@ -25,7 +53,11 @@ class StorageClient:
     base class is without caching involved, always directly to s3
     """
 
-    def __init__(self, homepath: str, s3_backend: str = "DEFAULT"):
+    PREFIX_LENGTH = 2  # keys sharing this prefix are checked together by _exists_many
+    LIST_THRESHOLD = 64  # minimum number of keys to check per prefix listing
+    METRICS_NAME = "storage"  # client label of recorded metrics
+
+    def __init__(self, homepath: str, s3_backend: str = "DEFAULT", workers: int = None):
         self._s3_backend = s3_backend
         self._homepath = homepath
 
@@ -33,60 +65,68 @@ class StorageClient:
         logger.debug(f"homepath   = {homepath}")
 
         self._config = None  # holding yaml config
-        self._logger = None  # logger
         self._bucket_name = None  # bucket_name in S3
-        self._hashfunc = hashlib.sha1  # TODO: hardcoded or in config?
-        self._blocksize = 1024 * 1024  # TODO: hardcoded or in config?
+        self._hashname = None  # name of hash algorithm, from config
+        self._hashfunc = None  # constructor of hash algorithm
+        self._digest_width = None  # length of digests in bytes
+        self._blocksize = None  # maximum size of blocks, from config
         self._cache = None  # will be set by _init_cache
         self._cache_filename = None  # will be set by _init_cache
+        self._workers = workers  # number of parallel transfers, None to use config
+        self._executor = None  # will be created on first use by executor
+        self._filter = None  # BloomFilter of existing keys, False if not usable
+        self._filter_filename = None  # will be set by _init_cache
+        self._filter_dirty = False  # filter changed since loaded
+        self._filter_added = []  # digests added since loaded, to merge with filter of other size
+        self._filter_lock = threading.Lock()
+        self._filter_stats = {"skipped": 0, "maybe": 0, "false_positive": 0}
+        self._pack_threshold = 0  # objects below this size are packed, 0 to disable
+        self._pack_size = 0  # packs are uploaded if they reach this size
+        self._pack = None  # Pack being filled
+        self._packs_in_flight = {}  # pack id -> Pack sealed, but not uploaded yet
+        self._pack_lock = threading.Lock()
+        self._pack_index = None  # will be set by _init_cache
+        self._packs_synced = False  # remote pack indexes were read
 
-        # check config directory
-        logger.debug(f"using config directory {self._homepath}")
-        if not os.path.isdir(self._homepath):
-            logger.error(
-                f"create directory {self._homepath} and place webstorage.yml file in there"
-            )
-            sys.exit(1)
+        # config and S3 client are shared by all clients of this backend
+        self._config = registry.get_config(homepath, s3_backend)
+        self._hashname = self._config.get("HASH_ALGORITHM", DEFAULT_HASH)
+        if self._hashname not in HASH_ALGORITHMS:
+            raise ValueError(f"unknown HASH_ALGORITHM {self._hashname}, use one of {', '.join(HASH_ALGORITHMS)}")
+        self._hashfunc = HASH_ALGORITHMS[self._hashname]
+        self._digest_width = self._hashfunc().digest_size
+        self._blocksize = int(self._config.get("BLOCKSIZE", DEFAULT_BLOCKSIZE))
+        self._pack_threshold = int(self._config.get("PACK_THRESHOLD", 0))
+        self._pack_size = int(self._config.get("PACK_SIZE", 8388608))
+        if self._workers is None:
+            self._workers = int(self._config.get("WORKERS", 8))
+        # every client could use all its workers and the calling thread in parallel
+        registry.reserve(homepath, s3_backend, self._workers + 1)
+        self._scheduler = registry.get_scheduler(homepath, s3_backend)  # shared, retrying transient errors
 
-        # checking configfile
-        configfile = os.path.join(self._homepath, "webstorage.yml")
-        if not os.path.isfile(configfile):
-            logger.error(f"configuration file {configfile} is missing")
-            sys.exit(2)
+    @property
+    def _backend(self):
+        """shared Backend of this backend config, S3 or selected by BACKEND_TYPE"""
+        return registry.get_backend(self._homepath, self._s3_backend)
 
-        # load config
-        with open(configfile, "rt", encoding="utf8") as infile:
-            try:
-                self._config = {}
-                data = yaml.safe_load(infile.read())
-                logger.debug(yaml.dump(data, indent=2))
-                self._config.update(
-                    data["S3Backends"][s3_backend]
-                )  # otherwise KeyError - invalid Config
-                # use proxy, if defined in config
-                if "HTTP_PROXY" in self._config:
-                    os.environ["HTTP_PROXY"] = self._config["HTTP_PROXY"]
-                if "HTTPS_PROXY" in self._config:
-                    os.environ["HTTPS_PROXY"] = self._config["HTTPS_PROXY"]
-                self._client = boto3.client(
-                    "s3",
-                    aws_access_key_id=self._config["S3_ACCESS_KEY"],
-                    aws_secret_access_key=self._config["S3_SECRET_KEY"],
-                    endpoint_url=self._config["S3_ENDPOINT_URL"],
-                    use_ssl=self._config["S3_USE_SSL"],
-                )
-            except KeyError as exc:
-                logger.exception(exc)
-                logger.error(
-                    "invalid config file format, at least key S3Backends and Subkey DEFAULT must exist"
-                )
-                sys.exit(2)
+    def _transfer(self, function, *args):
+        """
+        run backend operation by scheduler, with retries if backend reports a transient error
+
+        :param function <callable>: method of Backend, e.g. self._backend.put
+        """
+        return self._scheduler.run(function, *args, is_transient=self._backend.is_transient)
 
     @property
     def hashfunc(self):
         """returning used hashfunc"""
         return self._hashfunc
 
+    @property
+    def hashname(self):
+        """name of used hash algorithm, recorded in recipes"""
+        return self._hashname
+
     @property
     def homepath(self):
         """where to find config and cache"""
@@ -97,32 +137,224 @@ class StorageClient:
         """return blocksize"""
         return self._blocksize
 
+    @property
+    def workers(self):
+        """number of parallel transfers"""
+        return self._workers
+
+    @property
+    def executor(self):
+        """thread pool used for parallel transfers, created on first use"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._workers,
+                thread_name_prefix=self.__class__.__name__,
+            )
+        return self._executor
+
     @property
     def checksums(self):
-        """return generator of existing keys"""
+        """return generator of existing keys, without packed keys and packs"""
         for key in self._list_objects():
-            yield key.split(".")[0]  # only first part, ignoring endings like .bin
+            if not key.startswith(PREFIX):
+                yield key.split(".")[0]  # only first part, ignoring endings like .bin
 
     def __contains__(self, checksum):
         return self._exists(checksum)
 
     def _check_bucket(self):
-        buckets = [bucket["Name"] for bucket in self._client.list_buckets()["Buckets"]]
+        buckets = registry.get_buckets(self._homepath, self._s3_backend)
+        if self._bucket_name not in buckets:  # remembered list could be outdated
+            buckets = registry.get_buckets(self._homepath, self._s3_backend, refresh=True)
         if self._bucket_name not in buckets:
-            self._logger.error(f"Bucket {self._bucket_name} does not exist")
-            self._logger.debug(f"list of buckets {self._client.list_buckets()}")
+            logger.error(f"Bucket {self._bucket_name} does not exist")
+            logger.debug(f"list of buckets {buckets}")
             sys.exit(2)
 
     def _init_cache(self, cache, name):
         subdir = os.path.join(self._homepath, ".cache")
+        if self._hashname != DEFAULT_HASH:  # one cache per hash, checksums have fixed length
+            name = f"{name}_{self._hashname}"
         self._cache_filename = os.path.join(subdir, f"{self._s3_backend}_{name}.db")
+        self._filter_filename = os.path.join(subdir, f"{self._s3_backend}_{name}.bloom")
         if cache:
             if not os.path.isdir(subdir):
                 os.mkdir(subdir)
-            self._cache = Checksums(self._cache_filename)
+            self._pack_index = PackIndex(os.path.join(subdir, f"{self._s3_backend}_{name}_packs.db"))
+            if self._config.get("CACHE_FORMAT", "sqlite") == "mmap":
+                basename = os.path.join(subdir, f"{self._s3_backend}_{name}")
+                if not os.path.isfile(f"{basename}.idx") and os.path.isfile(self._cache_filename):
+                    MmapChecksums.migrate(self._cache_filename, basename)
+                self._cache_filename = f"{basename}.idx"
+                self._cache = MmapChecksums(basename, width=self._digest_width)
+            else:
+                self._cache = Checksums(
+                    self._cache_filename,
+                    write_behind=self._config.get("CACHE_WRITE_BEHIND", True),
+                    width=self._digest_width,
+                )
         else:
-            self._logger.info("persistend cache disabled, only memory cache active")
-            self._cache = set()
+            logger.info("persistend cache disabled, only memory cache active")
+            self._cache = Checksums(width=self._digest_width)
+            self._pack_index = PackIndex()
+
+    def _get_filter(self):
+        """
+        return bloom filter of existing keys, if enabled by BLOOM_FILTER in config
+
+        a filter is not used if missing, older than BLOOM_FILTER_MAX_AGE seconds
+        or not saved properly by the last process changing it
+
+        :return <BloomFilter>: or None if there is no usable filter
+        """
+        if self._filter is None:
+            with self._filter_lock:
+                if self._filter is None:
+                    bloomfilter = self._load_filter()
+                    self._filter = False if bloomfilter is None else bloomfilter  # empty filter is usable
+        return None if self._filter is False else self._filter
+
+    def _load_filter(self):
+        if not self._config.get("BLOOM_FILTER", False) or self._filter_filename is None:
+            return None
+        filename = self._filter_filename
+        if not os.path.isfile(filename):
+            logger.info(f"bloom filter {filename} does not exist, use --rebuild-filter")
+            return None
+        if os.path.isfile(f"{filename}.dirty"):
+            logger.warning(f"bloom filter {filename} was not saved properly, use --rebuild-filter")
+            return None
+        if time.time() - os.stat(filename).st_mtime > self._config.get("BLOOM_FILTER_MAX_AGE", 86400):
+            logger.warning(f"bloom filter {filename} is outdated, use --rebuild-filter")
+            return None
+        bloomfilter = BloomFilter.load(filename)
+        logger.info(f"loaded bloom filter {filename} with {len(bloomfilter)} keys")
+        return bloomfilter
+
+    def _filter_add(self, key: str) -> None:
+        """remember existing key in bloom filter"""
+        bloomfilter = self._get_filter()
+        digest = self._to_digest(key)
+        if bloomfilter is None or digest is None:
+            return
+        with self._filter_lock:
+            if not self._filter_dirty:  # marker is removed by saving filter
+                with open(f"{self._filter_filename}.dirty", "wb"):
+                    pass
+                self._filter_dirty = True
+            bloomfilter.add(digest)
+            self._filter_added.append(digest)
+
+    def _save_filter(self) -> None:
+        with self._filter_lock:
+            if not self._filter_dirty:  # only set if there is a filter
+                return
+            with BloomFilter.locked(self._filter_filename):
+                self._filter = self._merge_saved_filter(self._filter, self._filter_added)
+                self._filter.save(self._filter_filename)
+                with contextlib.suppress(FileNotFoundError):  # removed by other process meanwhile
+                    os.unlink(f"{self._filter_filename}.dirty")
+            self._filter_added = []
+            self._filter_dirty = False
+
+    def _merge_saved_filter(self, bloomfilter, added: list):
+        """
+        return filter with the digests of bloomfilter and of the filter file,
+        other processes may have saved their digests meanwhile
+
+        :param bloomfilter <BloomFilter>: filter to be saved
+        :param added <list>: digests added to bloomfilter, used if filter file has another size
+        :return <BloomFilter>: to be saved
+        """
+        try:
+            saved = BloomFilter.load(self._filter_filename)
+        except (FileNotFoundError, ValueError):
+            return bloomfilter
+        if bloomfilter.compatible(saved):
+            bloomfilter.merge(saved)
+            return bloomfilter
+        logger.info(f"bloom filter {self._filter_filename} was rebuilt meanwhile, adding {len(added)} keys")
+        saved.update(added)
+        return saved
+
+    def _exists_filtered(self, key: str) -> bool:
+        """like _exists, but without asking S3 if bloom filter knows key does not exist"""
+        bloomfilter = self._get_filter()
+        digest = self._to_digest(key)
+        if bloomfilter is None or digest is None:
+            return self._exists(key)
+        if digest not in bloomfilter:
+            self._filter_stats["skipped"] += 1
+            return False
+        exists = self._exists(key)
+        self._filter_stats["maybe"] += 1
+        if not exists:
+            self._filter_stats["false_positive"] += 1
+        return exists
+
+    def rebuild_filter(self, from_cache: bool = False) -> None:
+        """
+        build new bloom filter of existing keys and store it in cache directory
+
+        :param from_cache <bool>: use local checksum cache instead of listing bucket
+        """
+        keys = self._cache if from_cache else self.checksums
+        digests = bytearray()
+        for key in keys:
+            digest = self._to_digest(key)
+            if digest is not None:
+                digests += digest
+        width = self._digest_width
+        count = len(digests) // width
+        bloomfilter = BloomFilter(
+            capacity=max(2 * count, 1000000),  # leave room for growth
+            error_rate=self._config.get("BLOOM_FILTER_ERROR_RATE", 0.01),
+        )
+        bloomfilter.update(digests[offset:offset + width] for offset in range(0, len(digests), width))
+        os.makedirs(os.path.dirname(self._filter_filename), exist_ok=True)
+        with self._filter_lock, BloomFilter.locked(self._filter_filename):
+            with contextlib.suppress(FileNotFoundError, ValueError):  # keep keys saved by other processes
+                saved = BloomFilter.load(self._filter_filename)
+                if bloomfilter.compatible(saved):
+                    bloomfilter.merge(saved)
+            bloomfilter.save(self._filter_filename)
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(f"{self._filter_filename}.dirty")
+            self._filter = bloomfilter
+            self._filter_added = []
+            self._filter_dirty = False
+        logger.info(f"stored bloom filter of {count} keys in {self._filter_filename}")
+
+    def filter_stats(self) -> dict:
+        """
+        return statistics of bloom filter usage
+
+        observed_false_positive_rate is the part of non existing keys the
+        filter was not able to exclude
+        """
+        bloomfilter = self._get_filter()
+        stats = dict(self._filter_stats)
+        absent = stats["skipped"] + stats["false_positive"]
+        stats["observed_false_positive_rate"] = stats["false_positive"] / absent if absent else None
+        if bloomfilter is not None:
+            stats["keys"] = len(bloomfilter)
+            stats["estimated_false_positive_rate"] = bloomfilter.false_positive_rate
+        return stats
+
+    def _to_digest(self, key: str) -> bytes:
+        """binary digest of key, None if key is no checksum of used hash algorithm"""
+        return to_digest(key, self._digest_width)
+
+    def _remember(self, keys) -> None:
+        """
+        add existing keys to local cache
+
+        keys of other hash algorithms, e.g. in recipes of older
+        versions, do not fit into the cache and are skipped
+
+        :param keys <iterable>: existing keys
+        """
+        self._cache.update(key for key in keys if self._to_digest(key) is not None)
 
     def _blockdigest(self, data):
         """
@@ -134,20 +366,49 @@ class StorageClient:
         digest.update(data)
         return digest.hexdigest()
 
+    def _put_object(self, key: str, data: bytes, metadata: dict = None) -> None:
+        """
+        upload some data to backend
+
+        :param key <str>: key of object in bucket
+        :param data <bytes>: binary data of object
+        :param metadata <dict>: optional user metadata of object
+        """
+        self._scheduler.limit_upload(len(data))
+        start = time.perf_counter()
+        self._transfer(self._backend.put, self._bucket_name, key, data, metadata)
+        METRICS.observe(self.METRICS_NAME, "put", time.perf_counter() - start, len(data))
+
+    def _get_object(self, key: str) -> bytearray:
+        """
+        download some data from backend, raise ObjectNotFound if missing
+
+        :param key <str>: key of object in bucket
+        :return <bytearray>: binary data of object
+        """
+        return self._get_object_with_metadata(key)[0]
+
+    def _get_object_with_metadata(self, key: str) -> tuple:
+        """
+        like _get_object, but also return user metadata of object
+
+        :param key <str>: key of object in bucket
+        :return <tuple>: binary data and metadata dict of object
+        """
+        start = time.perf_counter()
+        data, metadata = self._transfer(self._backend.get, self._bucket_name, key)
+        METRICS.observe(self.METRICS_NAME, "get", time.perf_counter() - start, len(data))
+        self._scheduler.limit_download(len(data))  # size is known afterwards, slows down next downloads
+        return data, metadata
+
     def _download_fileobj(self, key):
         """
         download some data from S3
 
-        :param bucket_name <str>: some existing bucket in S3
         :param key <str>: key of object in bucket
         :return <bytes> binary data of object:
         """
-        b_buffer = BytesIO()
-        self._client.download_fileobj(
-            self._bucket_name, key, b_buffer
-        )  # TODO: exceptions
-        b_buffer.seek(0)  # do not forget this tiny little line !!
-        return b_buffer.read()
+        return self._get_object(key)
 
     def _list_objects(self):
         """
@@ -156,63 +417,252 @@ class StorageClient:
         :param bucket <str>: name of bucket
         :return <generator> of entry["Key"] of objects
         """
-        paginator = self._client.get_paginator("list_objects")
-        # Create a PageIterator from the Paginator
-        page_iterator = paginator.paginate(Bucket=self._bucket_name)
-        for page in page_iterator:
-            if page.get("Contents"):
-                for entry in page["Contents"]:
-                    yield entry["Key"]
+        for entry in self.list():
+            yield entry["Key"]
 
     def _exists(self, key):
         """
         checking if key exists in bucket
         """
+        return self.head(key) is not None
+
+    def _exists_many(self, keys) -> list:
+        """
+        checking which keys do not exist in bucket
+
+        keys are grouped by their first characters, a group with many keys
+        is checked by listing this prefix, otherwise by concurrent HEADs
+
+        :param keys <iterable>: keys to check
+        :return <list>: missing keys, in order of keys
+        """
+        keys = list(dict.fromkeys(keys))  # unique, but keep order
+        bloomfilter = self._get_filter()
+        if bloomfilter is not None:  # keys not in filter do not exist for sure
+            candidates = [key for key in keys if self._to_digest(key) is None or self._to_digest(key) in bloomfilter]
+            self._filter_stats["skipped"] += len(keys) - len(candidates)
+        else:
+            candidates = keys
+        groups = {}
+        for key in candidates:
+            groups.setdefault(key[:self.PREFIX_LENGTH], []).append(key)
+        # estimated number of list pages per prefix, based on known objects
+        pages = len(self._cache or ()) // (16**self.PREFIX_LENGTH * 1000) + 1
+        futures = []
+        for prefix, group in groups.items():
+            if len(group) >= max(self.LIST_THRESHOLD, pages):
+                futures.append(self.executor.submit(self._found_by_listing, prefix, group))
+            else:
+                futures.extend(self.executor.submit(self._found_by_head, key) for key in group)
+        found = set()
+        for future in futures:
+            found.update(future.result())
+        if bloomfilter is not None:
+            self._filter_stats["maybe"] += len(candidates)
+            self._filter_stats["false_positive"] += len(candidates) - len(found)
+        return [key for key in keys if key not in found]
+
+    def _submit_packed(self, key: str, payload: bytes, codec: str = None, depends=()) -> tuple:
+        """
+        add small object to open pack, the pack is uploaded in background if full
+
+        the object is known to _locate at once, the returned future is done
+        if the pack is uploaded
+
+        :param key <str>: key of object
+        :param payload <bytes>: data as stored, possibly compressed
+        :param codec <str>: compression codec of payload
+        :param depends <iterable>: futures to wait for before uploading the pack
+        :return <tuple>: future of pack upload and location of object
+        """
+        with self._pack_lock:
+            if self._pack is None:
+                self._pack = Pack()
+                _packing_clients.add(self)
+            pack = self._pack
+            location = pack.add(key, payload, codec)
+            pack.depends.extend(future for future in depends if not future.done())
+            self._packs_in_flight[pack.id] = pack
+            if len(pack.buffer) >= self._pack_size:
+                self._pack = None
+                self._after(pack.depends, self._put_pack, pack)
+        return pack.future, location
+
+    def _after(self, depends, function, *args) -> Future:
+        """
+        run function by executor after all futures in depends are done
+
+        no worker thread is blocked while waiting, so this also works if
+        depends are only done by flush on exit
+
+        :param depends <list>: futures to wait for
+        :param function <callable>: called with args
+        :return <Future>: done with result of function
+        """
+        result = Future()
+        waiting = [future for future in depends if not future.done()]
+        remaining = [len(waiting)]
+        lock = threading.Lock()
+
+        def run():
+            try:
+                result.set_result(function(*args))
+            except BaseException as exc:  # pylint: disable=broad-except
+                result.set_exception(exc)
+
+        def start(_=None):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            try:
+                self.executor.submit(run)
+            except RuntimeError:  # interpreter is shutting down, no new threads
+                run()
+
+        if not waiting:
+            remaining[0] = 1
+            start()
+        for future in waiting:
+            future.add_done_callback(start)
+        return result
+
+    def _put_pack(self, pack: Pack) -> None:
+        """upload pack and its index, after everything it depends on is stored"""
         try:
-            self._client.head_object(Bucket=self._bucket_name, Key=key)
-            return True
-        except botocore.exceptions.ClientError as exc:
-            if exc.response["Error"]["Code"] == "404":
-                return False
-            # Something else has gone wrong.
-            raise exc
+            for future in pack.depends:
+                future.result()  # raises exception of dependency
+            logger.debug(f"storing pack {pack.key} of {len(pack.entries)} objects, {len(pack.buffer)} bytes")
+            self._put_object(pack.key, bytes(pack.buffer))
+            self._put_object(pack.index_key, pack.index())
+            self._pack_index.add_pack(pack.id, pack.entries)
+            keys = [entry[0] for entry in pack.entries]
+            self._remember(keys)
+            for key in keys:
+                self._filter_add(key)
+        except BaseException as exc:
+            pack.future.set_exception(exc)
+            raise
+        finally:
+            with self._pack_lock:
+                self._packs_in_flight.pop(pack.id, None)
+        pack.future.set_result(pack.id)
+
+    def flush(self) -> None:
+        """upload open pack and wait for all packs being uploaded"""
+        with self._pack_lock:
+            pack, self._pack = self._pack, None
+            in_flight = list(self._packs_in_flight.values())
+        if pack is not None:
+            self._put_pack(pack)  # in this thread, also works while exiting
+        for other in in_flight:
+            if other is not pack:
+                other.future.result()
+
+    def _locate(self, key: str, sync: bool = False) -> list:
+        """
+        return location of packed object
+
+        :param key <str>: key of object
+        :param sync <bool>: read unknown pack indexes from S3 if not found
+        :return <list>: [pack, offset, length, codec] or None if not packed
+        """
+        if self._pack_index is None:
+            return None
+        with self._pack_lock:
+            for pack in self._packs_in_flight.values():
+                if key in pack.locations:
+                    return pack.locations[key]
+        location = self._pack_index.get(key)
+        if location is None and sync and not self._packs_synced:
+            self._sync_packs()
+            location = self._pack_index.get(key)
+        return location
+
+    def _sync_packs(self) -> None:
+        """read indexes of packs stored by other clients into local pack index"""
+        known = self._pack_index.packs()
+        for entry in METRICS.timed_iter(self.METRICS_NAME, "list", self._backend.list(self._bucket_name, PREFIX)):
+            if not entry["Key"].endswith(INDEX_SUFFIX):
+                continue
+            pack_id = entry["Key"][len(PREFIX):-len(INDEX_SUFFIX)]
+            if pack_id not in known:
+                logger.info(f"reading index of pack {pack_id}")
+                self._pack_index.add_pack(pack_id, json.loads(self._get_object(entry["Key"])))
+        self._packs_synced = True
+
+    def _get_packed(self, location: list) -> bytes:
+        """
+        return payload of packed object, with a ranged GET if pack is uploaded
+
+        :param location <list>: [pack, offset, length, codec] as returned by _locate
+        :return <bytes>: data as stored, possibly compressed
+        """
+        pack_id, offset, length = location[:3]
+        with self._pack_lock:
+            pack = self._packs_in_flight.get(pack_id)
+        if pack is not None:
+            return pack.read(offset, length)
+        start = time.perf_counter()
+        self._scheduler.limit_download(length)
+        data = self._transfer(self._backend.get, self._bucket_name, f"{PREFIX}{pack_id}", offset, length)[0]
+        METRICS.observe(self.METRICS_NAME, "get_range", time.perf_counter() - start, len(data))
+        return data
+
+    def _found_by_listing(self, prefix: str, keys: list) -> set:
+        """return subset of keys found by listing objects starting with prefix"""
+        keys = set(keys)
+        listing = METRICS.timed_iter(self.METRICS_NAME, "list", self._backend.list(self._bucket_name, prefix))
+        return {entry["Key"] for entry in listing if entry["Key"] in keys}
+
+    def _found_by_head(self, key: str) -> tuple:
+        """return tuple containing key if key exists, for use with _exists_many"""
+        return (key,) if self._exists(key) else ()
 
     def _list_buckets(self):
         """return list of buckets on s3 backend"""
-        result = self._client.list_buckets()
-        return [entry["Name"] for entry in result["Buckets"]]
+        return registry.get_buckets(self._homepath, self._s3_backend)
 
     def head(self, key):
         """
         returning some meta information about object
         """
         try:
-            return self._client.head_object(Bucket=self._bucket_name, Key=key)
-        except botocore.exceptions.ClientError as exc:
-            if exc.response["Error"]["Code"] == "404":
-                return None
-            # Something else has gone wrong.
-            raise exc
+            with METRICS.timer(self.METRICS_NAME, "head"):
+                return self._transfer(self._backend.head, self._bucket_name, key)
+        except ObjectNotFound:
+            return None
 
     def list(self):
         """
         generator to return objects in bucket
         """
-        paginator = self._client.get_paginator("list_objects")
-        # Create a PageIterator from the Paginator
-        page_iterator = paginator.paginate(Bucket=self._bucket_name)
-        for page in page_iterator:
-            if page.get("Contents"):
-                for entry in page["Contents"]:
-                    yield entry
+        yield from METRICS.timed_iter(self.METRICS_NAME, "list", self._backend.list(self._bucket_name))
+
+    def close(self):
+        """upload open pack, write pending cache entries and bloom filter, close cache database"""
+        self.flush()
+        if self._cache is not None:
+            self._cache.close()
+        if self._pack_index is not None:
+            self._pack_index.close()
+        self._save_filter()
 
     def purge_cache(self):
         """
         delete locally cached checksums, useful if inherited by blockstorage_client or filestorage_client
         """
-        self._logger.info(
+        logger.info(
             f"deleting local cached checksum database in file {self._cache_filename}"
         )
-        del self._cache  # to close database and release file
-        os.unlink(self._cache_filename)
-        self._cache = Checksums(self._cache_filename)
+        self._cache.close()  # to close database and release file
+        if self._pack_index is not None:
+            self._pack_index.purge()
+        if self._cache_filename.endswith(".idx"):  # mmap format, also the sqlite database it was migrated from
+            basename = self._cache_filename[:-len(".idx")]
+            filenames = [f"{basename}{suffix}" for suffix in (".idx", ".delta", ".db", ".db-wal", ".db-shm")]
+        else:
+            filenames = [f"{self._cache_filename}{suffix}" for suffix in ("", "-wal", "-shm")]
+        for filename in filenames:
+            if os.path.isfile(filename):  # not created before first use
+                os.unlink(filename)
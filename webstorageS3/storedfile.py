@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+"""
+seekable read only file object of a file stored in FileStorage
+
+only the blocks covering the requested range are downloaded, the last
+used blocks are kept, so small reads near each other need no request
+"""
+import bisect
+import io
+import itertools
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LEGACY_BLOCKSIZE = 1024 * 1024  # of recipes written before chunker was recorded
+
+
+def block_offsets(recipe: dict) -> list:
+    """
+    return start offset of every block of recipe, followed by file size
+
+    :param recipe <dict>: as returned by FileStorageClient.get
+    :return <list>: len(blockchain) + 1 offsets
+    """
+    if "blocksizes" in recipe:  # content defined chunks
+        return [0, *itertools.accumulate(recipe["blocksizes"])]
+    blocksize = recipe.get("chunker", {}).get("blocksize", LEGACY_BLOCKSIZE)
+    offsets = [index * blocksize for index in range(len(recipe["blockchain"]))]
+    offsets.append(recipe["size"])
+    return offsets
+
+
+class StoredFile(io.RawIOBase):
+    """raw binary file object reading blocks from BlockStorage on demand"""
+
+    def __init__(self, filestorage, recipe: dict, cache_blocks: int = 4) -> None:
+        """
+        :param filestorage <FileStorageClient>: client the file is stored with
+        :param recipe <dict>: recipe of file, as returned by FileStorageClient.get
+        :param cache_blocks <int>: number of blocks to keep in memory
+        """
+        super().__init__()
+        self._bs = filestorage.blockstorage
+        self._blockchain = recipe["blockchain"]
+        self._packed = recipe.get("packed", {})  # locations of packed blocks
+        self._offsets = block_offsets(recipe)
+        self._size = recipe["size"]
+        self._max_blocksize = max((end - start for start, end in zip(self._offsets, self._offsets[1:])), default=1)
+        self._position = 0
+        self._cache_blocks = max(cache_blocks, 1)
+        self._blocks = OrderedDict()  # index -> data of last used blocks
+        self.name = recipe["checksum"]
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        self._checkClosed()
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self._position = position
+        return position
+
+    def _fetch(self, indexes: list) -> None:
+        """download missing blocks of indexes in parallel and cache them"""
+        missing = [index for index in indexes if index not in self._blocks]
+        futures = []
+        for index in missing:
+            checksum = self._blockchain[index]
+            futures.append(self._bs.executor.submit(self._bs.get, checksum, location=self._packed.get(checksum)))
+        for index, future in zip(missing, futures):
+            data = future.result()
+            expected = self._offsets[index + 1] - self._offsets[index]
+            if len(data) != expected:
+                raise IOError(f"block {self._blockchain[index]} has {len(data)} bytes, {expected} expected")
+            self._blocks[index] = data
+        for index in indexes:
+            self._blocks.move_to_end(index)
+        while len(self._blocks) > max(self._cache_blocks, len(indexes)):
+            self._blocks.popitem(last=False)
+
+    def readinto(self, buffer) -> int:
+        """
+        read up to len(buffer) bytes at current position
+
+        all blocks covering the range are downloaded in parallel
+
+        :param buffer: writable bytes like object
+        :return <int>: number of bytes read, 0 at end of file
+        """
+        self._checkClosed()
+        view = memoryview(buffer).cast("B")
+        end = min(self._position + len(view), self._size)
+        if end <= self._position:
+            return 0
+        first = bisect.bisect_right(self._offsets, self._position) - 1
+        last = bisect.bisect_left(self._offsets, end) - 1
+        indexes = list(range(first, last + 1))
+        self._fetch(indexes)
+        written = 0
+        for index in indexes:
+            data = self._blocks[index]
+            start = self._position + written - self._offsets[index]
+            length = min(len(data) - start, end - self._position - written)
+            view[written:written + length] = data[start:start + length]
+            written += length
+        self._position += written
+        return written
+
+    def readall(self) -> bytes:
+        """read to end of file, block by block to not cache all of it"""
+        chunks = []
+        while True:
+            chunk = self.read(self._max_blocksize)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def close(self) -> None:
+        self._blocks.clear()
+        super().close()
@@ -22,11 +22,13 @@ class WebStorageArchiveClient(StorageClient):
     store and retrieve Data, specific for WebStorageArchives
     """
 
+    METRICS_NAME = "archive"
+
     def __init__(self, homepath=None, s3_backend="DEFAULT"):
         """__init__"""
         super().__init__(homepath=homepath, s3_backend=s3_backend)
         self._bucket_name = self._config["WEBSTORAGE_BUCKET_NAME"]
-        logger.debug("bucket list: %s", self._client.list_buckets())
+        self._check_bucket()
 
     @staticmethod
     def _gzip_str(data: str) -> bytes:
@@ -68,9 +70,9 @@ class WebStorageArchiveClient(StorageClient):
         result = {}
         for key in self._list_objects():  # get keys in bucket
             logger.debug(f"found key {key}")
-            response = self._client.head_object(
-                Bucket=self._bucket_name, Key=key
-            )  # TODO: exceptions
+            response = self.head(key)
+            if response is None:  # deleted since listed
+                continue
             size = response["ContentLength"]
             # if "Metadata" in response and response["Metadata"]:
             if response.get("Metadata"):
@@ -122,13 +124,7 @@ class WebStorageArchiveClient(StorageClient):
         :param filename <str>: filename of archive, will base64 encoded
         :return <dict>: metadata of archive
         """
-        b_buffer = BytesIO()
-        self._client.download_fileobj(
-            self._bucket_name, filename, b_buffer
-        )  # TODO: exceptions
-        b_buffer.seek(0)  # do not forget this tiny little line !!
-        gzip_data = b_buffer.read()
-        data = self._gunzip_bytes(gzip_data)
+        data = self._gunzip_bytes(self._get_object(filename))
         return json.loads(data)
 
     def save(self, data: dict) -> None:
@@ -145,27 +141,22 @@ class WebStorageArchiveClient(StorageClient):
         data["checksum"] = sha256.hexdigest()
         logger.info(f"checksum of archive {data['checksum']}")
         # store
-        extra_args = {
-            "Metadata": {
-                "hostname": data["hostname"],
-                "tag": data["tag"],
-                "datetime": data["datetime"],
-            }
+        metadata = {
+            "hostname": data["hostname"],
+            "tag": data["tag"],
+            "datetime": data["datetime"],
         }
         key = self.get_key(data)  # building key sortable
         f_object = self._gzip_str(json.dumps(data))
         logger.info(f"storing wstar as {key}")
-        self._client.upload_fileobj(
-            f_object, self._bucket_name, key, ExtraArgs=extra_args
-        )
+        self._put_object(key, f_object.getvalue(), metadata)
 
     def delete(self, key: str) -> None:
         """
         delete some key in bucket, basic S3 function
         """
         logger.info(f"deleting key {key}")
-        res = self._client.delete_object(Bucket=self._bucket_name, Key=key)
-        logger.info(f"result: {res}")
+        self._backend.delete(self._bucket_name, key)
 
     def convert_keyname(self) -> None:
         """
@@ -189,9 +180,9 @@ class WebStorageArchiveClient(StorageClient):
         backupsets without Metadata where made by version 1.2 and earlier
         """
         for key in self._list_objects():  # get keys in bucket
-            response = self._client.head_object(
-                Bucket=self._bucket_name, Key=key
-            )  # TODO: exceptions
+            response = self.head(key)
+            if response is None:  # deleted since listed
+                continue
             if not response.get("Metadata"):
                 logger.error(f"converting adding Metadata to key {key}")
                 data = self.read(key)